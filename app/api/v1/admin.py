@@ -8,9 +8,12 @@ from app.core.database import get_master_db_pool
 from app.services.provisioning import TenantProvisioningService
 from app.services.subscription import SubscriptionStateMachine
 from app.services.payment import PaymentService
+from app.services.jobs import JobQueue
+from app.services.tenant_stats import TenantStatusCounters, announce_tenant_change
 from app.models.tenant import TenantCreate, TenantResponse, TenantUpdate
 from app.models.payment import PaymentRecordRequest, SubscriptionExtensionRequest
 from app.api.v1.deps import get_current_admin
+import base64
 import json
 
 router = APIRouter()
@@ -19,6 +22,21 @@ router = APIRouter()
 # TENANT MANAGEMENT ENDPOINTS
 # ============================================================================
 
+def _encode_cursor(sort_value, tenant_id) -> str:
+    value = sort_value.isoformat() if isinstance(sort_value, datetime) else sort_value
+    return base64.urlsafe_b64encode(json.dumps([value, str(tenant_id)]).encode()).decode()
+
+
+def _decode_cursor(cursor: str, sort_by: str) -> tuple:
+    try:
+        value, tenant_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if sort_by != "name":
+            value = datetime.fromisoformat(value)
+        return value, UUID(tenant_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("/tenants", response_model=dict)
 async def list_tenants(
     page: int = Query(1, ge=1),
@@ -26,38 +44,48 @@ async def list_tenants(
     status: Optional[str] = None,
     search: Optional[str] = None,
     sort_by: str = Query("created_at", regex="^(created_at|name|subscription_expiry)$"),
+    cursor: Optional[str] = None,
     pool: asyncpg.Pool = Depends(get_master_db_pool)
 ):
     """
     List all tenants with pagination, filtering, and sorting.
+    Pass the returned `next_cursor` as `cursor` to fetch the next page in constant
+    time (keyset on sort column + tenant_id); `page` still works but uses OFFSET.
+    The two modes are exclusive: `cursor` cannot be combined with `page` > 1, and
+    cursor pages report no `page`/`pages` and omit `total` for a search.
+    Stats and unfiltered totals come from cached per-status counters.
     """
-    offset = (page - 1) * per_page
-    
+    if cursor and page > 1:
+        raise HTTPException(status_code=400, detail="Use either page or cursor, not both")
+
     # Build query
     where_clauses = []
     params = []
-    param_count = 1
     
     if status:
-        where_clauses.append(f"status = ${param_count}")
         params.append(status)
-        param_count += 1
+        where_clauses.append(f"status = ${len(params)}")
     
     if search:
-        where_clauses.append(f"(name ILIKE ${param_count} OR contact_email ILIKE ${param_count})")
-        params.append(f"%{search}%")
-        param_count += 1
+        # Trigram indexes serve the substring match; escape LIKE wildcards in the term
+        term = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params.append(f"%{term}%")
+        where_clauses.append(f"(name ILIKE ${len(params)} OR contact_email ILIKE ${len(params)})")
     
+    filter_params = list(params)
+    filter_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+
+    if cursor:
+        params.extend(_decode_cursor(cursor, sort_by))
+        where_clauses.append(f"({sort_by}, tenant_id) < (${len(params) - 1}, ${len(params)})")
+        offset = 0
+    else:
+        offset = (page - 1) * per_page
     where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
     
+    counts = await TenantStatusCounters.get(pool)
     async with pool.acquire() as conn:
-        # Get total count
-        total = await conn.fetchval(
-            f"SELECT COUNT(*) FROM tenants {where_sql}",
-            *params
-        )
-        
-        # Get paginated results
+        # One extra row tells us whether there is a next page
         rows = await conn.fetch(
             f"""
             SELECT 
@@ -66,33 +94,40 @@ async def list_tenants(
                 EXTRACT(DAY FROM (subscription_expiry - NOW())) AS days_remaining
             FROM tenants
             {where_sql}
-            ORDER BY {sort_by} DESC
-            LIMIT ${param_count} OFFSET ${param_count + 1}
+            ORDER BY {sort_by} DESC, tenant_id DESC
+            LIMIT ${len(params) + 1} OFFSET ${len(params) + 2}
             """,
-            *params, per_page, offset
+            *params, per_page + 1, offset
         )
         
-        # Get aggregate stats
-        stats = await conn.fetchrow(
-            """
-            SELECT 
-                COUNT(*) FILTER (WHERE status = 'active') AS total_active,
-                COUNT(*) FILTER (WHERE status = 'trial') AS total_trial,
-                COUNT(*) FILTER (WHERE status = 'locked') AS total_locked,
-                COUNT(*) FILTER (WHERE status = 'grace') AS total_grace
-            FROM tenants
-            """
-        )
+        if not search:
+            total = counts.get(status, 0) if status else sum(counts.values())
+        elif not cursor:
+            total = await conn.fetchval(f"SELECT COUNT(*) FROM tenants {filter_sql}", *filter_params)
+        else:
+            # Follow-up keyset pages do not recount a search
+            total = None
     
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    pagination = {
+        "per_page": per_page,
+        "next_cursor": _encode_cursor(rows[-1][sort_by], rows[-1]["tenant_id"]) if has_more else None
+    }
+    if total is not None:
+        pagination["total"] = total
+    if not cursor:
+        pagination["page"] = page
+        pagination["pages"] = (total + per_page - 1) // per_page
     return {
         "tenants": [dict(row) for row in rows],
-        "pagination": {
-            "page": page,
-            "per_page": per_page,
-            "total": total,
-            "pages": (total + per_page - 1) // per_page
-        },
-        "stats": dict(stats)
+        "pagination": pagination,
+        "stats": {
+            "total_active": counts["active"],
+            "total_trial": counts["trial"],
+            "total_locked": counts["locked"],
+            "total_grace": counts["grace"]
+        }
     }
 
 @router.get("/tenants/{tenant_id}", response_model=dict)
@@ -154,7 +189,9 @@ async def create_tenant(
         tenant_data.supabase_url_raw = 'shared_database'
     
     provisioning_service = TenantProvisioningService(pool)
-    return await provisioning_service.provision_tenant(tenant_data, admin_id, auto_create_db)
+    tenant = await provisioning_service.provision_tenant(tenant_data, admin_id, auto_create_db)
+    TenantStatusCounters.invalidate()
+    return tenant
 
 @router.put("/tenants/{tenant_id}/extend", response_model=dict)
 async def extend_subscription(
@@ -192,14 +229,17 @@ async def change_tenant_status(
     if action == "suspend":
         if not reason:
             raise HTTPException(status_code=400, detail="Reason required for suspension")
-        return await state_machine.suspend_tenant(tenant_id, admin_id, reason)
+        result = await state_machine.suspend_tenant(tenant_id, admin_id, reason)
     
     elif action == "churn":
-        return await state_machine.churn_tenant(tenant_id, admin_id, reason)
+        result = await state_machine.churn_tenant(tenant_id, admin_id, reason)
     
     else:
         raise HTTPException(status_code=400, detail=f"Action {action} not implemented")
 
+    await announce_tenant_change(pool, [tenant_id])
+    return result
+
 @router.put("/tenants/{tenant_id}/activate", response_model=dict)
 async def activate_tenant(
     tenant_id: UUID,
@@ -212,9 +252,11 @@ async def activate_tenant(
     Activate a trial tenant manually.
     """
     state_machine = SubscriptionStateMachine(pool)
-    return await state_machine.transition_to_active(
+    result = await state_machine.transition_to_active(
         tenant_id, admin_id, payment_ref, notes
     )
+    await announce_tenant_change(pool, [tenant_id])
+    return result
 
 @router.patch("/tenants/{tenant_id}", response_model=TenantResponse)
 async def update_tenant(
@@ -338,30 +380,63 @@ async def get_usage_analytics(
 async def bulk_extend_subscriptions(
     tenant_ids: List[UUID],
     extension_days: int,
+    background: bool = False,
     admin_id: UUID = Depends(get_current_admin),
     pool: asyncpg.Pool = Depends(get_master_db_pool)
 ):
     """
-    Bulk extend subscriptions for multiple tenants.
+    Bulk extend subscriptions for multiple tenants, in one transaction.
+    Tenants that cannot be extended are reported under "failed".
+    With ?background=true the extension runs as a job; poll /admin/jobs/{job_id}.
     """
+    if extension_days <= 0:
+        raise HTTPException(status_code=400, detail="extension_days must be positive")
+    if background:
+        return await JobQueue.enqueue(
+            pool, "admin.bulk_extend",
+            {"tenant_ids": [str(t) for t in tenant_ids], "extension_days": extension_days},
+            created_by=admin_id, max_attempts=1
+        )
+
     state_machine = SubscriptionStateMachine(pool)
-    results = {"success": [], "failed": []}
-    
-    for tenant_id in tenant_ids:
-        try:
-            await state_machine.extend_subscription(
-                tenant_id,
-                admin_id,
-                extension_days,
-                f"BULK_EXTEND_{datetime.now().isoformat()}",
-                0.0,  # Amount not tracked for bulk operations
-                "Bulk extension"
-            )
-            results["success"].append(str(tenant_id))
-        except Exception as e:
-            results["failed"].append({"tenant_id": str(tenant_id), "error": str(e)})
-    
-    return results
+    return await state_machine.bulk_extend_subscriptions(
+        tenant_ids,
+        admin_id,
+        extension_days,
+        f"BULK_EXTEND_{datetime.now().isoformat()}",
+        0.0,  # Amount not tracked for bulk operations
+        "Bulk extension"
+    )
+
+
+@router.get("/jobs", response_model=dict)
+async def list_admin_jobs(
+    status: Optional[str] = None,
+    tenant_id: Optional[UUID] = None,
+    limit: int = Query(50, ge=1, le=200),
+    admin_id: UUID = Depends(get_current_admin),
+    pool: asyncpg.Pool = Depends(get_master_db_pool)
+):
+    """
+    Background jobs: platform jobs (bulk extensions) by default, or one school's with tenant_id.
+    """
+    return {"jobs": await JobQueue.list_jobs(pool, tenant_id, status, limit)}
+
+
+@router.get("/jobs/{job_id}", response_model=dict)
+async def get_admin_job(
+    job_id: UUID,
+    tenant_id: Optional[UUID] = None,
+    admin_id: UUID = Depends(get_current_admin),
+    pool: asyncpg.Pool = Depends(get_master_db_pool)
+):
+    """Status, progress and result of a background job."""
+    job = await JobQueue.get(pool, job_id, tenant_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 @router.get("/settings", response_model=dict)
 async def get_system_settings(
     admin_id: UUID = Depends(get_current_admin)
@@ -1,36 +1,47 @@
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, status
-from typing import Optional
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Query, status
+from typing import List, Optional
 from uuid import UUID
+import asyncio
 import asyncpg
-import json
 
 from app.api.v1.deps import get_current_school_user, get_tenant_db_pool
-from app.services.face_service import FaceService
+from app.core.config import settings
+from app.services.face_service import FaceService, FaceServiceBusy
+from app.services.face_index import FaceIndexRegistry, migrate_legacy_encodings, save_encoding
 
 router = APIRouter()
 
-async def ensure_face_column(conn, table_name: str):
-    """Lazy migration to add face_encoding column if not exists."""
-    try:
-        await conn.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS face_encoding JSONB")
-    except Exception as e:
-        print(f"Migration warning: {e}")
+
+async def _read_image(file: UploadFile) -> bytes:
+    """Read an uploaded image, rejecting it (413) once it passes UPLOAD_MAX_MB."""
+    max_bytes = settings.UPLOAD_MAX_MB * 1024 * 1024
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"{file.filename} exceeds {settings.UPLOAD_MAX_MB} MB")
+    data = await file.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"{file.filename} exceeds {settings.UPLOAD_MAX_MB} MB")
+    return data
 
 @router.post("/enroll")
 async def enroll_face(
     user_id: UUID = Form(...),
     user_type: str = Form(..., regex="^(student|staff)$"),
     file: UploadFile = File(...),
+    force: bool = Form(False),
     current_user: dict = Depends(get_current_school_user),
     pool: asyncpg.Pool = Depends(get_tenant_db_pool)
 ):
     """
     Enroll a face for a student or staff member.
-    Extracts 128-d facial encoding and stores it in the database.
+    Extracts 128-d facial encoding and stores it in the face_encodings table.
+    A face already enrolled under someone else is rejected (409) unless
+    `force` is set, in which case it is enrolled and flagged in the response.
     """
     # 1. Detect Face
     try:
-        encoding = FaceService.get_encoding(file.file)
+        encoding = await FaceService.encode_upload(await _read_image(file), current_user["tenant_id"])
+    except FaceServiceBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except ImportError:
         raise HTTPException(status_code=503, detail="Face recognition service is unavailable (library not installed)")
     
@@ -40,25 +51,40 @@ async def enroll_face(
             detail="No face detected in the image. Please upload a clear photo."
         )
 
-    # 2. Update Database
+    # 2. Duplicate check against everyone already enrolled (one vectorized lookup)
+    index = await FaceIndexRegistry.get(current_user["tenant_id"], pool)
+    duplicates = index.duplicates(encoding, settings.FACE_DUPLICATE_THRESHOLD, exclude=user_id)
+    if duplicates and not force:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "message": "This face is already enrolled under another person",
+                "duplicates": duplicates
+            }
+        )
+
+    # 3. Update Database
     table_name = "students" if user_type == "student" else "staff"
     id_column = "student_id" if user_type == "student" else "staff_id"
     
     async with pool.acquire() as conn:
-        await ensure_face_column(conn, table_name)
-        
         # Check if user exists
-        exists = await conn.fetchval(f"SELECT 1 FROM {table_name} WHERE {id_column} = $1", user_id)
-        if not exists:
+        person = await conn.fetchrow(f"SELECT full_name, status FROM {table_name} WHERE {id_column} = $1", user_id)
+        if not person:
             raise HTTPException(status_code=404, detail=f"{user_type.capitalize()} not found")
         
-        # Update encoding (store as JSON string or jsonb)
-        await conn.execute(
-            f"UPDATE {table_name} SET face_encoding = $1 WHERE {id_column} = $2",
-            json.dumps(encoding), user_id
-        )
+        # Store as a 512-byte float32 blob in face_encodings
+        await save_encoding(conn, user_id, user_type, encoding)
+
+        # Keep the in-memory gallery in sync (other processes reload)
+        index = await FaceIndexRegistry.changed(current_user["tenant_id"], conn)
+    if index is not None and person["status"] == "active":
+        index.upsert(user_id, user_type, person["full_name"], encoding)
 
-    return {"status": "success", "message": "Face enrollment successful"}
+    response = {"status": "success", "message": "Face enrollment successful"}
+    if duplicates:
+        response["possible_duplicates"] = duplicates
+    return response
 
 @router.post("/identify")
 async def identify_user(
@@ -73,56 +99,113 @@ async def identify_user(
     """
     # 1. Get embedding from uploaded image
     try:
-        unknown_encoding = FaceService.get_encoding(file.file)
+        unknown_encoding = await FaceService.encode_upload(await _read_image(file), current_user["tenant_id"])
+    except FaceServiceBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except ImportError:
         raise HTTPException(status_code=503, detail="Face recognition service is unavailable")
 
     if not unknown_encoding:
         raise HTTPException(status_code=400, detail="No face detected in submitted image")
 
-    async with pool.acquire() as conn:
-        candidates = []
-        
-        # Determine who to fetch
-        fetch_students = role in ["student", "all"]
-        fetch_staff = role in ["staff", "all"]
-        
-        if fetch_students:
-            await ensure_face_column(conn, "students")
-            rows = await conn.fetch("SELECT student_id as id, full_name, face_encoding FROM students WHERE status='active' AND face_encoding IS NOT NULL")
-            for r in rows:
-                candidates.append({
-                    "id": r["id"], 
-                    "name": r["full_name"], 
-                    "type": "student", 
-                    "encoding": json.loads(r["face_encoding"])
-                })
-                
-        if fetch_staff:
-            await ensure_face_column(conn, "staff")
-            rows = await conn.fetch("SELECT staff_id as id, full_name, face_encoding FROM staff WHERE status='active' AND face_encoding IS NOT NULL")
-            for r in rows:
-                candidates.append({
-                    "id": r["id"], 
-                    "name": r["full_name"], 
-                    "type": "staff", 
-                    "encoding": json.loads(r["face_encoding"])
-                })
-        
-        if not candidates:
-            raise HTTPException(status_code=404, detail="No enrolled users found for matching")
-            
-        # 2. Compare (Brute force acceptable for <1000 users)
-        known_encodings = [c["encoding"] for c in candidates]
-        match_index = FaceService.compare_faces(known_encodings, unknown_encoding)
-        
-        if match_index is not None:
-            match = candidates[match_index]
-            return {
-                "match": True,
-                "user_id": str(match["id"]),
-                "name": match["name"],
-                "user_type": match["type"]
-            }
+    # 2. Match against the tenant's in-memory gallery (loaded once, float32 matrix)
+    index = await FaceIndexRegistry.get(current_user["tenant_id"], pool)
+    if not len(index):
+        raise HTTPException(status_code=404, detail="No enrolled users found for matching")
+
+    person_types = ["student", "staff"] if role == "all" else [role]
+    match = index.search(unknown_encoding, tolerance=0.5, person_types=person_types)
+
+    if match is not None:
+        return {
+            "match": True,
+            "user_id": match["user_id"],
+            "name": match["name"],
+            "user_type": match["user_type"]
+        }
             
     return {"match": False, "detail": "User not recognized"}
+
+MAX_BATCH_IMAGES = 20
+MAX_DUPLICATE_PAIRS = 500
+
+@router.post("/identify/batch")
+async def identify_batch(
+    files: List[UploadFile] = File(...),
+    role: str = Form("student", regex="^(student|staff|all)$"),
+    current_user: dict = Depends(get_current_school_user),
+    pool: asyncpg.Pool = Depends(get_tenant_db_pool)
+):
+    """
+    Identify everyone in several images or one group/classroom photo.
+    All faces are extracted in one worker call and matched in one pass;
+    each person is reported at most once (their closest face).
+    """
+    if len(files) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IMAGES} images per request")
+
+    images = [await _read_image(f) for f in files]
+    try:
+        detected = await FaceService.extract_batch(images, current_user["tenant_id"])
+    except FaceServiceBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ImportError:
+        raise HTTPException(status_code=503, detail="Face recognition service is unavailable")
+
+    faces = [(image_index, face) for image_index, image_faces in enumerate(detected) for face in image_faces]
+    if not faces:
+        raise HTTPException(status_code=400, detail="No face detected in submitted images")
+
+    index = await FaceIndexRegistry.get(current_user["tenant_id"], pool)
+    if not len(index):
+        raise HTTPException(status_code=404, detail="No enrolled users found for matching")
+
+    person_types = ["student", "staff"] if role == "all" else [role]
+    matches = index.search_many([face["encoding"] for _, face in faces], tolerance=0.5, person_types=person_types)
+
+    identified, unrecognized = [], []
+    for (image_index, face), match in zip(faces, matches):
+        if match is None:
+            unrecognized.append({"image_index": image_index, "box": face["box"]})
+        else:
+            identified.append({
+                "user_id": match["user_id"],
+                "name": match["name"],
+                "user_type": match["user_type"],
+                "distance": round(match["distance"], 4),
+                "image_index": image_index,
+                "box": face["box"]
+            })
+
+    return {
+        "faces_detected": len(faces),
+        "identified": identified,
+        "unrecognized": unrecognized
+    }
+
+@router.get("/duplicates")
+async def list_duplicate_faces(
+    threshold: Optional[float] = Query(None, gt=0, le=settings.FACE_DUPLICATE_THRESHOLD),
+    limit: int = Query(100, ge=1, le=MAX_DUPLICATE_PAIRS),
+    current_user: dict = Depends(get_current_school_user),
+    pool: asyncpg.Pool = Depends(get_tenant_db_pool)
+):
+    """Report the closest pairs of enrolled people whose faces are near-identical."""
+    threshold = threshold if threshold is not None else settings.FACE_DUPLICATE_THRESHOLD
+    index = await FaceIndexRegistry.get(current_user["tenant_id"], pool)
+    # O(n^2) distance blocks: off the event loop
+    pairs = await asyncio.to_thread(index.duplicate_pairs, threshold, limit)
+    return {"enrolled": len(index), "threshold": threshold, "pairs": pairs, "truncated": len(pairs) >= limit}
+
+@router.post("/system/init")
+async def init_biometrics_tables(
+    current_user: dict = Depends(get_current_school_user),
+    pool: asyncpg.Pool = Depends(get_tenant_db_pool)
+):
+    """Create face_encodings and move legacy JSON encodings into it."""
+    async with pool.acquire() as conn:
+        moved = await migrate_legacy_encodings(conn)
+
+        # Reload from the binary table on next identify
+        await FaceIndexRegistry.invalidate(current_user["tenant_id"], conn)
+    return {"message": "Biometrics tables initialized", "migrated": moved}
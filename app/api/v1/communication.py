@@ -8,7 +8,13 @@ from uuid import UUID
 from datetime import datetime
 from pydantic import BaseModel, Field
 import asyncpg
-from app.api.v1.deps import get_current_school_user, get_tenant_db_pool
+import logging
+from app.api.v1.deps import get_current_school_user, get_tenant_db_pool, get_master_db_pool
+from app.services.jobs import JobQueue
+from app.services.email_templates import get_email_template
+from app.services.mail_dispatcher import MailDispatcher
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -40,6 +46,19 @@ class EmailSend(BaseModel):
     subject: str
     body: str
 
+class EmailBulkSend(BaseModel):
+    to_emails: List[str] = Field(..., min_items=1, max_items=10000)
+    subject: str
+    body: str
+
+# Announcement audience -> recipient emails in the tenant DB. Students carry a
+# single contact email (no separate guardian column), so parents share it.
+AUDIENCE_EMAIL_QUERIES = {
+    "parent": "SELECT email FROM students WHERE status = 'active' AND email IS NOT NULL",
+    "student": "SELECT email FROM students WHERE status = 'active' AND email IS NOT NULL",
+    "teacher": "SELECT email FROM staff WHERE status = 'active' AND email IS NOT NULL",
+}
+
 # --- Endpoints ---
 
 @router.post("/chat/send")
@@ -127,15 +146,39 @@ async def send_email_api(
     email: EmailSend,
     current_user: dict = Depends(get_current_school_user)
 ):
-    # Mock Email Service
-    # In real app, import aiosmtplib or use SendGrid/AWS SES
-    print(f"--- EMAIL SENT ---")
-    print(f"To: {email.to_email}")
-    print(f"Subject: {email.subject}")
-    print(f"Body: {email.body}")
-    print(f"------------------")
+    """Queue an email; it is delivered in the background over pooled SMTP sessions."""
+    MailDispatcher.enqueue(
+        email.to_email, email.subject, get_email_template(email.subject, email.body),
+        tenant_id=current_user["tenant_id"]
+    )
     return {"message": "Email queued successfully"}
 
+@router.post("/email/bulk")
+async def send_bulk_email_api(
+    email: EmailBulkSend,
+    track: bool = False,
+    current_user: dict = Depends(get_current_school_user),
+    master_pool: asyncpg.Pool = Depends(get_master_db_pool)
+):
+    """
+    Queue one email per recipient (reminders, notices). Returns immediately.
+    With ?track=true the send runs as a job whose progress and sent/failed
+    counts are available from /jobs/{job_id}.
+    """
+    recipients = list(dict.fromkeys(e.strip().lower() for e in email.to_emails if e.strip()))
+    if track:
+        job = await JobQueue.enqueue(
+            master_pool, "email.bulk",
+            {"recipients": recipients, "subject": email.subject, "html": get_email_template(email.subject, email.body)},
+            tenant_id=current_user["tenant_id"], created_by=current_user["user_id"], max_attempts=1
+        )
+        return {"message": "Emails queued successfully", "queued": len(recipients), **job}
+    queued = MailDispatcher.enqueue_many(
+        recipients, email.subject, get_email_template(email.subject, email.body),
+        tenant_id=current_user["tenant_id"]
+    )
+    return {"message": "Emails queued successfully", "queued": queued}
+
 @router.post("/system/init")
 async def init_communication_tables(
     pool: asyncpg.Pool = Depends(get_tenant_db_pool)
@@ -222,8 +265,30 @@ async def create_announcement(
             VALUES ($1, $2, $3, $4, $5, $6, $7)
             RETURNING *
         """, data.title, data.content, data.target_audiences, data.send_email, data.send_sms, data.is_urgent, current_user['user_id'])
-        
-        return dict(row)
+
+        result = dict(row)
+        if data.send_email:
+            # The announcement is already saved: a mailing problem must not turn into a 500
+            audiences = AUDIENCE_EMAIL_QUERIES.keys() if "all" in data.target_audiences else \
+                [a for a in data.target_audiences if a in AUDIENCE_EMAIL_QUERIES]
+            recipients = set()
+            for query in {AUDIENCE_EMAIL_QUERIES[a] for a in audiences}:
+                try:
+                    recipients.update(r[0].strip().lower() for r in await conn.fetch(query) if r[0].strip())
+                except (asyncpg.UndefinedTableError, asyncpg.UndefinedColumnError):
+                    continue
+                except Exception as e:
+                    logger.error(f"Could not load announcement recipients: {e}")
+            try:
+                result["emails_queued"] = MailDispatcher.enqueue_many(
+                    sorted(recipients), data.title, get_email_template(data.title, data.content),
+                    tenant_id=current_user["tenant_id"]
+                )
+            except Exception as e:
+                logger.error(f"Could not queue announcement emails: {e}")
+                result["emails_queued"] = 0
+
+        return result
 
 @router.delete("/announcements/{ann_id}")
 async def delete_announcement(
@@ -2,13 +2,19 @@
 Examination Management API
 Protocol Phase 4 Compliant
 """
-from fastapi import APIRouter, Depends, HTTPException, Body, Query
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, UploadFile, File, Form
 from typing import List, Optional
 from datetime import date
 from uuid import UUID
 from pydantic import BaseModel, Field, validator
 import asyncpg
+import csv
+import io
+import math
+from decimal import Decimal
 from app.api.v1.deps import get_current_school_user, get_tenant_db_pool
+from app.services.exam_totals import EXAM_TOTALS_DDL, PAPER_CLASS_MATCH, refresh_class_totals, refresh_exam_totals
+from app.services.exam_analytics import invalidate_exam_analytics
 
 router = APIRouter()
 
@@ -50,6 +56,82 @@ class ResultCardItem(BaseModel):
     grade: str
     status: str # Pass/Fail
 
+# --- Helpers ---
+def validate_mark_entries(entries: List[MarkEntry], max_marks: float) -> List[dict]:
+    """Validate a whole marks payload in one pass, collecting every error."""
+    errors = []
+    seen = set()
+    for index, entry in enumerate(entries):
+        if entry.student_id in seen:
+            errors.append({"row": index, "student_id": str(entry.student_id), "error": "Duplicate entry for student"})
+        seen.add(entry.student_id)
+        if entry.marks_obtained > max_marks:
+            errors.append({
+                "row": index,
+                "student_id": str(entry.student_id),
+                "error": f"Marks {entry.marks_obtained} exceed max {max_marks}"
+            })
+    return errors
+
+def parse_marks_sheet(content: bytes, papers) -> tuple:
+    """
+    Parse a marks spreadsheet (CSV) with an `admission_number` column followed
+    by one column per paper, headed by subject name or subject code.
+    Returns (records, errors) where records are (admission_number, paper_id, marks).
+    """
+    columns = {}
+    for paper in papers:
+        for key in (paper['subject_name'], paper['subject_code'], str(paper['paper_id'])):
+            if key:
+                columns[key.strip().lower()] = paper
+
+    reader = csv.reader(io.StringIO(content.decode("utf-8-sig")))
+    header = next(reader, None)
+    if not header or header[0].strip().lower() != "admission_number":
+        return [], [{"row": 1, "error": "First column must be admission_number"}]
+
+    errors = []
+    sheet_papers = []
+    for name in header[1:]:
+        paper = columns.get(name.strip().lower())
+        if not paper:
+            errors.append({"row": 1, "column": name, "error": "No paper for this subject in the exam/class"})
+        sheet_papers.append(paper)
+
+    records = []
+    seen = set()
+    for line_no, row in enumerate(reader, start=2):
+        if not row or not row[0].strip():
+            continue
+        admission_number = row[0].strip()
+        if admission_number in seen:
+            errors.append({"row": line_no, "admission_number": admission_number, "error": "Duplicate admission number"})
+            continue
+        seen.add(admission_number)
+
+        for paper, cell in zip(sheet_papers, row[1:]):
+            cell = cell.strip()
+            if paper is None or not cell:
+                continue
+            try:
+                marks = float(cell)
+                if not math.isfinite(marks):
+                    raise ValueError(cell)
+            except ValueError:
+                errors.append({"row": line_no, "admission_number": admission_number, "column": paper['subject_name'], "error": f"Invalid marks '{cell}'"})
+                continue
+            if marks < 0 or marks > float(paper['total_marks']):
+                errors.append({
+                    "row": line_no,
+                    "admission_number": admission_number,
+                    "column": paper['subject_name'],
+                    "error": f"Marks {marks} outside 0-{float(paper['total_marks'])}"
+                })
+                continue
+            records.append((admission_number, paper['paper_id'], Decimal(cell)))
+
+    return records, errors
+
 # --- DB Init (Phase 2) ---
 @router.post("/system/init")
 async def init_exam_tables(
@@ -101,6 +183,9 @@ async def init_exam_tables(
             );
             CREATE INDEX IF NOT EXISTS idx_res_student ON exam_results(student_id);
         """)
+
+        # 4. Materialized per-student totals and ranks (refreshed on mark entry)
+        await conn.execute(EXAM_TOTALS_DDL)
         return {"message": "Exam tables initialized"}
 
 # --- Endpoints (Phase 4) ---
@@ -167,11 +252,15 @@ async def create_paper(
 ):
     async with pool.acquire() as conn:
         try:
-            row = await conn.fetchrow("""
-                INSERT INTO exam_papers (exam_id, class_id, subject_id, date, total_marks, passing_marks)
-                VALUES ($1, $2, $3, $4, $5, $6)
-                RETURNING paper_id
-            """, paper.exam_id, paper.class_id, paper.subject_id, paper.date, paper.total_marks, paper.passing_marks)
+            async with conn.transaction():
+                row = await conn.fetchrow("""
+                    INSERT INTO exam_papers (exam_id, class_id, subject_id, date, total_marks, passing_marks)
+                    VALUES ($1, $2, $3, $4, $5, $6)
+                    RETURNING paper_id
+                """, paper.exam_id, paper.class_id, paper.subject_id, paper.date, paper.total_marks, paper.passing_marks)
+                # A new paper changes the grand total (and fail count) of every marked student in the class
+                await refresh_class_totals(conn, paper.exam_id, paper.class_id)
+            invalidate_exam_analytics(current_user['tenant_id'], paper.exam_id)
             return {"success": True, "paper_id": str(row['paper_id'])}
         except asyncpg.UniqueViolationError:
             raise HTTPException(status_code=409, detail="Paper for this subject and class already exists in this exam")
@@ -229,22 +318,113 @@ async def submit_marks(
 ):
     async with pool.acquire() as conn:
         # Check Max Marks
-        paper = await conn.fetchrow("SELECT total_marks FROM exam_papers WHERE paper_id = $1", data.paper_id)
+        paper = await conn.fetchrow("SELECT exam_id, total_marks FROM exam_papers WHERE paper_id = $1", data.paper_id)
         if not paper:
             raise HTTPException(404, "Paper not found")
         
         max_marks = float(paper['total_marks'])
+
+        errors = validate_mark_entries(data.entries, max_marks)
+        if errors:
+            raise HTTPException(400, {"message": f"{len(errors)} invalid entries", "errors": errors})
         
         async with conn.transaction():
-            for entry in data.entries:
-                if entry.marks_obtained > max_marks:
-                     raise HTTPException(400, f"Marks {entry.marks_obtained} exceed max {max_marks} for student {entry.student_id}")
-                
-                await conn.execute("""
-                    INSERT INTO exam_results (paper_id, student_id, marks_obtained, remarks, marked_by)
-                    VALUES ($1, $2, $3, $4, $5)
-                    ON CONFLICT (paper_id, student_id)
-                    DO UPDATE SET marks_obtained = EXCLUDED.marks_obtained, remarks = EXCLUDED.remarks, marked_by = EXCLUDED.marked_by
-                """, data.paper_id, entry.student_id, entry.marks_obtained, entry.remarks, current_user['user_id'])
+            # Single array-based upsert for the whole sheet
+            await conn.execute("""
+                INSERT INTO exam_results (paper_id, student_id, marks_obtained, remarks, marked_by)
+                SELECT $1, e.student_id, e.marks_obtained, e.remarks, $5
+                FROM unnest($2::uuid[], $3::numeric[], $4::text[]) AS e(student_id, marks_obtained, remarks)
+                ON CONFLICT (paper_id, student_id)
+                DO UPDATE SET marks_obtained = EXCLUDED.marks_obtained, remarks = EXCLUDED.remarks, marked_by = EXCLUDED.marked_by
+            """, data.paper_id,
+                [e.student_id for e in data.entries],
+                [e.marks_obtained for e in data.entries],
+                [e.remarks for e in data.entries],
+                current_user['user_id'])
+
+            await refresh_exam_totals(conn, paper['exam_id'], [e.student_id for e in data.entries])
+
+        invalidate_exam_analytics(current_user['tenant_id'], paper['exam_id'])
                 
         return {"success": True, "count": len(data.entries)}
+
+@router.post("/{exam_id}/marks/import")
+async def import_marks_sheet(
+    exam_id: UUID,
+    class_id: UUID = Form(...),
+    file: UploadFile = File(...),
+    pool: asyncpg.Pool = Depends(get_tenant_db_pool),
+    current_user: dict = Depends(get_current_school_user)
+):
+    """
+    Import marks for several papers of a class from one CSV sheet:
+    admission_number, <subject 1>, <subject 2>, ...
+    The sheet is validated as a whole, then COPYed into a staging table and
+    upserted with a single statement.
+    """
+    content = await file.read()
+
+    async with pool.acquire() as conn:
+        papers = await conn.fetch("""
+            SELECT ep.paper_id, ep.total_marks, s.subject_name, s.subject_code
+            FROM exam_papers ep
+            JOIN subjects s ON ep.subject_id = s.subject_id
+            WHERE ep.exam_id = $1 AND ep.class_id = $2
+        """, exam_id, class_id)
+        if not papers:
+            raise HTTPException(404, "No papers defined for this exam and class")
+
+        try:
+            records, errors = parse_marks_sheet(content, papers)
+        except UnicodeDecodeError:
+            raise HTTPException(400, "Marks sheet must be a UTF-8 CSV file")
+        if errors:
+            raise HTTPException(400, {"message": f"{len(errors)} invalid cells", "errors": errors})
+        if not records:
+            raise HTTPException(400, "Marks sheet contains no marks")
+
+        async with conn.transaction():
+            await conn.execute("""
+                CREATE TEMP TABLE marks_import (
+                    admission_number VARCHAR(50),
+                    paper_id UUID,
+                    marks_obtained NUMERIC(5,2)
+                ) ON COMMIT DROP
+            """)
+            await conn.copy_records_to_table(
+                "marks_import",
+                records=records,
+                columns=["admission_number", "paper_id", "marks_obtained"]
+            )
+
+            # Admission numbers only resolve to students of the papers' class
+            unknown = await conn.fetch(f"""
+                SELECT DISTINCT mi.admission_number
+                FROM marks_import mi
+                LEFT JOIN (
+                    students s JOIN classes c ON c.class_id = $1 AND {PAPER_CLASS_MATCH}
+                ) ON s.admission_number = mi.admission_number
+                WHERE s.student_id IS NULL
+            """, class_id)
+            if unknown:
+                raise HTTPException(400, {
+                    "message": f"{len(unknown)} unknown admission numbers",
+                    "errors": [{"admission_number": r['admission_number'], "error": "Student not found in this class"} for r in unknown]
+                })
+
+            rows = await conn.fetch(f"""
+                INSERT INTO exam_results (paper_id, student_id, marks_obtained, marked_by)
+                SELECT mi.paper_id, s.student_id, mi.marks_obtained, $1
+                FROM marks_import mi
+                JOIN students s ON s.admission_number = mi.admission_number
+                JOIN classes c ON c.class_id = $2 AND {PAPER_CLASS_MATCH}
+                ON CONFLICT (paper_id, student_id)
+                DO UPDATE SET marks_obtained = EXCLUDED.marks_obtained, marked_by = EXCLUDED.marked_by
+                RETURNING student_id
+            """, current_user['user_id'], class_id)
+
+            await refresh_exam_totals(conn, exam_id, [r['student_id'] for r in rows])
+
+        invalidate_exam_analytics(current_user['tenant_id'], exam_id)
+
+        return {"success": True, "count": len(rows), "papers": len(papers)}
@@ -5,7 +5,8 @@ from datetime import date, datetime
 from pydantic import BaseModel
 import asyncpg
 
-from app.api.v1.deps import get_current_school_user, get_tenant_db_pool
+from app.api.v1.deps import get_current_school_user, get_tenant_db_pool, get_master_db_pool
+from app.services.jobs import JobQueue
 
 router = APIRouter()
 
@@ -178,62 +179,60 @@ async def assign_scholarship(
 
 # --- Invoice Generation ---
 
+MONTHLY_INVOICES_QUERY = """
+    WITH class_fees AS (
+        SELECT class_name, SUM(amount) AS fees
+        FROM class_fee_structure
+        WHERE frequency = 'monthly' AND ($3::text IS NULL OR class_name = $3::text)
+        GROUP BY class_name
+        HAVING SUM(amount) > 0
+    )
+    INSERT INTO fee_invoices
+    (student_id, month_year, total_amount, scholarship_amount, payable_amount, due_date)
+    SELECT s.student_id, $1, f.fees,
+           f.fees * COALESCE(sc.discount_percent, 0) / 100.0,
+           f.fees - f.fees * COALESCE(sc.discount_percent, 0) / 100.0,
+           $2
+    FROM students s
+    JOIN class_fees f ON f.class_name = s.current_class
+    LEFT JOIN student_scholarships sc ON sc.student_id = s.student_id
+    WHERE s.status = 'active'
+    ON CONFLICT (student_id, month_year) DO NOTHING
+"""
+
+async def insert_monthly_invoices(conn, month_year: str, due_date: date, class_name: Optional[str] = None) -> int:
+    """
+    Invoice every active student (optionally of one class) for the class's monthly fees,
+    less any scholarship. Students already invoiced for the month are skipped.
+    Returns the number of invoices created.
+    """
+    # Only 'monthly' fees are billed here
+    # TODO: Improve logic for one-time fees
+    result = await conn.execute(MONTHLY_INVOICES_QUERY, month_year, due_date, class_name)
+    return int(result.split()[-1])
+
 @router.post("/generate")
 async def generate_invoices(
     data: GenerateInvoices,
-    pool: asyncpg.Pool = Depends(get_tenant_db_pool)
+    background: bool = False,
+    current_user: dict = Depends(get_current_school_user),
+    pool: asyncpg.Pool = Depends(get_tenant_db_pool),
+    master_pool: asyncpg.Pool = Depends(get_master_db_pool)
 ):
     """
     Generate monthly invoices for students based on their class fees and scholarships.
+    With ?background=true the run is queued and a job id is returned; poll /jobs/{job_id}.
     """
+    if background:
+        job = await JobQueue.enqueue(
+            master_pool, "fees.generate_invoices", data.model_dump(),
+            tenant_id=current_user["tenant_id"], created_by=current_user["user_id"]
+        )
+        return {"message": "Invoice generation queued", **job}
+
     async with pool.acquire() as conn:
-        # Get target students
-        query = "SELECT student_id, current_class FROM students WHERE status = 'active'"
-        params = []
-        if data.class_name:
-            query += " AND current_class = $1"
-            params.append(data.class_name)
-            
-        students = await conn.fetch(query, *params)
-        
-        generated_count = 0
-        
-        for student in students:
-            stu_id = student['student_id']
-            cls = student['current_class']
-            
-            # 1. Calculate Base Fee for Class
-            # Only consider 'monthly' fees for this generation
-            # TODO: Improve logic for one-time fees
-            fees = await conn.fetchval("""
-                SELECT COALESCE(SUM(amount), 0) 
-                FROM class_fee_structure 
-                WHERE class_name = $1 AND frequency = 'monthly'
-            """, cls) or 0
-            
-            if fees <= 0: continue
-            
-            # 2. Get Scholarship
-            scholarship_pct = await conn.fetchval("""
-                SELECT discount_percent FROM student_scholarships WHERE student_id = $1
-            """, stu_id) or 0
-            
-            scholarship_amt = fees * (float(scholarship_pct) / 100.0)
-            payable = fees - scholarship_amt
-            
-            # 3. Create Invoice
-            try:
-                await conn.execute("""
-                    INSERT INTO fee_invoices 
-                    (student_id, month_year, total_amount, scholarship_amount, payable_amount, due_date)
-                    VALUES ($1, $2, $3, $4, $5, $6)
-                    ON CONFLICT (student_id, month_year) DO NOTHING 
-                """, stu_id, data.month_year, fees, scholarship_amt, payable, data.due_date)
-                generated_count += 1
-            except:
-                pass # Already exists or error
-                
-        return {"message": f"Generated {generated_count} invoices for {data.month_year}"}
+        generated_count = await insert_monthly_invoices(conn, data.month_year, data.due_date, data.class_name)
+    return {"message": f"Generated {generated_count} invoices for {data.month_year}"}
 
 class AssignAdHocFee(BaseModel):
     target_type: str # 'student' or 'class'
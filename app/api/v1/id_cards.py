@@ -3,11 +3,13 @@ ID Card API Endpoints
 RESTful API for ID card generation, restriction, and appeal management
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from typing import List, Optional
 from uuid import UUID
 import json
 import asyncpg
+import httpx
 
 from app.models.id_card import (
     IDCardResponse, IDCardStatusResponse, IDCardWithStudent, IDCardStats,
@@ -15,7 +17,11 @@ from app.models.id_card import (
     AppealReview, AppealStats, BulkIDCardGenerate, BulkIDCardResponse,
     IDCardStatus, AppealStatus
 )
-from app.services.id_card_service import IDCardService
+from app.services.id_card_service import IDCardService, install_id_card_counters
+from app.services.id_card_renderer import IDCardRenderer, RENDER_AVAILABLE
+from app.services.media_cache import media_cache, snap_thumbnail_size, IMAGING_AVAILABLE
+from app.services.template_catalog import TemplateCatalog, parse_template
+from app.services.jobs import JobQueue
 from app.api.v1.deps import get_tenant_db_pool, get_current_school_user
 
 
@@ -58,44 +64,8 @@ async def list_templates(
     pool: asyncpg.Pool = Depends(get_master_db_pool)
 ):
     """List all ID card templates for tenant"""
-    tenant_id = current_user["tenant_id"]
-    async with pool.acquire() as conn:
-        # Auto-migrate: Ensure columns exist to prevent 500 error
-        try:
-            await conn.execute("""
-                ALTER TABLE id_card_templates ADD COLUMN IF NOT EXISTS template_name VARCHAR(100) DEFAULT 'Unnamed Template';
-                ALTER TABLE id_card_templates ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT TRUE;
-                ALTER TABLE id_card_templates ADD COLUMN IF NOT EXISTS is_default BOOLEAN DEFAULT FALSE;
-                ALTER TABLE id_card_templates ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
-                ALTER TABLE id_card_templates ADD COLUMN IF NOT EXISTS front_bg_url TEXT;
-                ALTER TABLE id_card_templates ADD COLUMN IF NOT EXISTS back_bg_url TEXT;
-            """)
-        except Exception:
-            pass # Ignore if strict permissions prevent this, but usually Master DB pool has rights
-
-        rows = await conn.fetch("""
-            SELECT * FROM id_card_templates 
-            WHERE tenant_id = $1 AND is_active = TRUE
-            ORDER BY created_at DESC
-        """, tenant_id)
-        
-        results = []
-        for row in rows:
-            data = dict(row)
-            # Map field_positions (DB) to layout_json (Pydantic)
-            if 'field_positions' in data:
-                try:
-                    fp = data['field_positions']
-                    data['layout_json'] = json.loads(fp) if isinstance(fp, str) else fp
-                except:
-                    data['layout_json'] = {}
-            
-            # Map URLs
-            data['front_image_url'] = data.get('front_bg_url')
-            data['back_image_url'] = data.get('back_bg_url')
-            results.append(data)
-            
-        return results
+    # Columns are ensured at startup (app/db/repair.py); rows come from the per-tenant cache
+    return await TemplateCatalog.list_active(pool, current_user["tenant_id"])
 
 @router.post("/templates", response_model=TemplateResponse)
 async def create_template(
@@ -117,6 +87,7 @@ async def create_template(
             RETURNING *
         """, tenant_id, template.template_name, front_url, back_url, 
              json.dumps(template.layout_json), template.is_default, template.is_active)
+        TemplateCatalog.invalidate(tenant_id)
              
         data = dict(row)
         data['layout_json'] = template.layout_json # Use input valid json
@@ -139,6 +110,7 @@ async def delete_template(
         """, template_id, tenant_id)
         if result == "DELETE 0":
              raise HTTPException(status_code=404, detail="Template not found")
+        TemplateCatalog.invalidate(tenant_id)
         return {"message": "Template deleted"}
 
 @router.put("/templates/{template_id}", response_model=TemplateResponse)
@@ -169,18 +141,9 @@ async def update_template(
              WHERE template_id = $6 AND tenant_id = $7
              RETURNING *
         """, name, front_url, back_url, layout, active, template_id, tenant_id)
+        TemplateCatalog.invalidate(tenant_id)
         
-        data = dict(row)
-        if 'field_positions' in data:
-             try:
-                fp = data['field_positions']
-                data['layout_json'] = json.loads(fp) if isinstance(fp, str) else fp
-             except:
-                data['layout_json'] = {}
-        data['front_image_url'] = data.get('front_bg_url')
-        data['back_image_url'] = data.get('back_bg_url')
-        
-        return data
+        return parse_template(row)
 
 
 # ============================================================================
@@ -222,6 +185,115 @@ async def list_id_cards(
     )
 
 
+@router.get("/print/sheets")
+async def print_id_card_sheets(
+    class_name: Optional[str] = None,
+    section: Optional[str] = None,
+    student_ids: Optional[List[UUID]] = Query(None),
+    template_id: Optional[UUID] = None,
+    current_user=Depends(get_current_school_user),
+    pool: asyncpg.Pool = Depends(get_tenant_db_pool),
+    master_pool: asyncpg.Pool = Depends(get_master_db_pool)
+):
+    """
+    Render ID cards server-side as A4 print sheets (PDF, 9 cards per sheet,
+    fronts followed by mirrored backs for duplex). Streams page by page.
+    """
+    if not RENDER_AVAILABLE:
+        raise HTTPException(status_code=503, detail="ID card rendering is unavailable (Pillow/qrcode not installed)")
+    if not class_name and not student_ids:
+        raise HTTPException(status_code=400, detail="Provide class_name or student_ids")
+
+    tenant_id = current_user["tenant_id"]
+    template = await TemplateCatalog.get(master_pool, tenant_id, template_id)
+    if not template:
+        raise HTTPException(status_code=404, detail="No ID card template found")
+    async with master_pool.acquire() as conn:
+        school = await conn.fetchrow("SELECT name, logo_url FROM tenants WHERE tenant_id = $1", tenant_id)
+
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT s.student_id, s.full_name, s.admission_number, s.current_class, s.current_section,
+                   s.father_name, s.father_phone, s.photo_url, c.card_number
+            FROM students s
+            LEFT JOIN student_id_cards c ON c.student_id = s.student_id
+            WHERE s.status = 'active'
+              AND ($1::text IS NULL OR s.current_class = $1)
+              AND ($2::text IS NULL OR s.current_section = $2)
+              AND ($3::uuid[] IS NULL OR s.student_id = ANY($3::uuid[]))
+            ORDER BY s.current_class, s.current_section, s.full_name
+        """, class_name, section, student_ids)
+    if not rows:
+        raise HTTPException(status_code=404, detail="No students found")
+
+    cards = [
+        {
+            **{k: (str(v) if v is not None else None) for k, v in dict(r).items()},
+            "qr_value": str(r["student_id"]),
+        }
+        for r in rows
+    ]
+    filename = f"id-cards-{class_name or 'selection'}{'-' + section if section else ''}.pdf"
+    return StreamingResponse(
+        IDCardRenderer.stream_pdf(template, dict(school) if school else {}, cards),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+def _cached_media_response(request: Request, path, etag: str, media_type: str):
+    """Serve a content-addressed cache entry, answering 304 when the client already has it."""
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+@router.get("/students/{student_id}/photo")
+async def get_student_photo_thumbnail(
+    student_id: UUID,
+    request: Request,
+    size: int = Query(256, ge=16, le=1024),
+    pool: asyncpg.Pool = Depends(get_tenant_db_pool),
+    current_user=Depends(get_current_school_user)
+):
+    """Student photo resized to fit size x size (cached on disk, ETag-validated)."""
+    if not IMAGING_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Thumbnail service is unavailable (Pillow not installed)")
+
+    async with pool.acquire() as conn:
+        photo_url = await conn.fetchval("SELECT photo_url FROM students WHERE student_id = $1", student_id)
+    if not photo_url:
+        raise HTTPException(status_code=404, detail="Student has no photo")
+
+    async with httpx.AsyncClient(timeout=15.0) as client:
+        path, etag = await media_cache.thumbnail(
+            photo_url, snap_thumbnail_size(size), lambda url: IDCardRenderer.fetch(client, url)
+        )
+    if path is None:
+        raise HTTPException(status_code=502, detail="Could not load student photo")
+    return _cached_media_response(request, path, etag, "image/jpeg")
+
+
+@router.get("/{card_id}/qr.png")
+async def get_card_qr_code(
+    card_id: UUID,
+    request: Request,
+    size: int = Query(256, ge=64, le=1024),
+    service: IDCardService = Depends(get_id_card_service)
+):
+    """QR code PNG for an ID card (cached on disk by card number, ETag-validated)."""
+    if not IMAGING_AVAILABLE:
+        raise HTTPException(status_code=503, detail="QR service is unavailable (qrcode not installed)")
+
+    card = await service.get_card_by_id(card_id)
+    if not card:
+        raise HTTPException(status_code=404, detail="ID card not found")
+
+    path, etag = await media_cache.qr_png(str(card['student_id']), size, card['card_number'])
+    return _cached_media_response(request, path, etag, "image/png")
+
+
 @router.get("/{card_id}/status", response_model=IDCardStatusResponse)
 async def get_card_status(
     card_id: UUID,
@@ -309,6 +381,22 @@ async def bulk_generate_id_cards(
     return await service.bulk_generate_cards(data)
 
 
+@router.post("/bulk-generate/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def queue_bulk_generate_id_cards(
+    data: BulkIDCardGenerate,
+    current_user=Depends(get_current_school_user),
+    master_pool: asyncpg.Pool = Depends(get_master_db_pool)
+):
+    """
+    Queue bulk ID card generation as a background job (whole school, thousands of students).
+    Returns a job id; poll /jobs/{job_id} for progress and the result.
+    """
+    return await JobQueue.enqueue(
+        master_pool, "id_cards.bulk_generate", data.model_dump(),
+        tenant_id=current_user["tenant_id"], created_by=current_user["user_id"]
+    )
+
+
 # ============================================================================
 # APPEAL ENDPOINTS
 # ============================================================================
@@ -446,10 +534,11 @@ async def get_pending_count(
     
     Useful for dashboard badges/notifications.
     """
-    stats = await service.get_appeal_stats()
+    counters = await service.get_counters()
+    oldest = counters['oldest_pending_hours']
     return {
-        "pending_count": stats.pending_count,
-        "oldest_pending_hours": stats.oldest_pending_hours
+        "pending_count": counters['appeals_pending'],
+        "oldest_pending_hours": float(oldest) if oldest is not None else None
     }
 
 
@@ -501,6 +590,9 @@ async def init_id_card_restrictions(pool: asyncpg.Pool = Depends(get_tenant_db_p
                 );
                 CREATE INDEX IF NOT EXISTS idx_appeals_status ON id_card_appeals(status);
              """)
+
+             # 3. Status counters (triggers + recount)
+             await install_id_card_counters(conn)
              return {"message": "Restrictions Schema Initialized"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Init Schema Failed: {e}")
@@ -0,0 +1,52 @@
+"""
+Background Jobs API
+Status, progress and results of the school's queued jobs.
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+from uuid import UUID
+import asyncpg
+
+from app.api.v1.deps import get_current_school_user, get_master_db_pool
+from app.services.jobs import JobQueue
+
+router = APIRouter()
+
+
+@router.get("/")
+async def list_jobs(
+    status: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(get_current_school_user),
+    pool: asyncpg.Pool = Depends(get_master_db_pool)
+):
+    """Recent jobs for this school, newest first."""
+    return await JobQueue.list_jobs(pool, current_user["tenant_id"], status, limit)
+
+
+@router.get("/{job_id}")
+async def get_job(
+    job_id: UUID,
+    current_user: dict = Depends(get_current_school_user),
+    pool: asyncpg.Pool = Depends(get_master_db_pool)
+):
+    """Status, progress (0..1) and, once finished, the result or error of a job."""
+    job = await JobQueue.get(pool, job_id, current_user["tenant_id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(
+    job_id: UUID,
+    current_user: dict = Depends(get_current_school_user),
+    pool: asyncpg.Pool = Depends(get_master_db_pool)
+):
+    """Cancel a queued job, or ask a running one to stop at its next progress update."""
+    status = await JobQueue.cancel(pool, job_id, current_user["tenant_id"])
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if status in ("succeeded", "failed"):
+        raise HTTPException(status_code=409, detail=f"Job already {status}")
+    return {"job_id": str(job_id), "status": status}
@@ -3,11 +3,26 @@ Results & Report Card Generation API
 Protocol Phase 4 Compliant
 """
 from fastapi import APIRouter, Depends, HTTPException, Body, Query
+from fastapi.responses import StreamingResponse
 from typing import List, Optional, Dict, Any
 from uuid import UUID
 from pydantic import BaseModel
+from bisect import bisect_right
+from itertools import groupby
+from html import escape
+import asyncio
 import asyncpg
+import json
+import zipfile
 from app.api.v1.deps import get_current_school_user, get_tenant_db_pool
+from app.services.exam_totals import PAPER_CLASS_MATCH, rebuild_exam_totals
+from app.services.exam_analytics import (
+    compute_exam_analytics, get_cached_analytics, cache_analytics, invalidate_tenant_analytics
+)
+from app.services.grading import (
+    CompiledGradeScale, DEFAULT_SCALE, GRADE_SCALES_DDL,
+    get_grade_scale, invalidate_grade_scale, validate_bands
+)
 
 router = APIRouter()
 
@@ -18,6 +33,11 @@ class GradeScale(BaseModel):
     max_score: float
     gpa: float
 
+class GradeScaleCreate(BaseModel):
+    name: str
+    bands: List[GradeScale]
+    is_default: bool = True
+
 class SubjectResult(BaseModel):
     subject_name: str
     total_marks: float
@@ -44,13 +64,124 @@ class ReportCard(BaseModel):
     attendance_percentage: Optional[float] = None
 
 # --- Helpers ---
-def calculate_grade(percentage: float) -> str:
-    if percentage >= 90: return 'A+'
-    if percentage >= 80: return 'A'
-    if percentage >= 70: return 'B'
-    if percentage >= 60: return 'C'
-    if percentage >= 50: return 'D'
-    return 'F'
+def calculate_grade(percentage: float, scale: CompiledGradeScale = DEFAULT_SCALE) -> str:
+    return scale.grade(percentage)
+
+def build_subject_result(subject_name: str, total_marks, passing_marks, obtained_marks, remarks,
+                         scale: CompiledGradeScale = DEFAULT_SCALE) -> dict:
+    """Score a single paper for a report card."""
+    obtained = float(obtained_marks or 0)
+    total = float(total_marks)
+    passing = float(passing_marks)
+    percentage = (obtained / total * 100) if total > 0 else 0
+
+    return {
+        "subject_name": subject_name,
+        "total_marks": total,
+        "passing_marks": passing,
+        "obtained_marks": obtained,
+        "percentage": round(percentage, 2),
+        "grade": calculate_grade(percentage, scale),
+        "status": 'Pass' if obtained >= passing else 'Fail',
+        "remarks": remarks
+    }
+
+def paper_applies_to_student(paper, student) -> bool:
+    """A paper belongs to a student when its class matches (section-less papers cover every section)."""
+    if paper['class_name'] != student['class_name']:
+        return False
+    return not paper['section'] or paper['section'] == student['section']
+
+def render_report_card_html(card: dict) -> str:
+    """Minimal printable HTML document for one report card."""
+    rows = "".join(
+        f"<tr><td>{escape(s['subject_name'])}</td><td>{s['total_marks']:g}</td>"
+        f"<td>{s['obtained_marks']:g}</td><td>{s['percentage']:.2f}%</td>"
+        f"<td>{escape(s['grade'])}</td><td>{s['status']}</td></tr>"
+        for s in card["subjects"]
+    )
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{escape(card['full_name'])} - {escape(card['exam_name'])}</title></head>
+<body>
+<h2>{escape(card['exam_name'])}</h2>
+<p><strong>{escape(card['full_name'])}</strong> ({escape(card['admission_number'] or '')})<br>
+Class: {escape(card['class_name'] or '')} {escape(card['section'])}</p>
+<table border="1" cellpadding="4" cellspacing="0">
+<tr><th>Subject</th><th>Total</th><th>Obtained</th><th>%</th><th>Grade</th><th>Status</th></tr>
+{rows}
+</table>
+<p>Total: {card['total_obtained']:g} / {card['grand_total']:g} ({card['overall_percentage']:.2f}%)
+&mdash; Grade {escape(card['overall_grade'])} &mdash; Rank {card['rank'] if card['rank'] is not None else '-'}</p>
+</body></html>
+"""
+
+def build_exam_report_cards(exam_name: str, papers, students, results,
+                            scale: CompiledGradeScale = DEFAULT_SCALE) -> List[dict]:
+    """
+    Assemble report cards for many students from pre-loaded rows.
+    Ranks follow the single-card rule: position by total obtained among
+    students of the same class and section who have marks recorded.
+    """
+    papers_by_class: Dict[str, list] = {}
+    for paper in papers:
+        papers_by_class.setdefault(paper['class_name'], []).append(paper)
+
+    marks = {(r['student_id'], r['paper_id']): r for r in results}
+
+    cards = []
+    ranked_totals: Dict[tuple, List[float]] = {}
+    for student in students:
+        subjects = []
+        grand_total = 0.0
+        total_obtained = 0.0
+        has_marks = False
+
+        for paper in papers_by_class.get(student['class_name'], []):
+            if not paper_applies_to_student(paper, student):
+                continue
+            result = marks.get((student['student_id'], paper['paper_id']))
+            has_marks = has_marks or result is not None
+            subject = build_subject_result(
+                paper['subject_name'], paper['total_marks'], paper['passing_marks'],
+                result['marks_obtained'] if result else 0,
+                result['remarks'] if result else None,
+                scale
+            )
+            subjects.append(subject)
+            grand_total += subject['total_marks']
+            total_obtained += subject['obtained_marks']
+
+        group = (student['class_name'], student['section'])
+        if has_marks:
+            ranked_totals.setdefault(group, []).append(total_obtained)
+
+        overall_percent = (total_obtained / grand_total * 100) if grand_total > 0 else 0
+        cards.append({
+            "student_id": str(student['student_id']),
+            "full_name": student['full_name'],
+            "admission_number": student['admission_number'],
+            "class_name": student['class_name'],
+            "section": student['section'] or "",
+            "exam_name": exam_name,
+            "subjects": subjects,
+            "grand_total": grand_total,
+            "total_obtained": total_obtained,
+            "overall_percentage": round(overall_percent, 2),
+            "overall_grade": calculate_grade(overall_percent, scale),
+            "overall_gpa": scale.gpa(overall_percent),
+            "rank": None,
+            "attendance_percentage": 95.0 # Placeholder, same as single card
+        })
+
+    for totals in ranked_totals.values():
+        totals.sort()
+
+    # Rank = number of classmates with a strictly higher total + 1
+    for card, student in zip(cards, students):
+        totals = ranked_totals.get((student['class_name'], student['section']), [])
+        card["rank"] = len(totals) - bisect_right(totals, card["total_obtained"]) + 1
+
+    return cards
 
 # --- Endpoints ---
 
@@ -65,7 +196,7 @@ async def get_student_report_card(
     async with pool.acquire() as conn:
         # 1. Student Details
         student = await conn.fetchrow("""
-            SELECT full_name, admission_number, current_class as class_name, section 
+            SELECT full_name, admission_number, current_class as class_name, current_section as section 
             FROM students WHERE student_id = $1
         """, student_id)
         if not student:
@@ -87,64 +218,61 @@ async def get_student_report_card(
                 er.remarks
             FROM exam_papers ep
             JOIN subjects s ON ep.subject_id = s.subject_id
+            JOIN classes c ON ep.class_id = c.class_id
             LEFT JOIN exam_results er ON ep.paper_id = er.paper_id AND er.student_id = $1
             WHERE ep.exam_id = $2
-              -- AND ep.class_id = (SELECT class_id FROM classes WHERE class_name = $3) -- Optional strict check
-        """, student_id, exam_id)
+              AND c.class_name = $3
+              AND (c.section IS NULL OR c.section = '' OR c.section = $4)
+        """, student_id, exam_id, student['class_name'], student['section'])
         
+        scale = await get_grade_scale(conn, current_user['tenant_id'])
         subject_results = []
         grand_total = 0.0
         total_obtained = 0.0
         
         for row in rows:
-            obtained = float(row['obtained_marks'] or 0)
-            total = float(row['total_marks'])
-            passing = float(row['passing_marks'])
-            
-            percentage = (obtained / total * 100) if total > 0 else 0
-            grade = calculate_grade(percentage)
-            status = 'Pass' if obtained >= passing else 'Fail'
-            
-            subject_results.append({
-                "subject_name": row['subject_name'],
-                "total_marks": total,
-                "passing_marks": passing,
-                "obtained_marks": obtained,
-                "percentage": round(percentage, 2),
-                "grade": grade,
-                "status": status,
-                "remarks": row['remarks']
-            })
+            subject = build_subject_result(
+                row['subject_name'], row['total_marks'], row['passing_marks'],
+                row['obtained_marks'], row['remarks'], scale
+            )
+            subject_results.append(subject)
             
-            grand_total += total
-            total_obtained += obtained
+            grand_total += subject['total_marks']
+            total_obtained += subject['obtained_marks']
 
         overall_percent = (total_obtained / grand_total * 100) if grand_total > 0 else 0
-        overall_grade = calculate_grade(overall_percent)
-        
-        # 4. Rank Calculation (Expensive, maybe cache later)
-        # Count how many students in same class have higher total marks for this exam
-        # Need class_id. Assuming student has it or we query by class_name logic again.
-        # Check if student table has class_id? 
-        # For result accuracy, finding rank via 'class_name' and 'section' matches is acceptable for MVP
+        overall_grade = calculate_grade(overall_percent, scale)
         
-        rank = await conn.fetchval("""
-            WITH StudentTotals AS (
-                SELECT 
-                    er.student_id, 
-                    SUM(er.marks_obtained) as total
-                FROM exam_results er
-                JOIN exam_papers ep ON er.paper_id = ep.paper_id
-                JOIN students s ON er.student_id = s.student_id
-                WHERE ep.exam_id = $1 
-                  AND s.current_class = $2 
-                  AND s.section = $3
-                GROUP BY er.student_id
-            )
-            SELECT COUNT(*) + 1 
-            FROM StudentTotals 
-            WHERE total > $4
-        """, exam_id, student['class_name'], student['section'], total_obtained)
+        # 4. Rank (materialized in exam_student_totals when marks are submitted;
+        #    a row left over from the student's previous class does not count)
+        try:
+            rank = await conn.fetchval("""
+                SELECT rank FROM exam_student_totals
+                WHERE exam_id = $1 AND student_id = $2
+                  AND class_name IS NOT DISTINCT FROM $3 AND section = COALESCE($4, '')
+            """, exam_id, student_id, student['class_name'], student['section'])
+        except asyncpg.UndefinedTableError:
+            rank = None
+
+        if rank is None:
+            # Not materialized yet (legacy marks): count classmates with a higher total
+            rank = await conn.fetchval("""
+                WITH StudentTotals AS (
+                    SELECT 
+                        er.student_id, 
+                        SUM(er.marks_obtained) as total
+                    FROM exam_results er
+                    JOIN exam_papers ep ON er.paper_id = ep.paper_id
+                    JOIN students s ON er.student_id = s.student_id
+                    WHERE ep.exam_id = $1 
+                      AND s.current_class = $2 
+                      AND s.current_section IS NOT DISTINCT FROM $3
+                    GROUP BY er.student_id
+                )
+                SELECT COUNT(*) + 1 
+                FROM StudentTotals 
+                WHERE total > $4
+            """, exam_id, student['class_name'], student['section'], total_obtained)
 
         return {
             "student_id": str(student_id),
@@ -158,6 +286,7 @@ async def get_student_report_card(
             "total_obtained": total_obtained,
             "overall_percentage": round(overall_percent, 2),
             "overall_grade": overall_grade,
+            "overall_gpa": scale.gpa(overall_percent),
             "rank": rank,
             "attendance_percentage": 95.0 # Placeholder or integrate with Attendance API
         }
@@ -169,45 +298,354 @@ async def get_class_result_summary(
     pool: asyncpg.Pool = Depends(get_tenant_db_pool),
     current_user: dict = Depends(get_current_school_user)
 ):
-    """Get list of all students formatted for result broadsheet"""
+    """
+    Get list of all students formatted for result broadsheet.
+    Read-only: materialized totals are used where they match the student's
+    current class; anyone else (no totals yet, or moved class since) is
+    aggregated live from exam_results and ranked alongside.
+    """
     async with pool.acquire() as conn:
-        # Get all students in class
-        students = await conn.fetch("""
-             SELECT student_id, full_name, admission_number 
-             FROM students 
-             WHERE current_class = $1 AND status='active'
-             ORDER BY full_name
-        """, class_name)
-        
-        results = []
-        for s in students:
-             # Reuse logic or simplified query?
-             # Simplified sum query
-             stats = await conn.fetchrow("""
-                SELECT 
-                    SUM(ep.total_marks) as grand,
-                    SUM(COALESCE(er.marks_obtained, 0)) as obtained,
-                    COUNT(ep.paper_id) as papers_count,
-                    COUNT(CASE WHEN COALESCE(er.marks_obtained,0) < ep.passing_marks THEN 1 END) as fail_count
-                FROM exam_papers ep
-                LEFT JOIN exam_results er ON ep.paper_id = er.paper_id AND er.student_id = $1
-                WHERE ep.exam_id = $2
-             """, s['student_id'], exam_id)
-             
-             grand = float(stats['grand'] or 0)
-             obtained = float(stats['obtained'] or 0)
-             percent = (obtained / grand * 100) if grand > 0 else 0
-             
-             results.append({
-                 "student_id": str(s['student_id']),
-                 "full_name": s['full_name'],
-                 "grand_total": grand,
-                 "total_obtained": obtained,
-                 "percentage": round(percent, 2),
-                 "papers_count": stats['papers_count'],
-                 "fail_count": stats['fail_count']
-             })
-             
-        # Sort by rank
-        results.sort(key=lambda x: x['total_obtained'], reverse=True)
-        return results
+        has_totals = await conn.fetchval("SELECT to_regclass('exam_student_totals')") is not None
+        totals_join = """
+            LEFT JOIN exam_student_totals t ON t.student_id = s.student_id AND t.exam_id = $2
+                AND t.class_name = s.current_class AND t.section = COALESCE(s.current_section, '')
+        """ if has_totals else ""
+        rows = await conn.fetch(f"""
+            SELECT s.student_id, s.full_name, s.admission_number, COALESCE(s.current_section, '') as section,
+                   {"t.grand, t.obtained, t.papers_count, t.fail_count, t.rank" if has_totals else
+                    "NULL::numeric as grand, NULL::numeric as obtained, NULL::int as papers_count, "
+                    "NULL::int as fail_count, NULL::int as rank"}
+            FROM students s
+            {totals_join}
+            WHERE s.current_class = $1 AND s.status = 'active'
+            ORDER BY s.full_name
+        """, class_name, exam_id)
+
+        # Students without a usable totals row: aggregate their papers live
+        live = {}
+        missing = [r['student_id'] for r in rows if r['grand'] is None]
+        if missing:
+            live = {r['student_id']: r for r in await conn.fetch(f"""
+                SELECT s.student_id,
+                       SUM(ep.total_marks) as grand,
+                       SUM(COALESCE(er.marks_obtained, 0)) as obtained,
+                       COUNT(ep.paper_id) as papers_count,
+                       COUNT(*) FILTER (WHERE COALESCE(er.marks_obtained, 0) < ep.passing_marks) as fail_count
+                FROM students s
+                JOIN classes c ON {PAPER_CLASS_MATCH}
+                JOIN exam_papers ep ON ep.class_id = c.class_id AND ep.exam_id = $2
+                LEFT JOIN exam_results er ON er.paper_id = ep.paper_id AND er.student_id = s.student_id
+                WHERE s.student_id = ANY($1::uuid[])
+                GROUP BY s.student_id
+            """, missing, exam_id)}
+        scale = await get_grade_scale(conn, current_user['tenant_id'])
+
+    results = []
+    for row in rows:
+        stats = row if row['grand'] is not None else live.get(row['student_id'])
+        grand = float(stats['grand'] or 0) if stats else 0.0
+        obtained = float(stats['obtained'] or 0) if stats else 0.0
+        percent = (obtained / grand * 100) if grand > 0 else 0
+
+        results.append({
+            "student_id": str(row['student_id']),
+            "full_name": row['full_name'],
+            "section": row['section'],
+            "grand_total": grand,
+            "total_obtained": obtained,
+            "percentage": round(percent, 2),
+            "grade": scale.grade(percent),
+            "gpa": scale.gpa(percent),
+            "papers_count": stats['papers_count'] if stats else 0,
+            "fail_count": stats['fail_count'] if stats else 0,
+            "rank": row['rank']
+        })
+
+    if missing:
+        # Some totals were computed live: rank everyone per section the same way
+        by_section: Dict[str, List[float]] = {}
+        for r in results:
+            by_section.setdefault(r['section'], []).append(r['total_obtained'])
+        for totals in by_section.values():
+            totals.sort()
+        for r in results:
+            totals = by_section[r['section']]
+            r['rank'] = len(totals) - bisect_right(totals, r['total_obtained']) + 1
+
+    # Sort by rank
+    results.sort(key=lambda x: x['total_obtained'], reverse=True)
+    return results
+
+@router.post("/totals/{exam_id}/rebuild")
+async def rebuild_result_totals(
+    exam_id: UUID,
+    pool: asyncpg.Pool = Depends(get_tenant_db_pool),
+    current_user: dict = Depends(get_current_school_user)
+):
+    """Recompute materialized totals and ranks for an exam (e.g. after editing papers)"""
+    async with pool.acquire() as conn:
+        count = await rebuild_exam_totals(conn, exam_id)
+        return {"success": True, "students": count}
+
+@router.get("/cards/exam/{exam_id}")
+async def get_exam_report_cards(
+    exam_id: UUID,
+    class_name: Optional[str] = None,
+    section: Optional[str] = None,
+    format: str = Query("ndjson", regex="^(ndjson|zip)$"),
+    pool: asyncpg.Pool = Depends(get_tenant_db_pool),
+    current_user: dict = Depends(get_current_school_user)
+):
+    """
+    Generate report cards for every student of an exam.
+    Papers are loaded once; students and marks are then loaded one class at
+    a time while the response streams, and cards are built per class/section
+    (the rank group), so memory stays at one class. Streams NDJSON (one card
+    per line) or a ZIP archive of printable HTML documents, deflated off the
+    event loop as it goes.
+    """
+    async with pool.acquire() as conn:
+        exam = await conn.fetchrow("SELECT name FROM exams WHERE exam_id = $1", exam_id)
+        if not exam:
+            raise HTTPException(404, "Exam not found")
+
+        papers = await conn.fetch("""
+            SELECT ep.paper_id, ep.total_marks, ep.passing_marks,
+                   s.subject_name, c.class_name, c.section
+            FROM exam_papers ep
+            JOIN subjects s ON ep.subject_id = s.subject_id
+            JOIN classes c ON ep.class_id = c.class_id
+            WHERE ep.exam_id = $1
+            ORDER BY s.subject_name
+        """, exam_id)
+
+        scale = await get_grade_scale(conn, current_user['tenant_id'])
+
+    class_names = sorted({p['class_name'] for p in papers})
+    if class_name:
+        class_names = [name for name in class_names if name == class_name]
+
+    async def card_groups():
+        """Cards of one class/section at a time."""
+        for current_class in class_names:
+            async with pool.acquire() as conn:
+                query = """
+                    SELECT student_id, full_name, admission_number,
+                           current_class as class_name, current_section as section
+                    FROM students
+                    WHERE status = 'active' AND current_class = $1
+                """
+                params = [current_class]
+                if section:
+                    query += " AND current_section = $2"
+                    params.append(section)
+                query += " ORDER BY current_section, full_name"
+                students = await conn.fetch(query, *params)
+                if not students:
+                    continue
+
+                results = await conn.fetch("""
+                    SELECT er.paper_id, er.student_id, er.marks_obtained, er.remarks
+                    FROM exam_results er
+                    JOIN exam_papers ep ON er.paper_id = ep.paper_id
+                    WHERE ep.exam_id = $1 AND er.student_id = ANY($2::uuid[])
+                """, exam_id, [s['student_id'] for s in students])
+
+            for _, group in groupby(students, key=lambda s: s['section']):
+                yield build_exam_report_cards(exam['name'], papers, list(group), results, scale)
+
+    if format == "zip":
+        async def stream_zip():
+            sink = _ZipSink()
+            archive = zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED)
+            async for cards in card_groups():
+                await asyncio.to_thread(_write_report_cards, archive, cards)
+                yield sink.drain()
+            await asyncio.to_thread(archive.close)
+            yield sink.drain()
+
+        return StreamingResponse(
+            stream_zip(),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="report_cards_{exam_id}.zip"'}
+        )
+
+    async def stream_ndjson():
+        async for cards in card_groups():
+            yield "".join(json.dumps(card, default=str) + "\n" for card in cards)
+
+    return StreamingResponse(stream_ndjson(), media_type="application/x-ndjson")
+
+
+class _ZipSink:
+    """Write-only file object: zipfile writes (unseekable mode), the response drains."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def _write_report_cards(archive: zipfile.ZipFile, cards: List[dict]):
+    """Render and deflate one group of cards into the archive (blocking; run in a thread)."""
+    for card in cards:
+        name = f"{card['class_name']}_{card['section']}_{card['admission_number'] or card['student_id']}"
+        name = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in name)
+        archive.writestr(f"{name}.html", render_report_card_html(card))
+
+@router.get("/analytics/{exam_id}")
+async def get_exam_analytics(
+    exam_id: UUID,
+    class_name: Optional[str] = None,
+    pool: asyncpg.Pool = Depends(get_tenant_db_pool),
+    current_user: dict = Depends(get_current_school_user)
+):
+    """
+    Exam analytics: per-paper mean, stddev, percentiles, pass rate, grade
+    histogram, difficulty/discrimination and subject correlations.
+    Computed from the marks matrix in one pass; cached until marks change
+    (for at most EXAM_ANALYTICS_TTL seconds across workers).
+    """
+    cached = get_cached_analytics(current_user['tenant_id'], exam_id, class_name)
+    if cached is not None:
+        return cached
+
+    async with pool.acquire() as conn:
+        exam = await conn.fetchrow("SELECT name FROM exams WHERE exam_id = $1", exam_id)
+        if not exam:
+            raise HTTPException(404, "Exam not found")
+
+        query = """
+            SELECT ep.paper_id, ep.total_marks, ep.passing_marks,
+                   s.subject_name, c.class_name
+            FROM exam_papers ep
+            JOIN subjects s ON ep.subject_id = s.subject_id
+            JOIN classes c ON ep.class_id = c.class_id
+            WHERE ep.exam_id = $1
+        """
+        params = [exam_id]
+        if class_name:
+            query += " AND c.class_name = $2"
+            params.append(class_name)
+        query += " ORDER BY c.class_name, s.subject_name"
+        papers = await conn.fetch(query, *params)
+
+        results = await conn.fetch("""
+            SELECT er.paper_id, er.student_id, er.marks_obtained
+            FROM exam_results er
+            WHERE er.paper_id = ANY($1::uuid[])
+        """, [p['paper_id'] for p in papers])
+
+        scale = await get_grade_scale(conn, current_user['tenant_id'])
+
+    analytics = compute_exam_analytics(papers, results, scale)
+    analytics.update({"exam_id": str(exam_id), "exam_name": exam['name'], "class_name": class_name})
+
+    cache_analytics(current_user['tenant_id'], exam_id, class_name, analytics)
+    return analytics
+
+# --- Grade Scales ---
+
+def _scale_row(row) -> dict:
+    data = dict(row)
+    if isinstance(data.get('bands'), str):
+        data['bands'] = json.loads(data['bands'])
+    return data
+
+@router.get("/grade-scales")
+async def list_grade_scales(
+    pool: asyncpg.Pool = Depends(get_tenant_db_pool),
+    current_user: dict = Depends(get_current_school_user)
+):
+    """List grade scales; the built-in ladder is returned when none are configured"""
+    async with pool.acquire() as conn:
+        exists = await conn.fetchval("SELECT to_regclass('grade_scales')")
+        rows = await conn.fetch("SELECT * FROM grade_scales ORDER BY created_at") if exists else []
+        if not rows:
+            return [{**DEFAULT_SCALE.to_dict(), "is_default": True, "built_in": True}]
+        return [_scale_row(row) for row in rows]
+
+@router.post("/grade-scales")
+async def create_grade_scale(
+    data: GradeScaleCreate,
+    pool: asyncpg.Pool = Depends(get_tenant_db_pool),
+    current_user: dict = Depends(get_current_school_user)
+):
+    bands = [band.model_dump() for band in data.bands]
+    error = validate_bands(bands)
+    if error:
+        raise HTTPException(400, error)
+
+    async with pool.acquire() as conn:
+        await conn.execute(GRADE_SCALES_DDL)
+        async with conn.transaction():
+            if data.is_default:
+                await conn.execute("UPDATE grade_scales SET is_default = FALSE WHERE is_default = TRUE")
+            row = await conn.fetchrow("""
+                INSERT INTO grade_scales (name, bands, is_default)
+                VALUES ($1, $2, $3)
+                RETURNING *
+            """, data.name, json.dumps(bands), data.is_default)
+
+    invalidate_grade_scale(current_user['tenant_id'])
+    invalidate_tenant_analytics(current_user['tenant_id'])
+    return _scale_row(row)
+
+@router.put("/grade-scales/{scale_id}")
+async def update_grade_scale(
+    scale_id: UUID,
+    data: GradeScaleCreate,
+    pool: asyncpg.Pool = Depends(get_tenant_db_pool),
+    current_user: dict = Depends(get_current_school_user)
+):
+    bands = [band.model_dump() for band in data.bands]
+    error = validate_bands(bands)
+    if error:
+        raise HTTPException(400, error)
+
+    async with pool.acquire() as conn:
+        try:
+            async with conn.transaction():
+                if data.is_default:
+                    await conn.execute("UPDATE grade_scales SET is_default = FALSE WHERE scale_id <> $1", scale_id)
+                row = await conn.fetchrow("""
+                    UPDATE grade_scales
+                    SET name = $1, bands = $2, is_default = $3, updated_at = NOW()
+                    WHERE scale_id = $4
+                    RETURNING *
+                """, data.name, json.dumps(bands), data.is_default, scale_id)
+        except asyncpg.UndefinedTableError:
+            row = None
+        if not row:
+            raise HTTPException(404, "Grade scale not found")
+
+    invalidate_grade_scale(current_user['tenant_id'])
+    invalidate_tenant_analytics(current_user['tenant_id'])
+    return _scale_row(row)
+
+@router.delete("/grade-scales/{scale_id}")
+async def delete_grade_scale(
+    scale_id: UUID,
+    pool: asyncpg.Pool = Depends(get_tenant_db_pool),
+    current_user: dict = Depends(get_current_school_user)
+):
+    async with pool.acquire() as conn:
+        try:
+            result = await conn.execute("DELETE FROM grade_scales WHERE scale_id = $1", scale_id)
+        except asyncpg.UndefinedTableError:
+            result = "DELETE 0"
+        if result == "DELETE 0":
+            raise HTTPException(404, "Grade scale not found")
+
+    invalidate_grade_scale(current_user['tenant_id'])
+    invalidate_tenant_analytics(current_user['tenant_id'])
+    return {"success": True}
@@ -7,6 +7,8 @@ import json
 from app.core.database import get_master_db_pool
 from app.api.v1.deps import get_current_school_user, get_tenant_db_pool
 from app.core.security import SecurityService
+from app.services.media_store import MediaStore
+from app.services.template_catalog import TemplateCatalog
 
 router = APIRouter()
 
@@ -40,10 +42,16 @@ async def get_school_profile(
 @router.get("/stats", response_model=dict)
 async def get_school_stats(
     current_user: dict = Depends(get_current_school_user),
-    pool: asyncpg.Pool = Depends(get_tenant_db_pool)  # Use Tenant DB Pool
+    pool: asyncpg.Pool = Depends(get_tenant_db_pool),  # Use Tenant DB Pool
+    master_pool: asyncpg.Pool = Depends(get_master_db_pool)
 ):
     """Get dashboard statistics (Student count, Teacher count, Storage usage)."""
     try:
+        # Storage usage is a maintained counter (see MediaStore), not a disk scan
+        usage = await MediaStore.usage(master_pool, current_user["tenant_id"])
+        storage_used_mb = round(usage["bytes_used"] / (1024 * 1024), 1)
+        storage_limit_mb = usage["limit_bytes"] // (1024 * 1024)
+
         async with pool.acquire() as conn:
             # Check if students table exists
             exists = await conn.fetchval("SELECT to_regclass('students')")
@@ -51,10 +59,10 @@ async def get_school_stats(
                 return {
                     "students": 0,
                     "teachers": 0,
-                    "storage_mb": 0,
+                    "storage_mb": storage_used_mb,
                     "student_limit": 500,
                     "teacher_limit": 50,
-                    "storage_limit_mb": 1024
+                    "storage_limit_mb": storage_limit_mb
                 }
 
             # Count Students (from tenant 'students' table)
@@ -67,16 +75,13 @@ async def get_school_stats(
                 "SELECT COUNT(*) FROM staff WHERE role = 'teacher' AND is_active = TRUE"
             )
             
-            # Storage usage (Mock for now or calculate from uploads if we track them)
-            storage_used_mb = 120 # Mock
-            
         return {
             "students": student_count,
             "teachers": teacher_count,
             "storage_mb": storage_used_mb,
             "student_limit": 500, 
             "teacher_limit": 50,
-            "storage_limit_mb": 1024
+            "storage_limit_mb": storage_limit_mb
         }
     except Exception as e:
         print(f"School Stats Error: {e}")
@@ -178,6 +183,7 @@ async def upload_id_card_template(
             template_data.get("back_bg_url"),
             json.dumps(template_data.get("field_positions", {}))
         )
+        TemplateCatalog.invalidate(tenant_id)
         
         return {"message": "ID card template updated successfully"}
 
@@ -6,6 +6,7 @@ from pydantic import BaseModel
 import asyncpg
 
 from app.api.v1.deps import get_current_school_user, get_tenant_db_pool
+from app.services.face_index import FaceIndexRegistry, fetch_encoding, has_encoding, without_biometrics
 
 router = APIRouter()
 
@@ -152,7 +153,7 @@ async def list_staff(
         
         try:
              rows = await conn.fetch(query, *params)
-             return [dict(row) for row in rows]
+             return [without_biometrics(row) for row in rows]
         except Exception as e:
              # If column still undefined or other SQL error
              print(f"Error listing staff: {e}")
@@ -214,7 +215,7 @@ async def create_staff(
                 staff.role, staff.address, staff.qualifications, staff.join_date, staff.salary_amount, 
                 staff.photo_url, staff.status
             )
-            return dict(row)
+            return without_biometrics(row)
     except HTTPException:
         raise
     except Exception as e:
@@ -231,7 +232,7 @@ async def get_staff(
         row = await conn.fetchrow("SELECT * FROM staff WHERE staff_id = $1", staff_id)
         if not row:
             raise HTTPException(status_code=404, detail="Staff member not found")
-        return dict(row)
+        return without_biometrics(row)
 
 @router.put("/{staff_id}", response_model=StaffResponse)
 async def update_staff(
@@ -243,8 +244,8 @@ async def update_staff(
     """Update a staff member."""
     try:
         async with pool.acquire() as conn:
-            exists = await conn.fetchval("SELECT 1 FROM staff WHERE staff_id = $1", staff_id)
-            if not exists:
+            previous = await conn.fetchrow("SELECT full_name, status FROM staff WHERE staff_id = $1", staff_id)
+            if not previous:
                 raise HTTPException(status_code=404, detail="Staff member not found")
 
             row = await conn.fetchrow(
@@ -260,7 +261,20 @@ async def update_staff(
                 staff.role, staff.address, staff.qualifications, staff.join_date, staff.salary_amount,
                 staff.photo_url, staff.status, staff_id
             )
-            return dict(row)
+
+            # Keep the face gallery in step with status/name changes of enrolled staff only;
+            # other edits must not make every worker reload the gallery
+            gallery_changed = (row["full_name"], row["status"]) != (previous["full_name"], previous["status"])
+            if gallery_changed and await has_encoding(conn, staff_id):
+                index = await FaceIndexRegistry.changed(current_user["tenant_id"], conn)
+                if index is not None:
+                    if row["status"] != "active":
+                        index.remove(staff_id)
+                    else:
+                        encoding = await fetch_encoding(conn, staff_id)
+                        if encoding is not None:
+                            index.upsert(staff_id, "staff", row["full_name"], encoding)
+            return without_biometrics(row)
     except HTTPException:
         raise
     except Exception as e:
@@ -280,6 +294,8 @@ async def delete_staff(
                 raise HTTPException(status_code=404, detail="Staff member not found")
 
             await conn.execute("UPDATE staff SET status = 'deleted' WHERE staff_id = $1", staff_id)
+            if await has_encoding(conn, staff_id):
+                await FaceIndexRegistry.remove(current_user["tenant_id"], staff_id, conn)
             return {"message": "Staff member deleted successfully"}
     except HTTPException:
         raise
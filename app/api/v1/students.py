@@ -7,6 +7,8 @@ import asyncpg
 
 from app.core.database import get_master_db_pool
 from app.api.v1.deps import get_current_school_user, get_tenant_db_pool
+from app.services.face_index import FaceIndexRegistry, has_encoding, without_biometrics
+from app.services.exam_totals import refresh_student_totals
 
 router = APIRouter()
 
@@ -76,7 +78,7 @@ async def get_student(
             row = await conn.fetchrow("SELECT * FROM students WHERE student_id = $1", student_id)
             if not row:
                 raise HTTPException(status_code=404, detail="Student not found")
-            return dict(row)
+            return without_biometrics(row)
     except asyncpg.UndefinedTableError:
          raise HTTPException(status_code=404, detail="Student table not initialized")
     except HTTPException:
@@ -200,7 +202,7 @@ async def list_students(
         
         try:
             rows = await conn.fetch(query, *params)
-            return [dict(row) for row in rows]
+            return [without_biometrics(row) for row in rows]
         except Exception as e:
             print(f"Error listing students: {e}")
             return []
@@ -258,7 +260,7 @@ async def create_student(
                 student.gender, student.current_class, student.father_name, student.father_phone, student.photo_url,
                 student.email, student.address
             )
-            return dict(row)
+            return without_biometrics(row)
     except HTTPException:
         raise
     except Exception as e:
@@ -277,8 +279,8 @@ async def update_student(
     try:
         async with pool.acquire() as conn:
             # Check if student exists
-            exists = await conn.fetchval("SELECT 1 FROM students WHERE student_id = $1", student_id)
-            if not exists:
+            previous = await conn.fetchrow("SELECT full_name, current_class FROM students WHERE student_id = $1", student_id)
+            if not previous:
                 raise HTTPException(status_code=404, detail="Student not found")
 
             # Update student
@@ -302,7 +304,13 @@ async def update_student(
                 student.gender, student.current_class, student.father_name, student.father_phone, 
                 student.photo_url, student.email, student.address, student_id
             )
-            return dict(row)
+            # Only a renamed, enrolled student changes the face gallery (and makes other workers reload it)
+            if row["full_name"] != previous["full_name"] and await has_encoding(conn, student_id):
+                await FaceIndexRegistry.rename(current_user["tenant_id"], student_id, row["full_name"], conn)
+            if row["current_class"] != previous["current_class"]:
+                # Move exam totals and ranks to the new class
+                await refresh_student_totals(conn, student_id)
+            return without_biometrics(row)
     except asyncpg.UndefinedTableError:
          raise HTTPException(status_code=404, detail="Student table not initialized")
     except HTTPException:
@@ -326,6 +334,8 @@ async def delete_student(
 
             # Soft delete
             await conn.execute("UPDATE students SET status = 'inactive' WHERE student_id = $1", student_id)
+            if await has_encoding(conn, student_id):
+                await FaceIndexRegistry.remove(current_user["tenant_id"], student_id, conn)
             return {"message": "Student deleted successfully"}
     except asyncpg.UndefinedTableError:
          raise HTTPException(status_code=404, detail="Student table not initialized")
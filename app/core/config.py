@@ -46,7 +46,63 @@ class Settings(BaseSettings):
     SMTP_PASSWORD: str = Field(default="", description="SMTP password")
     EMAILS_FROM_EMAIL: str = Field(default="", description="Email sender address")
     EMAILS_FROM_NAME: str = Field(default="PakAi Nexus", description="Email sender name")
+    SMTP_POOL_SIZE: int = Field(default=3, description="Persistent SMTP sessions (dispatcher workers)")
+    SMTP_BATCH_SIZE: int = Field(default=50, description="Queued messages a worker sends back-to-back on one session")
+    SMTP_MESSAGES_PER_SESSION: int = Field(default=100, description="Reconnect after this many messages (provider limits)")
+    SMTP_IDLE_TIMEOUT: int = Field(default=60, description="Seconds an idle SMTP session is kept open")
+    SMTP_TIMEOUT: int = Field(default=30, description="SMTP connect/command timeout in seconds")
+    SMTP_TENANT_RATE: int = Field(default=600, description="Messages per minute one school may send (0 = unlimited)")
+    SMTP_MAX_RETRIES: int = Field(default=5, description="Attempts per message on transient SMTP failures")
+    SMTP_INTERACTIVE_TIMEOUT: int = Field(default=15, description="Overall seconds allowed for an interactive email such as an OTP")
+
+    # Background Jobs
+    JOB_EMBEDDED_WORKERS: int = Field(default=2, description="Job workers run inside the API process (0 when a separate `python -m app.worker` runs)")
+    JOB_WORKER_CONCURRENCY: int = Field(default=4, description="Jobs one `python -m app.worker` process runs at a time")
+    JOB_TENANT_CONCURRENCY: int = Field(default=2, description="Jobs one school may have running at once")
+    JOB_POLL_INTERVAL: int = Field(default=5, description="Seconds between queue polls when no NOTIFY arrives")
+    JOB_STALE_AFTER: int = Field(default=120, description="A running job without a heartbeat for this long is requeued")
+    JOB_MAX_ATTEMPTS: int = Field(default=3, description="Default attempts before a job is marked failed")
+    NOTIFICATION_BATCH_SIZE: int = Field(default=50, description="notification_queue rows sent per drain batch")
+    TENANT_STATS_TTL: int = Field(default=60, description="Seconds the admin per-status tenant counts are cached (also dropped on transitions)")
+    LIFECYCLE_INTERVAL: int = Field(default=60, description="Seconds between subscription lifecycle ticks (grace/lock); 0 disables the scheduler")
     
+    # Face Recognition
+    FACE_MODEL: str = Field(default="hog", description="Face detector: hog (CPU) or cnn (GPU/slow on CPU)")
+    FACE_NUM_JITTERS: int = Field(default=1, description="Re-samples per encoding (higher = slower, slightly more accurate)")
+    FACE_MAX_IMAGE_SIDE: int = Field(default=800, description="Images are downscaled to this longest side before detection")
+    FACE_WORKERS: int = Field(default=2, description="Processes in the face extraction pool")
+    FACE_TENANT_CONCURRENCY: int = Field(default=2, description="Concurrent extractions allowed per tenant")
+    FACE_MAX_INFLIGHT: int = Field(default=8, description="Extractions queued or running in the pool at once, across all tenants")
+    FACE_QUEUE_TIMEOUT: float = Field(default=10.0, description="Seconds a scan may wait for a free slot")
+    FACE_EXTRACT_TIMEOUT: float = Field(default=20.0, description="Seconds allowed for one extraction once started")
+    FACE_DUPLICATE_THRESHOLD: float = Field(default=0.4, description="Enrollments closer than this to another person are treated as duplicates")
+    FACE_INDEX_MODE: str = Field(default="exact", description="Gallery search: exact (brute force) or ivf (approximate)")
+    FACE_IVF_LISTS: int = Field(default=0, description="IVF k-means lists (0 = sqrt of gallery size)")
+    FACE_IVF_PROBE: int = Field(default=8, description="IVF lists scanned per query")
+    FACE_IVF_MIN_GALLERY: int = Field(default=2000, description="Galleries smaller than this are always searched exactly")
+
+    # ID Card Printing
+    ID_CARD_RENDER_WORKERS: int = Field(default=2, description="Processes rendering ID card print sheets")
+    MEDIA_FETCH_HOSTS: str = Field(default="res.cloudinary.com", description="Comma-separated hosts ID card images may be fetched from (https only)")
+    MEDIA_CACHE_DIR: str = Field(default="cache/media", description="Disk cache for generated QR codes and thumbnails")
+    MEDIA_CACHE_MAX_MB: int = Field(default=512, description="Size budget of the media cache (LRU eviction)")
+    TEMPLATE_CACHE_TTL: int = Field(default=300, description="Seconds a worker may serve its cached ID card template catalog")
+
+    # Uploads
+    MEDIA_STORE_DIR: str = Field(default="storage/media", description="Content-addressed store for uploaded images and their variants")
+    UPLOAD_MAX_MB: int = Field(default=10, description="Largest accepted upload; enforced while the body streams in")
+    UPLOAD_TENANT_INFLIGHT_MB: int = Field(default=40, description="Bytes one tenant may have streaming in at once, across uploads")
+    UPLOAD_CHUNK_KB: int = Field(default=256, description="Read/write chunk size for streamed uploads")
+    UPLOAD_REMOTE_CONCURRENCY: int = Field(default=2, description="Background Cloudinary upload workers")
+    UPLOAD_REMOTE_RETRIES: int = Field(default=5, description="Attempts before a deferred Cloudinary upload is marked failed")
+    STORAGE_LIMIT_MB: int = Field(default=1024, description="Default per-school storage quota (tenant_storage_usage.limit_mb overrides)")
+    STORAGE_RECONCILE_INTERVAL: int = Field(default=3600, description="Seconds between storage usage recounts / orphan sweeps (0 disables)")
+    STORAGE_ORPHAN_GRACE: int = Field(default=3600, description="Unreferenced media files younger than this are not swept")
+
+    # Exams & Results
+    EXAM_ANALYTICS_TTL: int = Field(default=60, description="Seconds a worker may serve cached exam analytics (dropped locally on mark changes)")
+    GRADE_SCALE_CACHE_TTL: int = Field(default=60, description="Seconds a worker may serve a tenant's cached default grade scale")
+
     # App Configuration
     APP_DOMAIN: str = Field(default="pakainexus.com", description="Base domain for tenant subdomains")
     CORS_ORIGINS: str = Field(
@@ -54,14 +54,20 @@ class TenantDatabaseFactory:
             )
 
         tenant_config = request.state.tenant_config
-        tenant_id = str(tenant_config.tenant_id)
+        return await cls.get_pool(tenant_config.tenant_id, tenant_config.supabase_url)
+
+    @classmethod
+    async def get_pool(cls, tenant_id, url: str) -> asyncpg.Pool:
+        """
+        Get or create the pool for a tenant from its decrypted database URL.
+        Usable outside a request (background jobs, scripts).
+        """
+        tenant_id = str(tenant_id)
 
         # Get or create connection pool for this tenant
         if tenant_id not in cls._tenant_pools:
             logger.info(f"Creating new database pool for tenant {tenant_id}")
             
-            url = tenant_config.supabase_url
-            
             # SCHEMA-BASED ISOLATION: Check for special schema URL
             if url.startswith("shared_database_schema:"):
                 schema_name = url.split(":")[1]
@@ -99,6 +105,16 @@ class TenantDatabaseFactory:
 
         return cls._tenant_pools[tenant_id]
 
+    @classmethod
+    async def get_pool_for_row(cls, row) -> asyncpg.Pool:
+        """Pool for a `tenants` row (tenant_id, supabase_project_url, supabase_service_key)."""
+        from app.services.vault import CredentialVault
+
+        url, _ = await CredentialVault.get_decrypted_credentials(
+            row["tenant_id"], row["supabase_project_url"], row["supabase_service_key"]
+        )
+        return await cls.get_pool(row["tenant_id"], url)
+
     @classmethod
     async def close_all_tenant_pools(cls):
         """Close all tenant database pools."""
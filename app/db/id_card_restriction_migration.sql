@@ -187,28 +187,28 @@ ALTER TABLE id_card_templates ENABLE ROW LEVEL SECURITY;
 -- 7. HELPER FUNCTIONS
 -- ============================================================================
 
+-- Card numbers come from a sequence (one nextval per card, safe for set-based inserts).
+-- On first creation it starts after the highest number already issued.
+DO $$
+BEGIN
+    IF to_regclass('id_card_number_seq') IS NULL THEN
+        CREATE SEQUENCE id_card_number_seq;
+        PERFORM setval(
+            'id_card_number_seq',
+            COALESCE(MAX(substring(card_number FROM '([0-9]+)$')::BIGINT), 0) + 1,
+            false
+        )
+        FROM student_id_cards;
+    END IF;
+END $$;
+
 -- Function to generate unique card number
 CREATE OR REPLACE FUNCTION generate_card_number()
 RETURNS VARCHAR(50) AS $$
 DECLARE
-    new_number VARCHAR(50);
-    counter INTEGER := 1;
+    counter BIGINT := nextval('id_card_number_seq');
 BEGIN
-    LOOP
-        new_number := 'IDC-' || TO_CHAR(CURRENT_DATE, 'YYYY') || '-' || LPAD(counter::TEXT, 6, '0');
-        
-        -- Check if number exists
-        IF NOT EXISTS (SELECT 1 FROM student_id_cards WHERE card_number = new_number) THEN
-            RETURN new_number;
-        END IF;
-        
-        counter := counter + 1;
-        
-        -- Safety limit
-        IF counter > 999999 THEN
-            RAISE EXCEPTION 'Card number generation limit reached';
-        END IF;
-    END LOOP;
+    RETURN 'IDC-' || TO_CHAR(CURRENT_DATE, 'YYYY') || '-' || LPAD(counter::TEXT, GREATEST(6, LENGTH(counter::TEXT)), '0');
 END;
 $$ LANGUAGE plpgsql;
 
@@ -235,7 +235,175 @@ CREATE TRIGGER trigger_auto_create_id_card
     EXECUTE FUNCTION auto_create_id_card();
 
 -- ============================================================================
--- 8. SAMPLE DATA (Optional - for testing)
+-- 8. STATUS COUNTERS (dashboard stats / appeal badge in one row lookup)
+-- ============================================================================
+
+-- Kept exact by statement-level triggers, so every writer updates them in its
+-- own transaction. The final INSERT recounts from scratch (safe to re-run).
+CREATE TABLE IF NOT EXISTS id_card_counters (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    draft_count INTEGER NOT NULL DEFAULT 0,
+    submitted_count INTEGER NOT NULL DEFAULT 0,
+    locked_count INTEGER NOT NULL DEFAULT 0,
+    appeal_pending_count INTEGER NOT NULL DEFAULT 0,
+    unlocked_count INTEGER NOT NULL DEFAULT 0,
+    total_cards INTEGER NOT NULL DEFAULT 0,
+    editable_count INTEGER NOT NULL DEFAULT 0,
+    appeals_total INTEGER NOT NULL DEFAULT 0,
+    appeals_pending INTEGER NOT NULL DEFAULT 0,
+    appeals_approved INTEGER NOT NULL DEFAULT 0,
+    appeals_rejected INTEGER NOT NULL DEFAULT 0,
+    review_seconds_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+    reviewed_count INTEGER NOT NULL DEFAULT 0,
+    oldest_pending_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_appeals_pending_submitted
+    ON id_card_appeals(submitted_at) WHERE status = 'pending';
+
+CREATE OR REPLACE FUNCTION id_card_counters_cards()
+RETURNS TRIGGER AS $$
+DECLARE
+    source TEXT := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT status, is_editable, 1 AS sign FROM new_rows'
+        WHEN 'DELETE' THEN 'SELECT status, is_editable, -1 AS sign FROM old_rows'
+        ELSE 'SELECT status, is_editable, 1 AS sign FROM new_rows
+              UNION ALL SELECT status, is_editable, -1 FROM old_rows'
+    END;
+BEGIN
+    EXECUTE format($q$
+        UPDATE id_card_counters c SET
+            draft_count = c.draft_count + d.draft,
+            submitted_count = c.submitted_count + d.submitted,
+            locked_count = c.locked_count + d.locked,
+            appeal_pending_count = c.appeal_pending_count + d.appeal_pending,
+            unlocked_count = c.unlocked_count + d.unlocked,
+            total_cards = c.total_cards + d.total,
+            editable_count = c.editable_count + d.editable,
+            updated_at = NOW()
+        FROM (
+            SELECT
+                COALESCE(SUM(sign) FILTER (WHERE status = 'draft'), 0) AS draft,
+                COALESCE(SUM(sign) FILTER (WHERE status = 'submitted'), 0) AS submitted,
+                COALESCE(SUM(sign) FILTER (WHERE status = 'locked'), 0) AS locked,
+                COALESCE(SUM(sign) FILTER (WHERE status = 'appeal_pending'), 0) AS appeal_pending,
+                COALESCE(SUM(sign) FILTER (WHERE status = 'unlocked_for_edit'), 0) AS unlocked,
+                COALESCE(SUM(sign), 0) AS total,
+                COALESCE(SUM(sign) FILTER (WHERE is_editable), 0) AS editable
+            FROM (%s) delta
+        ) d
+        WHERE c.id = 1
+    $q$, source);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION id_card_counters_appeals()
+RETURNS TRIGGER AS $$
+DECLARE
+    source TEXT := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT status, submitted_at, reviewed_at, 1 AS sign FROM new_rows'
+        WHEN 'DELETE' THEN 'SELECT status, submitted_at, reviewed_at, -1 AS sign FROM old_rows'
+        ELSE 'SELECT status, submitted_at, reviewed_at, 1 AS sign FROM new_rows
+              UNION ALL SELECT status, submitted_at, reviewed_at, -1 FROM old_rows'
+    END;
+BEGIN
+    EXECUTE format($q$
+        UPDATE id_card_counters c SET
+            appeals_total = c.appeals_total + d.total,
+            appeals_pending = c.appeals_pending + d.pending,
+            appeals_approved = c.appeals_approved + d.approved,
+            appeals_rejected = c.appeals_rejected + d.rejected,
+            review_seconds_total = c.review_seconds_total + d.review_seconds,
+            reviewed_count = c.reviewed_count + d.reviewed,
+            oldest_pending_at = (
+                SELECT MIN(submitted_at) FROM id_card_appeals WHERE status = 'pending'
+            ),
+            updated_at = NOW()
+        FROM (
+            SELECT
+                COALESCE(SUM(sign), 0) AS total,
+                COALESCE(SUM(sign) FILTER (WHERE status = 'pending'), 0) AS pending,
+                COALESCE(SUM(sign) FILTER (WHERE status = 'approved'), 0) AS approved,
+                COALESCE(SUM(sign) FILTER (WHERE status = 'rejected'), 0) AS rejected,
+                COALESCE(SUM(sign * EXTRACT(EPOCH FROM (reviewed_at - submitted_at)))
+                    FILTER (WHERE reviewed_at IS NOT NULL), 0) AS review_seconds,
+                COALESCE(SUM(sign) FILTER (WHERE reviewed_at IS NOT NULL), 0) AS reviewed
+            FROM (%s) delta
+        ) d
+        WHERE c.id = 1
+    $q$, source);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_id_card_counters_ins ON student_id_cards;
+DROP TRIGGER IF EXISTS trg_id_card_counters_upd ON student_id_cards;
+DROP TRIGGER IF EXISTS trg_id_card_counters_del ON student_id_cards;
+CREATE TRIGGER trg_id_card_counters_ins AFTER INSERT ON student_id_cards
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION id_card_counters_cards();
+CREATE TRIGGER trg_id_card_counters_upd AFTER UPDATE ON student_id_cards
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION id_card_counters_cards();
+CREATE TRIGGER trg_id_card_counters_del AFTER DELETE ON student_id_cards
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION id_card_counters_cards();
+
+DROP TRIGGER IF EXISTS trg_appeal_counters_ins ON id_card_appeals;
+DROP TRIGGER IF EXISTS trg_appeal_counters_upd ON id_card_appeals;
+DROP TRIGGER IF EXISTS trg_appeal_counters_del ON id_card_appeals;
+CREATE TRIGGER trg_appeal_counters_ins AFTER INSERT ON id_card_appeals
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION id_card_counters_appeals();
+CREATE TRIGGER trg_appeal_counters_upd AFTER UPDATE ON id_card_appeals
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION id_card_counters_appeals();
+CREATE TRIGGER trg_appeal_counters_del AFTER DELETE ON id_card_appeals
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION id_card_counters_appeals();
+
+INSERT INTO id_card_counters AS c (
+    id, draft_count, submitted_count, locked_count, appeal_pending_count, unlocked_count,
+    total_cards, editable_count, appeals_total, appeals_pending, appeals_approved,
+    appeals_rejected, review_seconds_total, reviewed_count, oldest_pending_at, updated_at
+)
+SELECT 1, k.*, a.*, NOW()
+FROM (
+    SELECT
+        COUNT(*) FILTER (WHERE status = 'draft'),
+        COUNT(*) FILTER (WHERE status = 'submitted'),
+        COUNT(*) FILTER (WHERE status = 'locked'),
+        COUNT(*) FILTER (WHERE status = 'appeal_pending'),
+        COUNT(*) FILTER (WHERE status = 'unlocked_for_edit'),
+        COUNT(*),
+        COUNT(*) FILTER (WHERE is_editable)
+    FROM student_id_cards
+) k (draft, submitted, locked, appeal_pending, unlocked, total, editable), (
+    SELECT
+        COUNT(*),
+        COUNT(*) FILTER (WHERE status = 'pending'),
+        COUNT(*) FILTER (WHERE status = 'approved'),
+        COUNT(*) FILTER (WHERE status = 'rejected'),
+        COALESCE(SUM(EXTRACT(EPOCH FROM (reviewed_at - submitted_at))) FILTER (WHERE reviewed_at IS NOT NULL), 0),
+        COUNT(*) FILTER (WHERE reviewed_at IS NOT NULL),
+        MIN(submitted_at) FILTER (WHERE status = 'pending')
+    FROM id_card_appeals
+) a (total, pending, approved, rejected, review_seconds, reviewed, oldest_pending)
+ON CONFLICT (id) DO UPDATE SET
+    draft_count = EXCLUDED.draft_count,
+    submitted_count = EXCLUDED.submitted_count,
+    locked_count = EXCLUDED.locked_count,
+    appeal_pending_count = EXCLUDED.appeal_pending_count,
+    unlocked_count = EXCLUDED.unlocked_count,
+    total_cards = EXCLUDED.total_cards,
+    editable_count = EXCLUDED.editable_count,
+    appeals_total = EXCLUDED.appeals_total,
+    appeals_pending = EXCLUDED.appeals_pending,
+    appeals_approved = EXCLUDED.appeals_approved,
+    appeals_rejected = EXCLUDED.appeals_rejected,
+    review_seconds_total = EXCLUDED.review_seconds_total,
+    reviewed_count = EXCLUDED.reviewed_count,
+    oldest_pending_at = EXCLUDED.oldest_pending_at,
+    updated_at = NOW();
+
+-- ============================================================================
+-- 9. SAMPLE DATA (Optional - for testing)
 -- ============================================================================
 
 -- Insert default template
@@ -268,5 +436,5 @@ BEGIN
     RAISE NOTICE 'ID Card Restriction Migration Completed Successfully!';
     RAISE NOTICE 'Tables Created: student_id_cards, id_card_appeals, id_card_templates';
     RAISE NOTICE 'Views Created: v_pending_appeals, v_id_card_stats';
-    RAISE NOTICE 'Triggers: Auto-create ID cards for new students';
+    RAISE NOTICE 'Triggers: Auto-create ID cards for new students, status counters';
 END $$;
@@ -42,6 +42,53 @@ async def fix_master_schema(pool: asyncpg.Pool):
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_tenant_users_email ON tenant_users(email);")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_tenant_users_tenant ON tenant_users(tenant_id);")
             
-            logger.info("Master Schema Repair Complete (tenant_users ensured).")
+            # 4. ID card templates: multi-template columns (previously ALTERed on every list request)
+            try:
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS id_card_templates (
+                        template_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                        tenant_id UUID REFERENCES tenants(tenant_id) ON DELETE CASCADE,
+                        front_bg_url TEXT,
+                        back_bg_url TEXT,
+                        field_positions JSONB,
+                        created_at TIMESTAMPTZ DEFAULT NOW()
+                    );
+                    ALTER TABLE id_card_templates ADD COLUMN IF NOT EXISTS template_name VARCHAR(100) DEFAULT 'Unnamed Template';
+                    ALTER TABLE id_card_templates ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT TRUE;
+                    ALTER TABLE id_card_templates ADD COLUMN IF NOT EXISTS is_default BOOLEAN DEFAULT FALSE;
+                    ALTER TABLE id_card_templates ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+                    ALTER TABLE id_card_templates ADD COLUMN IF NOT EXISTS front_bg_url TEXT;
+                    ALTER TABLE id_card_templates ADD COLUMN IF NOT EXISTS back_bg_url TEXT;
+                    CREATE INDEX IF NOT EXISTS idx_id_card_templates_tenant ON id_card_templates(tenant_id);
+                """)
+            except Exception as e:
+                logger.warning(f"Note on id_card_templates repair: {e}")
+
+            # 5. Background jobs table and notification_queue retry counter
+            try:
+                from app.services.jobs import JOBS_DDL
+                from app.services.notifications import NOTIFICATION_QUEUE_DDL
+                await conn.execute(JOBS_DDL)
+                await conn.execute(NOTIFICATION_QUEUE_DDL)
+            except Exception as e:
+                logger.warning(f"Note on jobs repair: {e}")
+
+            # 6. Admin tenant list: keyset pagination and trigram search indexes
+            try:
+                await conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_tenants_created_keyset ON tenants (created_at, tenant_id);
+                    CREATE INDEX IF NOT EXISTS idx_tenants_name_keyset ON tenants (name, tenant_id);
+                    CREATE INDEX IF NOT EXISTS idx_tenants_expiry_keyset ON tenants (subscription_expiry, tenant_id);
+                    CREATE INDEX IF NOT EXISTS idx_tenants_status ON tenants (status);
+                """)
+                await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+                await conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_tenants_name_trgm ON tenants USING gin (name gin_trgm_ops);
+                    CREATE INDEX IF NOT EXISTS idx_tenants_email_trgm ON tenants USING gin (contact_email gin_trgm_ops);
+                """)
+            except Exception as e:
+                logger.warning(f"Note on tenant list indexes: {e}")
+
+            logger.info("Master Schema Repair Complete (tenant_users, id_card_templates, jobs, tenant indexes ensured).")
     except Exception as e:
         logger.error(f"Master Schema Repair Failed: {e}")
@@ -27,6 +27,22 @@ async def lifespan(app: FastAPI):
     # Self-Healing: Repair Master Schema if needed
     from app.db.repair import fix_master_schema
     await fix_master_schema(pool)
+
+    # Resume deferred Cloudinary uploads left pending by the previous run
+    from app.services.upload_pipeline import RemoteUploader
+    RemoteUploader.start()
+
+    # Recount per-school storage usage and sweep orphaned media in the background
+    from app.services.media_store import MediaStore
+    MediaStore.start_reconciler(pool)
+
+    # Background jobs and notification_queue delivery (a dedicated `python -m app.worker` can take over)
+    from app.services.jobs import JobQueue
+    await JobQueue.start(pool, settings.JOB_EMBEDDED_WORKERS)
+
+    # Subscription lifecycle transitions; one leader across all processes via an advisory lock
+    from app.services.scheduler import LifecycleScheduler
+    LifecycleScheduler.start(pool)
     
     logger.info("Application started successfully")
     
@@ -34,8 +50,19 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down application...")
+    # Background work first, while the pools it uses are still open
+    from app.services.mail_dispatcher import MailDispatcher
+    await LifecycleScheduler.stop()
+    await JobQueue.stop()
+    await MailDispatcher.stop()
+    await MediaStore.stop_reconciler()
+    await RemoteUploader.stop()
     await close_master_db_pool()
     await TenantDatabaseFactory.close_all_tenant_pools()
+    from app.services.face_service import FaceService
+    FaceService.shutdown()
+    from app.services.id_card_renderer import IDCardRenderer
+    IDCardRenderer.shutdown()
     logger.info("Application shutdown complete")
 
 from slowapi import _rate_limit_exceeded_handler
@@ -133,6 +160,9 @@ app.include_router(biometrics.router, prefix=f"{settings.API_V1_STR}/biometrics"
 from app.api.v1 import refunds
 app.include_router(refunds.router, prefix=f"{settings.API_V1_STR}/refunds", tags=["refunds"])
 
+from app.api.v1 import jobs
+app.include_router(jobs.router, prefix=f"{settings.API_V1_STR}/jobs", tags=["jobs"])
+
 from app.api.v1 import moments, nexus, karma, fees, id_cards, admissions, timetable, exams, results, transport, inventory, library, communication, finance
 app.include_router(moments.router, prefix=f"{settings.API_V1_STR}/moments", tags=["moments"])
 app.include_router(nexus.router, prefix=f"{settings.API_V1_STR}/nexus", tags=["nexus"])
@@ -1,4 +1,4 @@
-from typing import Optional, Callable
+from typing import Dict, Iterable, Optional, Callable
 from datetime import datetime, timezone, timedelta
 from uuid import UUID
 import logging
@@ -19,6 +19,20 @@ def _get_cached_tenant_config(tenant_id: str):
     """Cache wrapper - actual data fetching happens in middleware"""
     return None  # Placeholder, actual caching logic in get_tenant_config
 
+# Tenant configs by lookup key (tenant id or subdomain). Module level so every
+# middleware instance shares it and lifecycle changes can invalidate it.
+_tenant_cache: Dict[str, dict] = {}
+TENANT_CACHE_TTL = 300
+
+def invalidate_tenant_cache(tenant_ids: Optional[Iterable] = None):
+    """Drop cached configs for these tenant ids (every entry when None)."""
+    if tenant_ids is None:
+        _tenant_cache.clear()
+        return
+    ids = {str(t) for t in tenant_ids}
+    for key in [k for k, v in _tenant_cache.items() if str(v["config"].tenant_id) in ids]:
+        _tenant_cache.pop(key, None)
+
 class TenantConfig:
     def __init__(self, tenant_id: UUID, name: str, status: str, 
                  subscription_expiry: datetime, supabase_url: str, supabase_key: str):
@@ -33,7 +47,6 @@ class TenantMiddleware(BaseHTTPMiddleware):
     def __init__(self, app, db_pool: asyncpg.Pool):
         super().__init__(app)
         self.db_pool = db_pool
-        self._tenant_cache = {}  # Simple dict cache, in production use Redis
 
     async def dispatch(self, request: Request, call_next: Callable) -> Response:
         # Skip tenant validation for health check and global control plane endpoints
@@ -120,10 +133,10 @@ class TenantMiddleware(BaseHTTPMiddleware):
         Retrieve tenant configuration from cache or database.
         """
         # Check cache first
-        if tenant_id in self._tenant_cache:
-            cached = self._tenant_cache[tenant_id]
+        if tenant_id in _tenant_cache:
+            cached = _tenant_cache[tenant_id]
             # Simple TTL check (5 minutes)
-            if (datetime.now(timezone.utc) - cached["cached_at"]).seconds < 300:
+            if (datetime.now(timezone.utc) - cached["cached_at"]).total_seconds() < TENANT_CACHE_TTL:
                 logger.info(f"Cache hit for tenant {tenant_id}")
                 return cached["config"]
 
@@ -160,7 +173,7 @@ class TenantMiddleware(BaseHTTPMiddleware):
         )
 
         # Update cache
-        self._tenant_cache[tenant_id] = {
+        _tenant_cache[tenant_id] = {
             "config": tenant_config,
             "cached_at": datetime.now(timezone.utc)
         }
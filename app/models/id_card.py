@@ -242,7 +242,7 @@ class TemplateResponse(BaseModel):
 
 class BulkIDCardGenerate(BaseModel):
     """Generate ID cards for multiple students"""
-    student_ids: List[UUID] = Field(..., min_items=1, max_items=500)
+    student_ids: List[UUID] = Field(..., min_items=1, max_items=10000)
     issue_date: Optional[date] = None
     expiry_date: Optional[date] = None
 
@@ -254,6 +254,8 @@ class BulkIDCardResponse(BaseModel):
     failed: int
     errors: List[Dict[str, Any]] = []
     card_ids: List[UUID] = []
+    created_student_ids: List[UUID] = []
+    skipped_student_ids: List[UUID] = []
 
 
 # ============================================================================
@@ -0,0 +1,215 @@
+"""
+Exam Analytics Service
+Vectorized statistics over an exam's marks matrix (students x papers).
+The matrix is loaded once per exam and every metric is computed column-wise
+with NumPy; results are cached per exam until marks change in this process,
+and for at most EXAM_ANALYTICS_TTL seconds so other workers' changes show up.
+"""
+
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+import logging
+import time
+import warnings
+import numpy as np
+
+from app.core.config import settings
+from app.services.grading import CompiledGradeScale, DEFAULT_SCALE
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# (tenant_id, exam_id, class_name) -> (expires_at, analytics payload)
+_MAX_CACHED = 256
+_analytics_cache: Dict[Tuple[str, str, Optional[str]], Tuple[float, dict]] = {}
+
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+def get_cached_analytics(tenant_id, exam_id, class_name: Optional[str]) -> Optional[dict]:
+    key = (str(tenant_id), str(exam_id), class_name)
+    cached = _analytics_cache.get(key)
+    if cached is None:
+        return None
+    if cached[0] <= time.monotonic():
+        _analytics_cache.pop(key, None)
+        return None
+    return cached[1]
+
+
+def cache_analytics(tenant_id, exam_id, class_name: Optional[str], payload: dict):
+    if len(_analytics_cache) >= _MAX_CACHED:
+        # Drop the oldest entry (dicts keep insertion order)
+        _analytics_cache.pop(next(iter(_analytics_cache)))
+    _analytics_cache[(str(tenant_id), str(exam_id), class_name)] = (time.monotonic() + settings.EXAM_ANALYTICS_TTL, payload)
+
+
+def invalidate_exam_analytics(tenant_id, exam_id):
+    """Drop every cached view of an exam; call whenever its marks change."""
+    prefix = (str(tenant_id), str(exam_id))
+    for key in [k for k in _analytics_cache if k[:2] == prefix]:
+        _analytics_cache.pop(key, None)
+
+
+def invalidate_tenant_analytics(tenant_id):
+    """Drop every cached exam of a tenant (e.g. after its grade scale changes)."""
+    for key in [k for k in _analytics_cache if k[0] == str(tenant_id)]:
+        _analytics_cache.pop(key, None)
+
+
+# ============================================================================
+# MATRIX
+# ============================================================================
+
+def build_marks_matrix(papers, results) -> Tuple[List[UUID], np.ndarray]:
+    """
+    Pivot result rows into a float matrix of shape (students, papers).
+    Papers a student has no mark for are NaN.
+    """
+    paper_index = {p['paper_id']: j for j, p in enumerate(papers)}
+    student_index: Dict[UUID, int] = {}
+    rows, cols, values = [], [], []
+
+    for r in results:
+        j = paper_index.get(r['paper_id'])
+        if j is None:
+            continue
+        i = student_index.setdefault(r['student_id'], len(student_index))
+        rows.append(i)
+        cols.append(j)
+        values.append(float(r['marks_obtained']))
+
+    matrix = np.full((len(student_index), len(papers)), np.nan)
+    if values:
+        matrix[np.array(rows), np.array(cols)] = np.array(values)
+    return list(student_index), matrix
+
+
+def _pairwise_corr(a: np.ndarray, b: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """
+    Pearson correlation between every column of `a` and every column of `b`
+    over the rows where both are present (`mask` marks present cells of
+    both, NaNs in a/b already zeroed).
+    """
+    m = mask.astype(float)
+    n = m.T @ m
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sum_a = (a * m).T @ m
+        sum_b = ((b * m).T @ m).T
+        sum_aa = ((a * a) * m).T @ m
+        sum_bb = (((b * b) * m).T @ m).T
+        sum_ab = (a * m).T @ (b * m)
+
+        cov = sum_ab / n - (sum_a / n) * (sum_b / n)
+        var_a = sum_aa / n - (sum_a / n) ** 2
+        var_b = sum_bb / n - (sum_b / n) ** 2
+        corr = cov / np.sqrt(var_a * var_b)
+
+    corr[(n < 2) | ~np.isfinite(corr)] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+def _clean(values) -> list:
+    """ndarray -> JSON-friendly list (NaN -> None, rounded)."""
+    return [None if not np.isfinite(v) else round(float(v), 4) for v in np.ravel(values)]
+
+
+# ============================================================================
+# ANALYTICS
+# ============================================================================
+
+def compute_exam_analytics(papers, results, scale: CompiledGradeScale = DEFAULT_SCALE) -> dict:
+    """
+    Per-paper distribution, pass rate, grade histogram, difficulty and
+    discrimination, plus overall percentiles and subject correlations.
+    """
+    _, matrix = build_marks_matrix(papers, results)
+    n_students, n_papers = matrix.shape
+
+    totals = np.array([float(p['total_marks']) for p in papers])
+    passing = np.array([float(p['passing_marks']) for p in papers])
+
+    present = ~np.isnan(matrix)
+    marks = np.where(present, matrix, 0.0)
+    marked = present.sum(axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = marks.sum(axis=0) / marked
+        std = np.sqrt((np.where(present, matrix - mean, 0.0) ** 2).sum(axis=0) / marked)
+        lo = np.where(present, matrix, np.inf).min(axis=0, initial=np.inf)
+        hi = np.where(present, matrix, -np.inf).max(axis=0, initial=-np.inf)
+        pass_rate = ((matrix >= passing) & present).sum(axis=0) / marked
+
+        # Facility index: share of available marks students actually scored
+        difficulty = mean / totals
+
+        percentages = matrix / totals * 100
+
+    if n_students and n_papers:
+        # All-NaN columns (papers nobody sat yet) warn and yield NaN
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            paper_percentiles = np.nanpercentile(matrix, PERCENTILES, axis=0)
+    else:
+        paper_percentiles = np.full((len(PERCENTILES), n_papers), np.nan)
+
+    # Grade histogram: one searchsorted over the whole matrix
+    grade_idx = np.where(present, scale.grade_indexes(np.nan_to_num(percentages)), -1)
+    histogram = np.stack(
+        [(grade_idx == k).sum(axis=0) for k in range(len(scale.labels))], axis=1
+    ) if n_papers else np.zeros((0, len(scale.labels)), dtype=int)
+
+    # Discrimination: correlation of each paper with the rest of the student's marks
+    rest = marks.sum(axis=1, keepdims=True) - marks
+    discrimination = np.diag(_pairwise_corr(marks, rest, present)) if n_papers else np.array([])
+
+    # Correlation between subjects over students who sat both
+    correlation = _pairwise_corr(marks, marks, present) if n_papers else np.zeros((0, 0))
+
+    # Overall percentage per student over the papers they sat
+    with np.errstate(invalid='ignore', divide='ignore'):
+        overall = marks.sum(axis=1) / (present * totals).sum(axis=1) * 100
+    overall = overall[np.isfinite(overall)]
+    overall_grades = np.bincount(scale.grade_indexes(overall), minlength=len(scale.labels))
+
+    paper_stats = []
+    for j, paper in enumerate(papers):
+        paper_stats.append({
+            "paper_id": str(paper['paper_id']),
+            "subject_name": paper['subject_name'],
+            "class_name": paper['class_name'],
+            "total_marks": float(totals[j]),
+            "passing_marks": float(passing[j]),
+            "marked": int(marked[j]),
+            "mean": _clean(mean[j])[0],
+            "std": _clean(std[j])[0],
+            "min": _clean(lo[j])[0],
+            "max": _clean(hi[j])[0],
+            "percentiles": dict(zip((f"p{p}" for p in PERCENTILES), _clean(paper_percentiles[:, j]))),
+            "pass_rate": _clean(pass_rate[j])[0],
+            "difficulty": _clean(difficulty[j])[0],
+            "discrimination": _clean(discrimination[j])[0],
+            "grade_histogram": dict(zip(scale.labels, (int(c) for c in histogram[j]))),
+        })
+
+    return {
+        "students": n_students,
+        "grade_scale": scale.name,
+        "papers": paper_stats,
+        "overall": {
+            "mean_percentage": _clean(overall.mean())[0] if overall.size else None,
+            "std_percentage": _clean(overall.std())[0] if overall.size else None,
+            "percentiles": dict(zip(
+                (f"p{p}" for p in PERCENTILES),
+                _clean(np.percentile(overall, PERCENTILES)) if overall.size else [None] * len(PERCENTILES)
+            )),
+            "grade_histogram": dict(zip(scale.labels, (int(c) for c in overall_grades))),
+        },
+        "correlation": {
+            "paper_ids": [str(p['paper_id']) for p in papers],
+            "matrix": [_clean(row) for row in correlation],
+        },
+    }
@@ -0,0 +1,163 @@
+"""
+Exam Totals Service
+Materialized per-student exam totals and class ranks.
+Refreshed for the affected students whenever marks are written, so report
+cards and broadsheets read a row instead of re-aggregating exam_results.
+Rows follow students between classes: a refresh re-ranks both the class a
+student left and the one they joined. Readers never write; they ignore rows
+that no longer match a student's class and aggregate those students live.
+"""
+
+from typing import Iterable
+from uuid import UUID
+import logging
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+EXAM_TOTALS_DDL = """
+    CREATE TABLE IF NOT EXISTS exam_student_totals (
+        exam_id UUID NOT NULL REFERENCES exams(exam_id) ON DELETE CASCADE,
+        student_id UUID NOT NULL,
+        class_name VARCHAR(50),
+        section VARCHAR(50) NOT NULL DEFAULT '',
+        obtained NUMERIC(8,2) NOT NULL DEFAULT 0,
+        grand NUMERIC(8,2) NOT NULL DEFAULT 0,
+        papers_count INTEGER NOT NULL DEFAULT 0,
+        fail_count INTEGER NOT NULL DEFAULT 0,
+        rank INTEGER,
+        updated_at TIMESTAMPTZ DEFAULT NOW(),
+        PRIMARY KEY (exam_id, student_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_totals_exam_class ON exam_student_totals(exam_id, class_name, section);
+"""
+
+# A paper belongs to a student when its class matches; section-less papers cover every section
+PAPER_CLASS_MATCH = """
+    c.class_name = s.current_class
+    AND (c.section IS NULL OR c.section = '' OR c.section = s.current_section)
+"""
+
+_UPSERT_TOTALS = f"""
+    INSERT INTO exam_student_totals
+        (exam_id, student_id, class_name, section, obtained, grand, papers_count, fail_count, updated_at)
+    SELECT
+        ep.exam_id,
+        s.student_id,
+        s.current_class,
+        COALESCE(s.current_section, ''),
+        SUM(COALESCE(er.marks_obtained, 0)),
+        SUM(ep.total_marks),
+        COUNT(ep.paper_id),
+        COUNT(*) FILTER (WHERE COALESCE(er.marks_obtained, 0) < ep.passing_marks),
+        NOW()
+    FROM students s
+    JOIN classes c ON {PAPER_CLASS_MATCH}
+    JOIN exam_papers ep ON ep.class_id = c.class_id AND ep.exam_id = $1
+    LEFT JOIN exam_results er ON er.paper_id = ep.paper_id AND er.student_id = s.student_id
+    WHERE s.student_id = ANY($2::uuid[])
+    GROUP BY ep.exam_id, s.student_id, s.current_class, s.current_section
+    HAVING COUNT(er.result_id) > 0
+    ON CONFLICT (exam_id, student_id) DO UPDATE SET
+        class_name = EXCLUDED.class_name,
+        section = EXCLUDED.section,
+        obtained = EXCLUDED.obtained,
+        grand = EXCLUDED.grand,
+        papers_count = EXCLUDED.papers_count,
+        fail_count = EXCLUDED.fail_count,
+        updated_at = NOW()
+"""
+
+# Rows of the given students, returning the class/section groups they were ranked in
+_REMOVE_TOTALS = """
+    DELETE FROM exam_student_totals
+    WHERE exam_id = $1 AND student_id = ANY($2::uuid[])
+    RETURNING class_name, section
+"""
+
+# Re-rank the listed class/section groups plus those the given students now belong to
+_RERANK_CLASSES = """
+    UPDATE exam_student_totals t
+    SET rank = r.rank
+    FROM (
+        SELECT student_id,
+               RANK() OVER (PARTITION BY class_name, section ORDER BY obtained DESC) AS rank
+        FROM exam_student_totals
+        WHERE exam_id = $1
+          AND (class_name, section) IN (
+              SELECT class_name, section FROM exam_student_totals
+              WHERE exam_id = $1 AND student_id = ANY($2::uuid[])
+              UNION
+              SELECT * FROM unnest($3::text[], $4::text[])
+          )
+    ) r
+    WHERE t.exam_id = $1
+      AND t.student_id = r.student_id
+      AND t.rank IS DISTINCT FROM r.rank
+"""
+
+async def _refresh(conn: asyncpg.Connection, exam_id: UUID, student_ids: list):
+    # Replace rather than upsert: a student who changed class leaves their old group
+    previous = await conn.fetch(_REMOVE_TOTALS, exam_id, student_ids)
+    await conn.execute(_UPSERT_TOTALS, exam_id, student_ids)
+    groups = {(r["class_name"], r["section"]) for r in previous}
+    await conn.execute(_RERANK_CLASSES, exam_id, student_ids,
+                       [g[0] for g in groups], [g[1] for g in groups])
+
+
+async def refresh_exam_totals(conn: asyncpg.Connection, exam_id: UUID, student_ids: Iterable[UUID]):
+    """
+    Recompute totals for the given students and re-rank their classes.
+    Call inside the transaction that wrote the marks.
+    """
+    student_ids = list(set(student_ids))
+    if not student_ids:
+        return
+
+    try:
+        # Savepoint so a missing table does not abort the caller's transaction
+        async with conn.transaction():
+            await _refresh(conn, exam_id, student_ids)
+    except asyncpg.UndefinedTableError:
+        logger.info("exam_student_totals missing, creating it")
+        await conn.execute(EXAM_TOTALS_DDL)
+        await _refresh(conn, exam_id, student_ids)
+
+
+async def refresh_class_totals(conn: asyncpg.Connection, exam_id: UUID, class_id: UUID):
+    """A paper was added for a class: recompute totals of its students who already have marks."""
+    student_ids = await conn.fetchval(f"""
+        SELECT COALESCE(array_agg(DISTINCT er.student_id), '{{}}')
+        FROM exam_results er
+        JOIN exam_papers ep ON ep.paper_id = er.paper_id AND ep.exam_id = $1
+        JOIN students s ON s.student_id = er.student_id
+        JOIN classes c ON c.class_id = $2 AND {PAPER_CLASS_MATCH}
+    """, exam_id, class_id)
+    await refresh_exam_totals(conn, exam_id, student_ids)
+
+
+async def refresh_student_totals(conn: asyncpg.Connection, student_id: UUID):
+    """A student changed class or section: move their totals rows to the new class in every exam."""
+    try:
+        exam_ids = await conn.fetchval(
+            "SELECT COALESCE(array_agg(exam_id), '{}') FROM exam_student_totals WHERE student_id = $1",
+            student_id
+        )
+    except asyncpg.UndefinedTableError:
+        return
+    for exam_id in exam_ids:
+        await refresh_exam_totals(conn, exam_id, [student_id])
+
+
+async def rebuild_exam_totals(conn: asyncpg.Connection, exam_id: UUID) -> int:
+    """Recompute totals and ranks for every student with marks in an exam."""
+    student_ids = await conn.fetchval("""
+        SELECT COALESCE(array_agg(DISTINCT er.student_id), '{}')
+        FROM exam_results er
+        JOIN exam_papers ep ON er.paper_id = ep.paper_id
+        WHERE ep.exam_id = $1
+    """, exam_id)
+
+    async with conn.transaction():
+        await refresh_exam_totals(conn, exam_id, student_ids)
+    return len(student_ids)
@@ -0,0 +1,604 @@
+"""
+Face Index Service
+Per-tenant in-memory gallery of face encodings for /biometrics/identify.
+Encodings are held in one contiguous float32 matrix with parallel id/type
+arrays, loaded once per tenant and updated incrementally on enrollment and
+status changes. Matching is a single vectorized distance computation,
+or, for large galleries, an IVF search (k-means coarse lists, probe the
+nearest few, exact distances on the candidates).
+
+Encodings are persisted in their own `face_encodings` table as 512-byte
+little-endian float32 blobs, decoded with np.frombuffer.
+
+Every gallery change bumps a per-tenant version row in the tenant database.
+Each process checks it before using its in-memory index and reloads when
+another process has changed the gallery; its own changes are applied in
+place when nothing else happened in between.
+"""
+
+from typing import Dict, List, Optional, Sequence
+import asyncio
+import json
+import logging
+import asyncpg
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ENCODING_DIMENSIONS = 128
+ENCODING_DTYPE = np.dtype('<f4')
+# Bump when the extractor model changes; older encodings are not comparable
+ENCODING_VERSION = 1
+
+FACE_ENCODINGS_DDL = """
+    CREATE TABLE IF NOT EXISTS face_encodings (
+        person_id UUID PRIMARY KEY,
+        person_type VARCHAR(10) NOT NULL CHECK (person_type IN ('student', 'staff')),
+        encoding BYTEA NOT NULL CHECK (octet_length(encoding) = 512),
+        version SMALLINT NOT NULL DEFAULT 1,
+        updated_at TIMESTAMPTZ DEFAULT NOW()
+    );
+"""
+
+FACE_INDEX_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS face_index_version (
+        id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+        version BIGINT NOT NULL DEFAULT 0
+    );
+    INSERT INTO face_index_version (id, version) VALUES (TRUE, 0) ON CONFLICT (id) DO NOTHING;
+"""
+
+
+def encode_vector(encoding: Sequence[float]) -> bytes:
+    """128 floats -> 512-byte little-endian float32 blob."""
+    return np.asarray(encoding, dtype=ENCODING_DTYPE).reshape(ENCODING_DIMENSIONS).tobytes()
+
+
+def decode_vectors(blobs: List[bytes]) -> np.ndarray:
+    """Blobs -> (n, 128) float32 matrix, viewing one joined buffer without per-row parsing."""
+    if not blobs:
+        return np.empty((0, ENCODING_DIMENSIONS), dtype=np.float32)
+    return np.frombuffer(b"".join(blobs), dtype=ENCODING_DTYPE).reshape(-1, ENCODING_DIMENSIONS)
+
+
+def _sq_distances(points: np.ndarray, centers: np.ndarray, center_sq: np.ndarray) -> np.ndarray:
+    """(n, k) squared euclidean distances via |x|^2 - 2 x.c + |c|^2."""
+    sq = np.einsum('ij,ij->i', points, points)[:, None] - 2.0 * (points @ centers.T) + center_sq[None, :]
+    return np.maximum(sq, 0.0, out=sq)
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 12, seed: int = 0) -> np.ndarray:
+    """Plain Lloyd k-means (NumPy only); returns (k, d) float32 centroids."""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = np.argmin(_sq_distances(data, centroids, np.einsum('ij,ij->i', centroids, centroids)), axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty lists from random points so every list stays useful
+        empty = np.flatnonzero(~filled)
+        if empty.size:
+            centroids[empty] = data[rng.choice(len(data), size=empty.size, replace=False)]
+    return centroids.astype(np.float32)
+
+
+class FaceIndex:
+    """
+    Euclidean index over one tenant's enrolled faces.
+    Exact by default; with ivf_probe set, galleries of at least ivf_min_size
+    faces are partitioned into k-means lists and only the ivf_probe lists
+    nearest the query are scanned.
+    """
+
+    def __init__(self, capacity: int = 64, ivf_lists: int = 0, ivf_probe: int = 0, ivf_min_size: int = 2000):
+        capacity = max(capacity, 1)
+        self._vectors = np.zeros((capacity, ENCODING_DIMENSIONS), dtype=np.float32)
+        self._sq_norms = np.zeros(capacity, dtype=np.float32)
+        self._types = np.empty(capacity, dtype='<U7')
+        self._ids: List[str] = []
+        self._names: List[str] = []
+        self._positions: Dict[str, int] = {}
+
+        # IVF state: centroids plus each row's list, kept in step with the rows
+        self.ivf_lists = ivf_lists
+        self.ivf_probe = ivf_probe
+        self.ivf_min_size = ivf_min_size
+        self._centroids: Optional[np.ndarray] = None
+        self._centroid_sq: Optional[np.ndarray] = None
+        self._lists = np.full(capacity, -1, dtype=np.int32)
+        self._trained_size = 0
+        self._changes_since_train = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, person_id) -> bool:
+        return str(person_id) in self._positions
+
+    # ------------------------------------------------------------------
+    # Mutation
+    # ------------------------------------------------------------------
+
+    def _grow(self, needed: int):
+        capacity = self._vectors.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        vectors = np.zeros((new_capacity, ENCODING_DIMENSIONS), dtype=np.float32)
+        vectors[:capacity] = self._vectors
+        sq_norms = np.zeros(new_capacity, dtype=np.float32)
+        sq_norms[:capacity] = self._sq_norms
+        types = np.empty(new_capacity, dtype='<U7')
+        types[:capacity] = self._types
+        lists = np.full(new_capacity, -1, dtype=np.int32)
+        lists[:capacity] = self._lists
+        self._vectors, self._sq_norms, self._types, self._lists = vectors, sq_norms, types, lists
+
+    def upsert(self, person_id, person_type: str, name: str, encoding: Sequence[float]):
+        """Add or replace one person's encoding."""
+        key = str(person_id)
+        vector = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_DIMENSIONS)
+
+        row = self._positions.get(key)
+        if row is None:
+            row = len(self._ids)
+            self._grow(row + 1)
+            self._ids.append(key)
+            self._names.append(name)
+            self._positions[key] = row
+        else:
+            self._names[row] = name
+
+        self._vectors[row] = vector
+        self._sq_norms[row] = float(vector @ vector)
+        self._types[row] = person_type
+        if self._centroids is not None:
+            # Incremental: file the new face under its nearest list; retrain only after heavy churn
+            self._lists[row] = self._nearest_lists(vector, 1)[0]
+            self._changes_since_train += 1
+
+    def bulk_load(self, person_ids: List, person_types: List[str], names: List[str], matrix: np.ndarray):
+        """Replace the whole gallery from pre-built arrays (used on first load)."""
+        count = len(person_ids)
+        self._grow(count)
+        self._ids = [str(pid) for pid in person_ids]
+        self._names = list(names)
+        self._positions = {pid: row for row, pid in enumerate(self._ids)}
+        if count:
+            matrix = np.asarray(matrix, dtype=np.float32).reshape(count, ENCODING_DIMENSIONS)
+            self._vectors[:count] = matrix
+            self._sq_norms[:count] = np.einsum('ij,ij->i', matrix, matrix)
+            self._types[:count] = person_types
+        self._centroids = None
+
+    def remove(self, person_id) -> bool:
+        """Drop a person; the last row is moved into the hole (O(1))."""
+        key = str(person_id)
+        row = self._positions.pop(key, None)
+        if row is None:
+            return False
+
+        last = len(self._ids) - 1
+        if row != last:
+            moved = self._ids[last]
+            self._vectors[row] = self._vectors[last]
+            self._sq_norms[row] = self._sq_norms[last]
+            self._types[row] = self._types[last]
+            self._lists[row] = self._lists[last]
+            self._ids[row] = moved
+            self._names[row] = self._names[last]
+            self._positions[moved] = row
+
+        self._ids.pop()
+        self._names.pop()
+        self._changes_since_train += 1
+        return True
+
+    def rename(self, person_id, name: str):
+        row = self._positions.get(str(person_id))
+        if row is not None:
+            self._names[row] = name
+
+    # ------------------------------------------------------------------
+    # IVF
+    # ------------------------------------------------------------------
+
+    @property
+    def ivf_active(self) -> bool:
+        return self.ivf_probe > 0 and len(self._ids) >= self.ivf_min_size
+
+    def train(self):
+        """(Re)build the coarse lists from the current gallery."""
+        count = len(self._ids)
+        n_lists = self.ivf_lists or max(int(np.sqrt(count)), 1)
+        vectors = self._vectors[:count]
+        self._centroids = kmeans(vectors, n_lists)
+        self._centroid_sq = np.einsum('ij,ij->i', self._centroids, self._centroids)
+        self._lists[:count] = np.argmin(_sq_distances(vectors, self._centroids, self._centroid_sq), axis=1)
+        self._trained_size = count
+        self._changes_since_train = 0
+        logger.info(f"Trained face IVF: {count} faces in {len(self._centroids)} lists")
+
+    def _needs_training(self) -> bool:
+        if self._centroids is None:
+            return True
+        # Centroids drift as faces are added/removed; refresh once churn reaches half the trained size
+        return self._changes_since_train * 2 >= max(self._trained_size, 1)
+
+    def _nearest_lists(self, query: np.ndarray, n: int) -> np.ndarray:
+        sq = self._centroid_sq - 2.0 * (self._centroids @ query)
+        n = min(n, len(sq))
+        return np.argpartition(sq, n - 1)[:n]
+
+    def candidates(self, encoding: Sequence[float]) -> np.ndarray:
+        """Rows in the ivf_probe lists closest to the query."""
+        if self._needs_training():
+            self.train()
+        query = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_DIMENSIONS)
+        probed = np.zeros(len(self._centroids), dtype=bool)
+        probed[self._nearest_lists(query, self.ivf_probe)] = True
+        return np.flatnonzero(probed[self._lists[:len(self._ids)]])
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def _person(self, row: int) -> dict:
+        return {
+            "user_id": self._ids[row],
+            "name": self._names[row],
+            "user_type": str(self._types[row]),
+        }
+
+    def _match(self, row: int, distance: float) -> dict:
+        return {**self._person(row), "distance": float(distance)}
+
+    def distances(self, encoding: Sequence[float], person_types: Optional[Sequence[str]] = None,
+                  rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Euclidean distance from `encoding` to every enrolled face, or to the
+        given rows only (inf for filtered types).
+        """
+        if rows is None:
+            rows = slice(0, len(self._ids))
+        query = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_DIMENSIONS)
+
+        # |x - q|^2 = |x|^2 - 2 x.q + |q|^2 ; one mat-vec for the whole gallery
+        sq = self._sq_norms[rows] - 2.0 * (self._vectors[rows] @ query) + float(query @ query)
+        np.maximum(sq, 0.0, out=sq)
+        if person_types is not None:
+            sq[~np.isin(self._types[rows], list(person_types))] = np.inf
+        return np.sqrt(sq)
+
+    def search(self, encoding: Sequence[float], tolerance: float = 0.5,
+               person_types: Optional[Sequence[str]] = None, exact: bool = False) -> Optional[dict]:
+        """Closest enrolled face within `tolerance`, or None."""
+        if not self._ids:
+            return None
+
+        rows = None
+        if self.ivf_active and not exact:
+            rows = self.candidates(encoding)
+            if not rows.size:
+                return None
+
+        # Candidates are re-ranked with exact distances
+        distances = self.distances(encoding, person_types, rows)
+        best = int(np.argmin(distances))
+        if distances[best] <= tolerance:
+            return self._match(best if rows is None else int(rows[best]), distances[best])
+        return None
+
+
+    def search_many(self, encodings: np.ndarray, tolerance: float = 0.5,
+                    person_types: Optional[Sequence[str]] = None) -> List[Optional[dict]]:
+        """
+        Match several faces at once (e.g. a group photo). Each enrolled person
+        is assigned to at most one face, the closest; other faces that would
+        have matched them come back as None.
+        """
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIMENSIONS)
+        count = len(self._ids)
+        if not count or not len(queries):
+            return [None] * len(queries)
+
+        if self.ivf_active:
+            best_rows, best_dist = [], []
+            for q in queries:
+                rows = self.candidates(q)
+                if not rows.size:
+                    best_rows.append(-1)
+                    best_dist.append(np.inf)
+                    continue
+                d = self.distances(q, person_types, rows)
+                j = int(np.argmin(d))
+                best_rows.append(int(rows[j]))
+                best_dist.append(float(d[j]))
+            best_rows, best_dist = np.array(best_rows), np.array(best_dist)
+        else:
+            # One (faces x gallery) matmul for the whole batch
+            sq = (self._sq_norms[:count][None, :] - 2.0 * (queries @ self._vectors[:count].T)
+                  + np.einsum('ij,ij->i', queries, queries)[:, None])
+            np.maximum(sq, 0.0, out=sq)
+            if person_types is not None:
+                sq[:, ~np.isin(self._types[:count], list(person_types))] = np.inf
+            best_rows = np.argmin(sq, axis=1)
+            best_dist = np.sqrt(sq[np.arange(len(queries)), best_rows])
+
+        matches: List[Optional[dict]] = [None] * len(queries)
+        claimed = set()
+        for i in np.argsort(best_dist):
+            if best_dist[i] > tolerance:
+                break
+            row = int(best_rows[i])
+            if row in claimed:
+                continue
+            claimed.add(row)
+            matches[i] = self._match(row, best_dist[i])
+        return matches
+
+
+    def duplicates(self, encoding: Sequence[float], threshold: float, exclude=None) -> List[dict]:
+        """Every enrolled face within `threshold` of `encoding` (exact), closest first."""
+        if not self._ids:
+            return []
+        distances = self.distances(encoding)
+        if exclude is not None and str(exclude) in self._positions:
+            distances[self._positions[str(exclude)]] = np.inf
+        rows = np.flatnonzero(distances <= threshold)
+        return [self._match(int(r), distances[r]) for r in rows[np.argsort(distances[rows])]]
+
+    def duplicate_pairs(self, threshold: float, limit: int = 500, block: int = 1024) -> List[dict]:
+        """
+        The `limit` closest pairs of enrolled faces under `threshold`, computed
+        in row blocks so memory stays at block x gallery floats. Works on a
+        snapshot of the gallery, so it may run in a thread.
+        """
+        count = len(self._ids)
+        ids, names, types = list(self._ids[:count]), list(self._names[:count]), self._types[:count].copy()
+        vectors, sq_norms = self._vectors[:count].copy(), self._sq_norms[:count].copy()
+        limit_sq = threshold * threshold
+        found_sq = np.empty(0, dtype=np.float32)
+        found_i = np.empty(0, dtype=np.int64)
+        found_j = np.empty(0, dtype=np.int64)
+
+        for start in range(0, count, block):
+            stop = min(start + block, count)
+            sq = sq_norms[start:stop, None] - 2.0 * (vectors[start:stop] @ vectors.T) + sq_norms[None, :]
+            # Upper triangle only: each pair once, never a face with itself
+            sq[np.arange(stop - start)[:, None] >= np.arange(count)[None, :] - start] = np.inf
+            i, j = np.nonzero(sq <= limit_sq)
+            found_sq = np.concatenate([found_sq, sq[i, j]])
+            found_i = np.concatenate([found_i, i + start])
+            found_j = np.concatenate([found_j, j])
+            if len(found_sq) > limit:
+                # Keep only the closest `limit` so far
+                keep = np.argpartition(found_sq, limit)[:limit]
+                found_sq, found_i, found_j = found_sq[keep], found_i[keep], found_j[keep]
+
+        def person(row: int) -> dict:
+            return {"user_id": ids[row], "name": names[row], "user_type": str(types[row])}
+
+        order = np.argsort(found_sq)
+        return [
+            {
+                "first": person(int(found_i[k])),
+                "second": person(int(found_j[k])),
+                "distance": float(np.sqrt(max(found_sq[k], 0.0))),
+            }
+            for k in order
+        ]
+
+
+async def _gallery_version(conn: asyncpg.Connection, bump: bool = False) -> int:
+    query = ("UPDATE face_index_version SET version = version + 1 RETURNING version" if bump
+             else "SELECT version FROM face_index_version")
+    try:
+        version = await conn.fetchval(query)
+    except asyncpg.UndefinedTableError:
+        await conn.execute(FACE_INDEX_VERSION_DDL)
+        version = await conn.fetchval(query)
+    if version is None:
+        await conn.execute(FACE_INDEX_VERSION_DDL)
+        version = await conn.fetchval(query)
+    return version
+
+
+class FaceIndexRegistry:
+    """
+    Process-wide registry of tenant face indexes.
+    Each tenant's index is loaded from the database on first use and reloaded
+    whenever the tenant's gallery version shows a change made elsewhere.
+    """
+
+    _indexes: Dict[str, FaceIndex] = {}
+    _versions: Dict[str, int] = {}
+    _locks: Dict[str, asyncio.Lock] = {}
+
+    @classmethod
+    async def get(cls, tenant_id, pool: asyncpg.Pool) -> FaceIndex:
+        key = str(tenant_id)
+        async with pool.acquire() as conn:
+            version = await _gallery_version(conn)
+        index = cls._indexes.get(key)
+        if index is not None and cls._versions.get(key) == version:
+            return index
+
+        lock = cls._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            if key not in cls._indexes or cls._versions.get(key) != version:
+                # Version read before the load: a change made meanwhile triggers another reload
+                cls._indexes[key] = await load_face_index(pool)
+                cls._versions[key] = version
+                logger.info(f"Loaded face index for tenant {key} ({len(cls._indexes[key])} faces, version {version})")
+            return cls._indexes[key]
+
+    @classmethod
+    async def changed(cls, tenant_id, conn: asyncpg.Connection) -> Optional[FaceIndex]:
+        """
+        Record a gallery change so other processes reload. Returns the local
+        index if it is otherwise current and the caller should patch it in
+        place, or None (it has been dropped and reloads on next use).
+        """
+        key = str(tenant_id)
+        known = cls._versions.get(key)
+        version = await _gallery_version(conn, bump=True)
+        index = cls._indexes.get(key)
+        if index is not None and known is not None and version == known + 1 and cls._versions.get(key) == known:
+            cls._versions[key] = version
+            return index
+        cls._indexes.pop(key, None)
+        cls._versions.pop(key, None)
+        return None
+
+    @classmethod
+    async def remove(cls, tenant_id, person_id, conn: asyncpg.Connection):
+        index = await cls.changed(tenant_id, conn)
+        if index is not None:
+            index.remove(person_id)
+
+    @classmethod
+    async def rename(cls, tenant_id, person_id, name: str, conn: asyncpg.Connection):
+        index = await cls.changed(tenant_id, conn)
+        if index is not None:
+            index.rename(person_id, name)
+
+    @classmethod
+    async def invalidate(cls, tenant_id, conn: asyncpg.Connection):
+        """Drop the index here and in every other process."""
+        await cls.changed(tenant_id, conn)
+        cls._indexes.pop(str(tenant_id), None)
+        cls._versions.pop(str(tenant_id), None)
+
+
+def without_biometrics(row) -> dict:
+    """Record -> dict minus the legacy JSON encoding column (never sent to clients)."""
+    data = dict(row)
+    data.pop("face_encoding", None)
+    return data
+
+
+async def migrate_legacy_encodings(conn: asyncpg.Connection) -> int:
+    """
+    Create face_encodings and move any JSON encodings left in the legacy
+    students/staff.face_encoding columns into it (clearing the old copies).
+    """
+    await conn.execute(FACE_ENCODINGS_DDL)
+
+    moved = 0
+    for table_name, id_column, person_type in (("students", "student_id", "student"), ("staff", "staff_id", "staff")):
+        has_column = await conn.fetchval("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = $1 AND column_name = 'face_encoding'
+        """, table_name)
+        if not has_column:
+            continue
+
+        rows = await conn.fetch(
+            f"SELECT {id_column} as id, face_encoding FROM {table_name} WHERE face_encoding IS NOT NULL"
+        )
+        if not rows:
+            continue
+
+        records = [
+            (r["id"], person_type, encode_vector(json.loads(r["face_encoding"])), ENCODING_VERSION)
+            for r in rows
+        ]
+        async with conn.transaction():
+            await conn.executemany("""
+                INSERT INTO face_encodings (person_id, person_type, encoding, version)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT (person_id) DO NOTHING
+            """, records)
+            await conn.execute(f"UPDATE {table_name} SET face_encoding = NULL WHERE face_encoding IS NOT NULL")
+        moved += len(records)
+
+    if moved:
+        logger.info(f"Migrated {moved} legacy face encodings to face_encodings")
+    return moved
+
+
+async def save_encoding(conn: asyncpg.Connection, person_id, person_type: str, encoding: Sequence[float]):
+    """Insert or replace one person's encoding."""
+    query = """
+        INSERT INTO face_encodings (person_id, person_type, encoding, version, updated_at)
+        VALUES ($1, $2, $3, $4, NOW())
+        ON CONFLICT (person_id) DO UPDATE SET
+            person_type = EXCLUDED.person_type,
+            encoding = EXCLUDED.encoding,
+            version = EXCLUDED.version,
+            updated_at = NOW()
+    """
+    blob = encode_vector(encoding)
+    try:
+        await conn.execute(query, person_id, person_type, blob, ENCODING_VERSION)
+    except asyncpg.UndefinedTableError:
+        await migrate_legacy_encodings(conn)
+        await conn.execute(query, person_id, person_type, blob, ENCODING_VERSION)
+
+
+async def fetch_encoding(conn: asyncpg.Connection, person_id) -> Optional[np.ndarray]:
+    try:
+        blob = await conn.fetchval(
+            "SELECT encoding FROM face_encodings WHERE person_id = $1 AND version = $2",
+            person_id, ENCODING_VERSION
+        )
+    except asyncpg.UndefinedTableError:
+        return None
+    return decode_vectors([blob])[0] if blob else None
+
+
+async def has_encoding(conn: asyncpg.Connection, person_id) -> bool:
+    """Whether the person is enrolled at all (any encoding version)."""
+    try:
+        return bool(await conn.fetchval("SELECT 1 FROM face_encodings WHERE person_id = $1", person_id))
+    except asyncpg.UndefinedTableError:
+        return False
+
+
+def new_face_index(capacity: int = 64) -> FaceIndex:
+    """Empty index configured from settings (FACE_INDEX_MODE=ivf enables approximate search)."""
+    if settings.FACE_INDEX_MODE == "ivf":
+        return FaceIndex(
+            capacity,
+            ivf_lists=settings.FACE_IVF_LISTS,
+            ivf_probe=settings.FACE_IVF_PROBE,
+            ivf_min_size=settings.FACE_IVF_MIN_GALLERY,
+        )
+    return FaceIndex(capacity)
+
+
+async def load_face_index(pool: asyncpg.Pool) -> FaceIndex:
+    """Build a tenant's index from every active, enrolled student and staff member."""
+    query = """
+        SELECT fe.person_id, fe.person_type, COALESCE(s.full_name, st.full_name) as full_name, fe.encoding
+        FROM face_encodings fe
+        LEFT JOIN students s
+            ON fe.person_type = 'student' AND s.student_id = fe.person_id AND s.status = 'active'
+        LEFT JOIN staff st
+            ON fe.person_type = 'staff' AND st.staff_id = fe.person_id AND st.status = 'active'
+        WHERE fe.version = $1
+          AND (s.student_id IS NOT NULL OR st.staff_id IS NOT NULL)
+    """
+    async with pool.acquire() as conn:
+        try:
+            rows = await conn.fetch(query, ENCODING_VERSION)
+        except asyncpg.UndefinedTableError:
+            await migrate_legacy_encodings(conn)
+            rows = await conn.fetch(query, ENCODING_VERSION)
+
+    index = new_face_index(capacity=len(rows) + 64)
+    index.bulk_load(
+        [r["person_id"] for r in rows],
+        [r["person_type"] for r in rows],
+        [r["full_name"] for r in rows],
+        decode_vectors([r["encoding"] for r in rows])
+    )
+    return index
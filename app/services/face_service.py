@@ -1,4 +1,10 @@
+import asyncio
+import io
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -7,30 +13,182 @@ FACE_LIB_AVAILABLE = False
 try:
     import numpy as np
     import face_recognition
+    from PIL import Image
     FACE_LIB_AVAILABLE = True
 except ImportError as e:
     logger.warning(f"Face ID libraries not found ({e}). Face ID features will be disabled.")
     # Define dummy numpy if needed or handle logic checks later
 
 
+class FaceServiceBusy(Exception):
+    """Raised when an extraction could not start within FACE_QUEUE_TIMEOUT."""
+
+
+def _detect_faces(image_bytes: bytes, model: str, num_jitters: int, max_side: int,
+                  all_faces: bool = False) -> List[dict]:
+    """
+    Decode, downscale and encode one image.
+    Returns {"encoding", "box"} per detected face (only the first unless
+    all_faces); boxes are (top, right, bottom, left) in original pixels.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    image = image.convert("RGB")
+    scale = 1.0
+    # Detection cost grows with pixel count; phone photos are far larger than needed
+    if max_side and max(image.size) > max_side:
+        original_side = max(image.size)
+        image.thumbnail((max_side, max_side))
+        scale = original_side / max(image.size)
+    pixels = np.asarray(image)
+
+    locations = face_recognition.face_locations(pixels, model=model)
+    if not locations:
+        return []
+    if not all_faces:
+        locations = locations[:1]
+
+    encodings = face_recognition.face_encodings(pixels, known_face_locations=locations, num_jitters=num_jitters)
+    return [
+        {"encoding": e.tolist(), "box": [int(round(v * scale)) for v in box]}
+        for e, box in zip(encodings, locations)
+    ]
+
+
+def _extract_encodings(image_bytes: bytes, model: str, num_jitters: int, max_side: int,
+                       all_faces: bool = False) -> List[List[float]]:
+    """Worker-process entry point: encodings of one image."""
+    return [face["encoding"] for face in _detect_faces(image_bytes, model, num_jitters, max_side, all_faces)]
+
+
+def _extract_batch(images: List[bytes], model: str, num_jitters: int, max_side: int) -> List[List[dict]]:
+    """Worker-process entry point: every face of every image in one call."""
+    results = []
+    for image_bytes in images:
+        try:
+            results.append(_detect_faces(image_bytes, model, num_jitters, max_side, all_faces=True))
+        except Exception as e:
+            # One unreadable image should not sink the rest of the batch
+            logger.error(f"Error processing face encoding: {e}")
+            results.append([])
+    return results
+
+
 class FaceService:
+    _executor: Optional[ProcessPoolExecutor] = None
+    _tenant_slots: Dict[str, asyncio.Semaphore] = {}
+    _inflight: Optional[asyncio.Semaphore] = None
+
+    @classmethod
+    def _get_executor(cls) -> ProcessPoolExecutor:
+        if cls._executor is None:
+            cls._executor = ProcessPoolExecutor(max_workers=settings.FACE_WORKERS)
+            logger.info(f"Started face extraction pool ({settings.FACE_WORKERS} workers, model={settings.FACE_MODEL})")
+        return cls._executor
+
+    @classmethod
+    def shutdown(cls):
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
+
+    @classmethod
+    async def _run(cls, tenant_id, func, *args, timeout_scale: int = 1):
+        """
+        Run `func` in the process pool without blocking the event loop.
+        Each tenant may have at most FACE_TENANT_CONCURRENCY extractions in
+        flight, and the pool at most FACE_MAX_INFLIGHT overall; a request that
+        cannot get a slot (or a pool worker) within FACE_QUEUE_TIMEOUT seconds
+        raises FaceServiceBusy. Slots are held until the pool task itself
+        finishes, so a caller that timed out does not free capacity that a
+        still-running extraction is using.
+        """
+        if not FACE_LIB_AVAILABLE:
+            raise ImportError("face_recognition library is not installed.")
+
+        key = str(tenant_id)
+        slots = cls._tenant_slots.setdefault(key, asyncio.Semaphore(settings.FACE_TENANT_CONCURRENCY))
+        if cls._inflight is None:
+            cls._inflight = asyncio.Semaphore(settings.FACE_MAX_INFLIGHT)
+        inflight = cls._inflight
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.FACE_QUEUE_TIMEOUT
+
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=settings.FACE_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise FaceServiceBusy("Too many face scans in progress for this school")
+        try:
+            await asyncio.wait_for(inflight.acquire(), timeout=max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            slots.release()
+            raise FaceServiceBusy("Face recognition service is busy, please retry")
+
+        def release():
+            inflight.release()
+            slots.release()
+
+        try:
+            task = cls._get_executor().submit(func, *args)
+        except Exception:
+            release()
+            raise
+
+        def on_done(_):
+            try:
+                loop.call_soon_threadsafe(release)
+            except RuntimeError:
+                pass  # Event loop already closed (shutdown)
+
+        task.add_done_callback(on_done)
+        try:
+            # The remaining budget covers waiting for a free worker plus the extraction itself.
+            # On timeout a task that has not started is cancelled; a running one keeps its slots.
+            budget = max(deadline - loop.time(), 0) + settings.FACE_EXTRACT_TIMEOUT * timeout_scale
+            return await asyncio.wait_for(asyncio.wrap_future(task), timeout=budget)
+        except asyncio.TimeoutError:
+            raise FaceServiceBusy("Face recognition service is busy, please retry")
+
+    @classmethod
+    async def extract_encodings(cls, image_bytes: bytes, tenant_id=None, all_faces: bool = False) -> List[List[float]]:
+        """Encodings of one image, extracted in the process pool."""
+        try:
+            return await cls._run(
+                tenant_id, _extract_encodings, image_bytes,
+                settings.FACE_MODEL, settings.FACE_NUM_JITTERS, settings.FACE_MAX_IMAGE_SIDE, all_faces
+            )
+        except (FaceServiceBusy, ImportError):
+            raise
+        except Exception as e:
+            logger.error(f"Error processing face encoding: {e}")
+            return []
+
+    @classmethod
+    async def extract_batch(cls, images: List[bytes], tenant_id=None) -> List[List[dict]]:
+        """All faces ({"encoding", "box"}) of several images in a single worker call."""
+        return await cls._run(
+            tenant_id, _extract_batch, images,
+            settings.FACE_MODEL, settings.FACE_NUM_JITTERS, settings.FACE_MAX_IMAGE_SIDE,
+            timeout_scale=max(len(images), 1)
+        )
+
+    @classmethod
+    async def encode_upload(cls, image_bytes: bytes, tenant_id=None) -> Optional[List[float]]:
+        """First face's encoding from an uploaded image, or None."""
+        encodings = await cls.extract_encodings(image_bytes, tenant_id)
+        return encodings[0] if encodings else None
+
     @staticmethod
     def get_encoding(image_file):
+        """Synchronous extraction in the calling process (scripts and tools)."""
         if not FACE_LIB_AVAILABLE:
             raise ImportError("face_recognition library is not installed.")
-        
+
         try:
-            # Load image from file-like object
-            image = face_recognition.load_image_file(image_file)
-            
-            # Find all face encodings in the current image
-            encodings = face_recognition.face_encodings(image)
-            
-            if not encodings:
-                return None
-                
+            encodings = _extract_encodings(
+                image_file.read(), settings.FACE_MODEL, settings.FACE_NUM_JITTERS, settings.FACE_MAX_IMAGE_SIDE
+            )
             # Return the first face found (assuming single person enrollment)
-            return encodings[0].tolist() 
+            return encodings[0] if encodings else None
         except Exception as e:
             logger.error(f"Error processing face encoding: {e}")
             return None
@@ -55,13 +213,13 @@ class FaceService:
 
             # Calculate euclidean distances
             distances = face_recognition.face_distance(known_encodings, unknown_face_encoding)
-            
+
             # Find the best match (smallest distance)
             best_match_index = np.argmin(distances)
-            
+
             if distances[best_match_index] <= tolerance:
                 return best_match_index
-            
+
             return None
         except Exception as e:
             logger.error(f"Error comparing faces: {e}")
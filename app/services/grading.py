@@ -0,0 +1,138 @@
+"""
+Grading Service
+Per-tenant grade scales compiled into sorted boundary arrays.
+A scale is loaded per tenant and cached for GRADE_SCALE_CACHE_TTL seconds
+(dropped at once in the process that edits it), then applied with binary
+search for a single percentage or np.searchsorted across whole result sets.
+"""
+
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+import json
+import logging
+import time
+import asyncpg
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+GRADE_SCALES_DDL = """
+    CREATE TABLE IF NOT EXISTS grade_scales (
+        scale_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        name VARCHAR(100) NOT NULL,
+        bands JSONB NOT NULL,
+        is_default BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMPTZ DEFAULT NOW(),
+        updated_at TIMESTAMPTZ DEFAULT NOW()
+    );
+"""
+
+# The historical hard-coded ladder
+DEFAULT_BANDS = [
+    {"label": "F", "min_score": 0, "max_score": 50, "gpa": 0.0},
+    {"label": "D", "min_score": 50, "max_score": 60, "gpa": 1.0},
+    {"label": "C", "min_score": 60, "max_score": 70, "gpa": 2.0},
+    {"label": "B", "min_score": 70, "max_score": 80, "gpa": 3.0},
+    {"label": "A", "min_score": 80, "max_score": 90, "gpa": 3.5},
+    {"label": "A+", "min_score": 90, "max_score": 100, "gpa": 4.0},
+]
+
+
+class CompiledGradeScale:
+    """A grade scale reduced to sorted lower bounds plus parallel label/GPA arrays."""
+
+    def __init__(self, name: str, bands: List[dict], scale_id=None):
+        ordered = sorted(bands, key=lambda b: float(b["min_score"]))
+        self.scale_id = scale_id
+        self.name = name
+        self.bands = ordered
+        self.labels = [b["label"] for b in ordered]
+        self.gpas = np.array([float(b.get("gpa") or 0) for b in ordered])
+        self._bounds = [float(b["min_score"]) for b in ordered]
+        self._bounds_array = np.array(self._bounds)
+
+    def index(self, percentage: float) -> int:
+        # Scores below the lowest band fall into it
+        return max(bisect_right(self._bounds, percentage) - 1, 0)
+
+    def grade(self, percentage: float) -> str:
+        return self.labels[self.index(percentage)]
+
+    def gpa(self, percentage: float) -> float:
+        return float(self.gpas[self.index(percentage)])
+
+    def grade_indexes(self, percentages: np.ndarray) -> np.ndarray:
+        """Vectorized band lookup for an array of percentages."""
+        idx = np.searchsorted(self._bounds_array, percentages, side='right') - 1
+        return np.clip(idx, 0, len(self.labels) - 1)
+
+    def to_dict(self) -> dict:
+        return {
+            "scale_id": str(self.scale_id) if self.scale_id else None,
+            "name": self.name,
+            "bands": self.bands,
+        }
+
+
+DEFAULT_SCALE = CompiledGradeScale("Default", DEFAULT_BANDS)
+
+# tenant_id -> (expires_at, compiled default scale)
+_scale_cache: Dict[str, Tuple[float, CompiledGradeScale]] = {}
+# Bumped on invalidation so a load racing an edit is not cached
+_scale_generation: Dict[str, int] = {}
+
+
+def validate_bands(bands: List[dict]) -> Optional[str]:
+    """Return an error message if bands overlap or are malformed, else None."""
+    if not bands:
+        return "A grade scale needs at least one band"
+    ordered = sorted(bands, key=lambda b: float(b["min_score"]))
+    labels = set()
+    for prev, band in zip([None] + ordered[:-1], ordered):
+        if float(band["min_score"]) >= float(band["max_score"]):
+            return f"Band {band['label']}: min_score must be below max_score"
+        if prev is not None and float(band["min_score"]) < float(prev["max_score"]):
+            return f"Bands {prev['label']} and {band['label']} overlap"
+        if band["label"] in labels:
+            return f"Duplicate band label {band['label']}"
+        labels.add(band["label"])
+    return None
+
+
+def invalidate_grade_scale(tenant_id):
+    key = str(tenant_id)
+    _scale_cache.pop(key, None)
+    _scale_generation[key] = _scale_generation.get(key, 0) + 1
+
+
+async def get_grade_scale(conn: asyncpg.Connection, tenant_id) -> CompiledGradeScale:
+    """Compiled default grade scale for a tenant (cached until the scales change or the TTL passes)."""
+    key = str(tenant_id)
+    cached = _scale_cache.get(key)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+
+    generation = _scale_generation.get(key, 0)
+
+    try:
+        row = await conn.fetchrow("""
+            SELECT scale_id, name, bands FROM grade_scales
+            WHERE is_default = TRUE
+            ORDER BY updated_at DESC
+            LIMIT 1
+        """)
+    except asyncpg.UndefinedTableError:
+        row = None
+
+    if row:
+        bands = row['bands']
+        bands = json.loads(bands) if isinstance(bands, str) else bands
+        scale = CompiledGradeScale(row['name'], bands, row['scale_id'])
+    else:
+        scale = DEFAULT_SCALE
+
+    if _scale_generation.get(key, 0) == generation:
+        _scale_cache[key] = (time.monotonic() + settings.GRADE_SCALE_CACHE_TTL, scale)
+    return scale
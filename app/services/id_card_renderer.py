@@ -0,0 +1,438 @@
+"""
+ID Card Renderer
+Server-side composition of ID cards onto A4 print sheets.
+Cards are drawn from an id_card_templates row (front/back backgrounds plus
+field_positions) in a process pool, nine to a sheet, and written to a PDF
+one page at a time so a whole class streams as it is produced.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import asyncio
+import io
+import logging
+import os
+
+import httpx
+
+from app.core.config import settings
+from app.services.media_cache import media_cache
+from app.services.media_store import object_path, parse_object_name
+
+logger = logging.getLogger(__name__)
+
+RENDER_AVAILABLE = False
+try:
+    from PIL import Image, ImageDraw, ImageFont, ImageOps
+    import qrcode
+    RENDER_AVAILABLE = True
+except ImportError as e:
+    logger.warning(f"ID card rendering libraries not found ({e}). Print sheets will be disabled.")
+
+DPI = 300
+CARD_SIZE = (638, 1011)        # CR80 portrait, 2.125" x 3.375"
+SHEET_SIZE = (2480, 3508)      # A4 portrait
+GRID = (3, 3)
+CARDS_PER_SHEET = GRID[0] * GRID[1]
+SHEET_JPEG_QUALITY = 90
+
+# Positions are fractions of the card; mirrors the dashboard preview.
+# field_positions on a template overrides entries by key or adds new text fields.
+DEFAULT_LAYOUT = {
+    "school_name": {"side": "front", "type": "text", "field": "school_name", "x": 0.92, "y": 0.05, "size": 0.032, "align": "right", "bold": True, "upper": True},
+    "logo": {"side": "front", "type": "image", "field": "logo", "x": 0.07, "y": 0.04, "w": 0.14, "h": 0.09},
+    "photo": {"side": "front", "type": "image", "field": "photo", "x": 0.31, "y": 0.17, "w": 0.38, "h": 0.28},
+    "full_name": {"side": "front", "type": "text", "field": "full_name", "x": 0.5, "y": 0.49, "size": 0.058, "align": "center", "bold": True, "upper": True},
+    "class_label": {"side": "front", "type": "label", "text": "CLASS", "x": 0.08, "y": 0.85, "size": 0.026, "color": "#64748b", "bold": True},
+    "current_class": {"side": "front", "type": "text", "field": "current_class", "x": 0.08, "y": 0.885, "size": 0.04, "bold": True},
+    "id_label": {"side": "front", "type": "label", "text": "ROLL NO", "x": 0.92, "y": 0.85, "size": 0.026, "align": "right", "color": "#64748b", "bold": True},
+    "admission_number": {"side": "front", "type": "text", "field": "admission_number", "x": 0.92, "y": 0.885, "size": 0.04, "align": "right", "bold": True},
+    "guardian_label": {"side": "back", "type": "label", "text": "GUARDIAN", "x": 0.08, "y": 0.12, "size": 0.03, "color": "#64748b", "bold": True},
+    "father_name": {"side": "back", "type": "text", "field": "father_name", "x": 0.08, "y": 0.155, "size": 0.045, "bold": True},
+    "contact_label": {"side": "back", "type": "label", "text": "CONTACT", "x": 0.08, "y": 0.23, "size": 0.03, "color": "#64748b", "bold": True},
+    "father_phone": {"side": "back", "type": "text", "field": "father_phone", "x": 0.08, "y": 0.265, "size": 0.045, "bold": True},
+    "qr": {"side": "back", "type": "qr", "field": "qr_value", "x": 0.33, "y": 0.7, "w": 0.34, "h": 0.214},
+}
+
+
+STATIC_ROOT = Path("static").resolve()
+
+
+def local_media_path(url: str) -> Optional[Path]:
+    """
+    File behind a /static/... or media-store URL, or None. Paths that would
+    leave static/ (e.g. /static/../.env) are refused.
+    """
+    path = urlparse(url).path
+    if path.startswith("/static/"):
+        local = (STATIC_ROOT / path[len("/static/"):]).resolve()
+        return local if local.is_relative_to(STATIC_ROOT) else None
+    if "/media/" in path:
+        parsed = parse_object_name(path.rsplit("/", 1)[-1])
+        return object_path(*parsed) if parsed else None
+    return None
+
+
+def remote_media_allowed(url: str) -> bool:
+    """Only https URLs on MEDIA_FETCH_HOSTS (and, on Cloudinary, our own cloud) are fetched."""
+    parsed = urlparse(url)
+    hosts = {h.strip().lower() for h in settings.MEDIA_FETCH_HOSTS.split(",") if h.strip()}
+    if parsed.scheme != "https" or (parsed.hostname or "").lower() not in hosts:
+        return False
+    cloud = urlparse(os.getenv("CLOUDINARY_URL", "")).hostname
+    if parsed.hostname == "res.cloudinary.com" and cloud:
+        return parsed.path.startswith(f"/{cloud}/")
+    return True
+
+
+def build_layout(field_positions: Optional[dict]) -> Dict[str, dict]:
+    """Default layout with a template's field_positions merged over it."""
+    layout = {key: dict(item) for key, item in DEFAULT_LAYOUT.items()}
+    for key, item in (field_positions or {}).items():
+        if not isinstance(item, dict):
+            continue
+        if key in layout:
+            layout[key].update(item)
+        else:
+            layout[key] = {"side": "front", "type": "text", "field": key, **item}
+    return layout
+
+
+# ============================================================================
+# WORKER SIDE (runs in the render process pool)
+# ============================================================================
+
+_MAX_CACHED_IMAGES = 256
+# (url, size) -> decoded and resized RGB(A) image, per worker process
+_image_cache: "OrderedDict[Tuple[str, Tuple[int, int]], Image.Image]" = OrderedDict()
+_fonts: Dict[Tuple[int, bool], "ImageFont.FreeTypeFont"] = {}
+
+
+def _cached_image(url: str, data: Optional[bytes], size: Tuple[int, int], fit: bool) -> Optional["Image.Image"]:
+    key = (url, size)
+    image = _image_cache.get(key)
+    if image is not None:
+        _image_cache.move_to_end(key)
+        return image
+    if not data:
+        return None
+    try:
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image).convert("RGBA")
+        image = ImageOps.fit(image, size, Image.LANCZOS) if fit else image.resize(size, Image.LANCZOS)
+    except Exception as e:
+        logger.warning(f"Could not decode image {url}: {e}")
+        return None
+    _image_cache[key] = image
+    if len(_image_cache) > _MAX_CACHED_IMAGES:
+        _image_cache.popitem(last=False)
+    return image
+
+
+def _font(size: int, bold: bool):
+    key = (size, bold)
+    if key not in _fonts:
+        names = ["DejaVuSans-Bold.ttf", "Arial Bold.ttf", "arialbd.ttf"] if bold else ["DejaVuSans.ttf", "Arial.ttf", "arial.ttf"]
+        font = None
+        for name in names:
+            try:
+                font = ImageFont.truetype(name, size)
+                break
+            except OSError:
+                continue
+        _fonts[key] = font or ImageFont.load_default(size=size)
+    return _fonts[key]
+
+
+def _draw_side(side: str, spec: dict, card: dict) -> "Image.Image":
+    width, height = CARD_SIZE
+    url = spec.get(f"{side}_url")
+    background = _cached_image(url, spec.get(f"{side}_bytes"), CARD_SIZE, fit=True) if url else None
+    canvas = Image.new("RGBA", CARD_SIZE, "white")
+    if background is not None:
+        canvas.alpha_composite(background)
+    draw = ImageDraw.Draw(canvas)
+
+    for item in spec["layout"].values():
+        if item.get("side", "front") != side:
+            continue
+        x, y = int(item.get("x", 0) * width), int(item.get("y", 0) * height)
+        kind = item.get("type", "text")
+
+        if kind in ("image", "qr"):
+            box = (max(int(item.get("w", 0.3) * width), 1), max(int(item.get("h", 0.2) * height), 1))
+            if kind == "qr":
+                value = card.get(item.get("field", "qr_value"))
+                if not value:
+                    continue
+                if card.get("qr_bytes"):
+                    # Pre-rendered at this box size by the media cache
+                    picture = Image.open(io.BytesIO(card["qr_bytes"])).convert("RGBA").resize(box, Image.NEAREST)
+                else:
+                    qr = qrcode.QRCode(border=1, box_size=10)
+                    qr.add_data(value)
+                    picture = qr.make_image(fill_color="black", back_color="white").get_image()
+                    picture = picture.convert("RGBA").resize(box, Image.NEAREST)
+            elif item.get("field") == "logo":
+                picture = _cached_image(spec.get("logo_url"), spec.get("logo_bytes"), box, fit=False) if spec.get("logo_url") else None
+            else:
+                photo_url = card.get("photo_url")
+                picture = _cached_image(photo_url, card.get("photo_bytes"), box, fit=True) if photo_url else None
+                if picture is None:
+                    draw.rectangle([x, y, x + box[0], y + box[1]], fill="#e2e8f0")
+                    continue
+            if picture is not None:
+                canvas.alpha_composite(picture, (x, y))
+            continue
+
+        text = item.get("text") if kind == "label" else card.get(item.get("field"))
+        if text is None or text == "":
+            text = "-" if kind == "text" else ""
+        text = str(text)
+        if item.get("upper"):
+            text = text.upper()
+        font = _font(max(int(item.get("size", 0.04) * height), 8), bool(item.get("bold")))
+        anchor = {"left": "la", "center": "ma", "right": "ra"}.get(item.get("align", "left"), "la")
+        draw.text((x, y), text, font=font, fill=item.get("color", "#0f172a"), anchor=anchor)
+
+    return canvas.convert("RGB")
+
+
+def _compose_sheet(faces: List["Image.Image"], mirrored: bool) -> bytes:
+    """Place up to nine cards on an A4 sheet; backs are mirrored for long-edge duplex."""
+    sheet = Image.new("RGB", SHEET_SIZE, "white")
+    cols, rows = GRID
+    gap = 24
+    margin_x = (SHEET_SIZE[0] - cols * CARD_SIZE[0] - (cols - 1) * gap) // 2
+    margin_y = (SHEET_SIZE[1] - rows * CARD_SIZE[1] - (rows - 1) * gap) // 2
+
+    draw = ImageDraw.Draw(sheet)
+    for i, face in enumerate(faces):
+        row, col = divmod(i, cols)
+        if mirrored:
+            col = cols - 1 - col
+        left = margin_x + col * (CARD_SIZE[0] + gap)
+        top = margin_y + row * (CARD_SIZE[1] + gap)
+        sheet.paste(face, (left, top))
+        # Hairline cut guide
+        draw.rectangle([left - 1, top - 1, left + CARD_SIZE[0], top + CARD_SIZE[1]], outline="#cbd5e1")
+
+    buffer = io.BytesIO()
+    sheet.save(buffer, format="JPEG", quality=SHEET_JPEG_QUALITY, dpi=(DPI, DPI))
+    return buffer.getvalue()
+
+
+def render_sheet(spec: dict, cards: List[dict]) -> Tuple[bytes, Optional[bytes]]:
+    """Worker entry point: (front sheet JPEG, back sheet JPEG or None) for up to nine cards."""
+    fronts = [_draw_side("front", spec, card) for card in cards]
+    has_back = bool(spec.get("back_url")) or any(i.get("side") == "back" for i in spec["layout"].values())
+    backs = [_draw_side("back", spec, card) for card in cards] if has_back else []
+    return _compose_sheet(fronts, False), (_compose_sheet(backs, True) if backs else None)
+
+
+# ============================================================================
+# PDF
+# ============================================================================
+
+class StreamingPDFWriter:
+    """
+    Minimal PDF writer: one full-page JPEG per page, emitted page by page.
+    The page tree and xref are written at the end, so nothing is buffered.
+    """
+
+    PAGE_POINTS = (595.28, 841.89)  # A4
+
+    def __init__(self):
+        self._offsets: Dict[int, int] = {}
+        self._position = 0
+        self._next_id = 3  # 1 = catalog, 2 = page tree (both written on close)
+        self._pages: List[int] = []
+
+    def _emit(self, data: bytes) -> bytes:
+        self._position += len(data)
+        return data
+
+    def _object(self, number: int, body: bytes) -> bytes:
+        self._offsets[number] = self._position
+        return self._emit(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    def _allocate(self) -> int:
+        number = self._next_id
+        self._next_id += 1
+        return number
+
+    def header(self) -> bytes:
+        return self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def page(self, jpeg: bytes, size: Tuple[int, int]) -> bytes:
+        image_id, content_id, page_id = self._allocate(), self._allocate(), self._allocate()
+        width, height = self.PAGE_POINTS
+        content = f"q {width} 0 0 {height} 0 0 cm /Im0 Do Q".encode()
+
+        chunks = [
+            self._object(image_id, (
+                f"<< /Type /XObject /Subtype /Image /Width {size[0]} /Height {size[1]} "
+                f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode /Length {len(jpeg)} >>\nstream\n"
+            ).encode() + jpeg + b"\nendstream"),
+            self._object(content_id, f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream"),
+            self._object(page_id, (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+                f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>"
+            ).encode()),
+        ]
+        self._pages.append(page_id)
+        return b"".join(chunks)
+
+    def close(self) -> bytes:
+        kids = " ".join(f"{p} 0 R" for p in self._pages)
+        chunks = [
+            self._object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>".encode()),
+            self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>"),
+        ]
+        xref_at = self._position
+        count = self._next_id
+        xref = [f"xref\n0 {count}\n", "0000000000 65535 f \n"]
+        xref += [f"{self._offsets[n]:010d} 00000 n \n" for n in range(1, count)]
+        xref.append(f"trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n")
+        chunks.append(self._emit("".join(xref).encode()))
+        return b"".join(chunks)
+
+
+# ============================================================================
+# PARENT SIDE
+# ============================================================================
+
+class IDCardRenderer:
+    """Process pool plus a byte cache of downloaded backgrounds, logos and photos."""
+
+    _executor: Optional[ProcessPoolExecutor] = None
+    _media: "OrderedDict[str, bytes]" = OrderedDict()
+    _media_bytes = 0
+    MAX_MEDIA_BYTES = 64 * 1024 * 1024
+
+    @classmethod
+    def _get_executor(cls) -> ProcessPoolExecutor:
+        if cls._executor is None:
+            cls._executor = ProcessPoolExecutor(max_workers=settings.ID_CARD_RENDER_WORKERS)
+        return cls._executor
+
+    @classmethod
+    def shutdown(cls):
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
+
+    @classmethod
+    async def fetch(cls, client: httpx.AsyncClient, url: Optional[str]) -> Optional[bytes]:
+        """
+        Bytes for a media URL, cached by URL. Local /static and media-store files
+        are read from disk; anything else only from an allowed host, without
+        following redirects. URLs that are neither come back as None.
+        """
+        if not url:
+            return None
+        if url in cls._media:
+            cls._media.move_to_end(url)
+            return cls._media[url]
+
+        data = None
+        local = local_media_path(url)
+        try:
+            if local is not None:
+                if local.is_file():
+                    data = await asyncio.to_thread(local.read_bytes)
+            elif remote_media_allowed(url):
+                response = await client.get(url, follow_redirects=False)
+                if response.status_code == 200:
+                    data = response.content
+            else:
+                logger.warning(f"Refusing to fetch media from {url}")
+        except Exception as e:
+            logger.warning(f"Could not fetch {url}: {e}")
+
+        if data:
+            cls._media[url] = data
+            cls._media_bytes += len(data)
+            while cls._media_bytes > cls.MAX_MEDIA_BYTES and cls._media:
+                _, evicted = cls._media.popitem(last=False)
+                cls._media_bytes -= len(evicted)
+        return data
+
+    @classmethod
+    async def stream_pdf(cls, template: dict, school: dict, cards: List[dict]) -> AsyncIterator[bytes]:
+        """
+        Yield a print-ready PDF for `cards`: for each group of nine, a front
+        sheet then (if the template has a back) a mirrored back sheet.
+        """
+        if not RENDER_AVAILABLE:
+            raise ImportError("Pillow and qrcode are required for ID card rendering.")
+
+        loop = asyncio.get_running_loop()
+        executor = cls._get_executor()
+        writer = StreamingPDFWriter()
+        in_flight = max(settings.ID_CARD_RENDER_WORKERS * 2, 2)
+
+        async with httpx.AsyncClient(timeout=15.0) as client:
+            spec = {
+                "layout": build_layout(template.get("field_positions")),
+                "front_url": template.get("front_bg_url"),
+                "back_url": template.get("back_bg_url"),
+                "logo_url": school.get("logo_url"),
+            }
+            spec["front_bytes"], spec["back_bytes"], spec["logo_bytes"] = await asyncio.gather(
+                cls.fetch(client, spec["front_url"]),
+                cls.fetch(client, spec["back_url"]),
+                cls.fetch(client, spec["logo_url"]),
+            )
+
+            qr_item = spec["layout"].get("qr") or {}
+            qr_size = max(int(qr_item.get("w", 0.34) * CARD_SIZE[0]), 64)
+            photo_item = spec["layout"].get("photo") or {}
+            photo_size = max(int(photo_item.get("w", 0.38) * CARD_SIZE[0]), int(photo_item.get("h", 0.28) * CARD_SIZE[1]))
+
+            async def cached_bytes(lookup) -> Optional[bytes]:
+                path, _ = await lookup
+                return await asyncio.to_thread(path.read_bytes) if path else None
+
+            async def photo_bytes(url: Optional[str]) -> Optional[bytes]:
+                if not url:
+                    return None
+                # Thumbnails come from the shared disk cache, so reprints skip download + resize
+                return await cached_bytes(media_cache.thumbnail(url, photo_size, lambda u: cls.fetch(client, u)))
+
+            async def qr_bytes(card: dict) -> Optional[bytes]:
+                value = card.get(qr_item.get("field", "qr_value"))
+                if not value:
+                    return None
+                return await cached_bytes(media_cache.qr_png(value, qr_size, card.get("card_number") or "default"))
+
+            async def prepare(chunk: List[dict]) -> List[dict]:
+                photos = await asyncio.gather(*(photo_bytes(c.get("photo_url")) for c in chunk))
+                qrs = await asyncio.gather(*(qr_bytes(c) for c in chunk))
+                return [
+                    {**c, "school_name": school.get("name"), "photo_bytes": p, "qr_bytes": q}
+                    for c, p, q in zip(chunk, photos, qrs)
+                ]
+
+            chunks = [cards[i:i + CARDS_PER_SHEET] for i in range(0, len(cards), CARDS_PER_SHEET)]
+            pending = []
+            yield writer.header()
+
+            for chunk in chunks:
+                prepared = await prepare(chunk)
+                pending.append(loop.run_in_executor(executor, render_sheet, spec, prepared))
+                # Keep a few sheets rendering ahead while earlier ones are written out
+                if len(pending) >= in_flight:
+                    for page in await pending.pop(0):
+                        if page:
+                            yield writer.page(page, SHEET_SIZE)
+
+            for future in pending:
+                for page in await future:
+                    if page:
+                        yield writer.page(page, SHEET_SIZE)
+
+        yield writer.close()
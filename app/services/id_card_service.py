@@ -7,6 +7,7 @@ from uuid import UUID
 from typing import Optional, List, Dict, Any
 from datetime import datetime, date, timedelta
 import json
+import asyncpg
 from fastapi import HTTPException, status
 
 from app.models.id_card import (
@@ -15,6 +16,209 @@ from app.models.id_card import (
     IDCardStats, IDCardStatus, AppealStatus, BulkIDCardGenerate, BulkIDCardResponse
 )
 
+# Sequence-backed card numbers (mirrors id_card_restriction_migration.sql section 7)
+CARD_NUMBER_SEQUENCE_DDL = """
+    DO $$
+    BEGIN
+        IF to_regclass('id_card_number_seq') IS NULL THEN
+            CREATE SEQUENCE id_card_number_seq;
+            PERFORM setval(
+                'id_card_number_seq',
+                COALESCE(MAX(substring(card_number FROM '([0-9]+)$')::BIGINT), 0) + 1,
+                false
+            )
+            FROM student_id_cards;
+        END IF;
+    END $$;
+
+    CREATE OR REPLACE FUNCTION generate_card_number()
+    RETURNS VARCHAR(50) AS $$
+    DECLARE
+        counter BIGINT := nextval('id_card_number_seq');
+    BEGIN
+        RETURN 'IDC-' || TO_CHAR(CURRENT_DATE, 'YYYY') || '-' || LPAD(counter::TEXT, GREATEST(6, LENGTH(counter::TEXT)), '0');
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+# Per-tenant status counters, kept exact by statement-level triggers on
+# student_id_cards / id_card_appeals so every writer (service methods, the
+# student insert trigger, cascades) updates them in its own transaction.
+ID_CARD_COUNTERS_DDL = """
+    CREATE TABLE IF NOT EXISTS id_card_counters (
+        id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        draft_count INTEGER NOT NULL DEFAULT 0,
+        submitted_count INTEGER NOT NULL DEFAULT 0,
+        locked_count INTEGER NOT NULL DEFAULT 0,
+        appeal_pending_count INTEGER NOT NULL DEFAULT 0,
+        unlocked_count INTEGER NOT NULL DEFAULT 0,
+        total_cards INTEGER NOT NULL DEFAULT 0,
+        editable_count INTEGER NOT NULL DEFAULT 0,
+        appeals_total INTEGER NOT NULL DEFAULT 0,
+        appeals_pending INTEGER NOT NULL DEFAULT 0,
+        appeals_approved INTEGER NOT NULL DEFAULT 0,
+        appeals_rejected INTEGER NOT NULL DEFAULT 0,
+        review_seconds_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+        reviewed_count INTEGER NOT NULL DEFAULT 0,
+        oldest_pending_at TIMESTAMPTZ,
+        updated_at TIMESTAMPTZ DEFAULT NOW()
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_appeals_pending_submitted
+        ON id_card_appeals(submitted_at) WHERE status = 'pending';
+
+    CREATE OR REPLACE FUNCTION id_card_counters_cards()
+    RETURNS TRIGGER AS $$
+    DECLARE
+        source TEXT := CASE TG_OP
+            WHEN 'INSERT' THEN 'SELECT status, is_editable, 1 AS sign FROM new_rows'
+            WHEN 'DELETE' THEN 'SELECT status, is_editable, -1 AS sign FROM old_rows'
+            ELSE 'SELECT status, is_editable, 1 AS sign FROM new_rows
+                  UNION ALL SELECT status, is_editable, -1 FROM old_rows'
+        END;
+    BEGIN
+        EXECUTE format($q$
+            UPDATE id_card_counters c SET
+                draft_count = c.draft_count + d.draft,
+                submitted_count = c.submitted_count + d.submitted,
+                locked_count = c.locked_count + d.locked,
+                appeal_pending_count = c.appeal_pending_count + d.appeal_pending,
+                unlocked_count = c.unlocked_count + d.unlocked,
+                total_cards = c.total_cards + d.total,
+                editable_count = c.editable_count + d.editable,
+                updated_at = NOW()
+            FROM (
+                SELECT
+                    COALESCE(SUM(sign) FILTER (WHERE status = 'draft'), 0) AS draft,
+                    COALESCE(SUM(sign) FILTER (WHERE status = 'submitted'), 0) AS submitted,
+                    COALESCE(SUM(sign) FILTER (WHERE status = 'locked'), 0) AS locked,
+                    COALESCE(SUM(sign) FILTER (WHERE status = 'appeal_pending'), 0) AS appeal_pending,
+                    COALESCE(SUM(sign) FILTER (WHERE status = 'unlocked_for_edit'), 0) AS unlocked,
+                    COALESCE(SUM(sign), 0) AS total,
+                    COALESCE(SUM(sign) FILTER (WHERE is_editable), 0) AS editable
+                FROM (%s) delta
+            ) d
+            WHERE c.id = 1
+        $q$, source);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION id_card_counters_appeals()
+    RETURNS TRIGGER AS $$
+    DECLARE
+        source TEXT := CASE TG_OP
+            WHEN 'INSERT' THEN 'SELECT status, submitted_at, reviewed_at, 1 AS sign FROM new_rows'
+            WHEN 'DELETE' THEN 'SELECT status, submitted_at, reviewed_at, -1 AS sign FROM old_rows'
+            ELSE 'SELECT status, submitted_at, reviewed_at, 1 AS sign FROM new_rows
+                  UNION ALL SELECT status, submitted_at, reviewed_at, -1 FROM old_rows'
+        END;
+    BEGIN
+        EXECUTE format($q$
+            UPDATE id_card_counters c SET
+                appeals_total = c.appeals_total + d.total,
+                appeals_pending = c.appeals_pending + d.pending,
+                appeals_approved = c.appeals_approved + d.approved,
+                appeals_rejected = c.appeals_rejected + d.rejected,
+                review_seconds_total = c.review_seconds_total + d.review_seconds,
+                reviewed_count = c.reviewed_count + d.reviewed,
+                oldest_pending_at = (
+                    SELECT MIN(submitted_at) FROM id_card_appeals WHERE status = 'pending'
+                ),
+                updated_at = NOW()
+            FROM (
+                SELECT
+                    COALESCE(SUM(sign), 0) AS total,
+                    COALESCE(SUM(sign) FILTER (WHERE status = 'pending'), 0) AS pending,
+                    COALESCE(SUM(sign) FILTER (WHERE status = 'approved'), 0) AS approved,
+                    COALESCE(SUM(sign) FILTER (WHERE status = 'rejected'), 0) AS rejected,
+                    COALESCE(SUM(sign * EXTRACT(EPOCH FROM (reviewed_at - submitted_at)))
+                        FILTER (WHERE reviewed_at IS NOT NULL), 0) AS review_seconds,
+                    COALESCE(SUM(sign) FILTER (WHERE reviewed_at IS NOT NULL), 0) AS reviewed
+                FROM (%s) delta
+            ) d
+            WHERE c.id = 1
+        $q$, source);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS trg_id_card_counters_ins ON student_id_cards;
+    DROP TRIGGER IF EXISTS trg_id_card_counters_upd ON student_id_cards;
+    DROP TRIGGER IF EXISTS trg_id_card_counters_del ON student_id_cards;
+    CREATE TRIGGER trg_id_card_counters_ins AFTER INSERT ON student_id_cards
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION id_card_counters_cards();
+    CREATE TRIGGER trg_id_card_counters_upd AFTER UPDATE ON student_id_cards
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION id_card_counters_cards();
+    CREATE TRIGGER trg_id_card_counters_del AFTER DELETE ON student_id_cards
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION id_card_counters_cards();
+
+    DROP TRIGGER IF EXISTS trg_appeal_counters_ins ON id_card_appeals;
+    DROP TRIGGER IF EXISTS trg_appeal_counters_upd ON id_card_appeals;
+    DROP TRIGGER IF EXISTS trg_appeal_counters_del ON id_card_appeals;
+    CREATE TRIGGER trg_appeal_counters_ins AFTER INSERT ON id_card_appeals
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION id_card_counters_appeals();
+    CREATE TRIGGER trg_appeal_counters_upd AFTER UPDATE ON id_card_appeals
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION id_card_counters_appeals();
+    CREATE TRIGGER trg_appeal_counters_del AFTER DELETE ON id_card_appeals
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION id_card_counters_appeals();
+"""
+
+# Recount from scratch (first install, or repair); run with both tables locked
+ID_CARD_COUNTERS_RECOUNT = """
+    INSERT INTO id_card_counters AS c (
+        id, draft_count, submitted_count, locked_count, appeal_pending_count, unlocked_count,
+        total_cards, editable_count, appeals_total, appeals_pending, appeals_approved,
+        appeals_rejected, review_seconds_total, reviewed_count, oldest_pending_at, updated_at
+    )
+    SELECT 1, k.*, a.*, NOW()
+    FROM (
+        SELECT
+            COUNT(*) FILTER (WHERE status = 'draft'),
+            COUNT(*) FILTER (WHERE status = 'submitted'),
+            COUNT(*) FILTER (WHERE status = 'locked'),
+            COUNT(*) FILTER (WHERE status = 'appeal_pending'),
+            COUNT(*) FILTER (WHERE status = 'unlocked_for_edit'),
+            COUNT(*),
+            COUNT(*) FILTER (WHERE is_editable)
+        FROM student_id_cards
+    ) k (draft, submitted, locked, appeal_pending, unlocked, total, editable), (
+        SELECT
+            COUNT(*),
+            COUNT(*) FILTER (WHERE status = 'pending'),
+            COUNT(*) FILTER (WHERE status = 'approved'),
+            COUNT(*) FILTER (WHERE status = 'rejected'),
+            COALESCE(SUM(EXTRACT(EPOCH FROM (reviewed_at - submitted_at))) FILTER (WHERE reviewed_at IS NOT NULL), 0),
+            COUNT(*) FILTER (WHERE reviewed_at IS NOT NULL),
+            MIN(submitted_at) FILTER (WHERE status = 'pending')
+        FROM id_card_appeals
+    ) a (total, pending, approved, rejected, review_seconds, reviewed, oldest_pending)
+    ON CONFLICT (id) DO UPDATE SET
+        draft_count = EXCLUDED.draft_count,
+        submitted_count = EXCLUDED.submitted_count,
+        locked_count = EXCLUDED.locked_count,
+        appeal_pending_count = EXCLUDED.appeal_pending_count,
+        unlocked_count = EXCLUDED.unlocked_count,
+        total_cards = EXCLUDED.total_cards,
+        editable_count = EXCLUDED.editable_count,
+        appeals_total = EXCLUDED.appeals_total,
+        appeals_pending = EXCLUDED.appeals_pending,
+        appeals_approved = EXCLUDED.appeals_approved,
+        appeals_rejected = EXCLUDED.appeals_rejected,
+        review_seconds_total = EXCLUDED.review_seconds_total,
+        reviewed_count = EXCLUDED.reviewed_count,
+        oldest_pending_at = EXCLUDED.oldest_pending_at,
+        updated_at = NOW()
+"""
+
+
+async def install_id_card_counters(conn: asyncpg.Connection):
+    """Create (or repair) the counters row and its triggers, then recount."""
+    async with conn.transaction():
+        await conn.execute("LOCK TABLE student_id_cards, id_card_appeals IN SHARE ROW EXCLUSIVE MODE")
+        await conn.execute(ID_CARD_COUNTERS_DDL)
+        await conn.execute(ID_CARD_COUNTERS_RECOUNT)
+
 
 class IDCardService:
     """Service for managing ID cards and appeals"""
@@ -176,19 +380,35 @@ class IDCardService:
         rows = await self.conn.fetch(query, *params)
         return [IDCardWithStudent(**dict(row)) for row in rows]
     
+    async def get_counters(self) -> Dict[str, Any]:
+        """The tenant's id_card_counters row (one primary-key lookup), installing it on first use."""
+        query = """
+            SELECT *, EXTRACT(EPOCH FROM (NOW() - oldest_pending_at))/3600 AS oldest_pending_hours
+            FROM id_card_counters WHERE id = 1
+        """
+        try:
+            row = await self.conn.fetchrow(query)
+        except asyncpg.UndefinedTableError:
+            row = None
+        if row is None:
+            async with self.conn.acquire() as conn:
+                await install_id_card_counters(conn)
+            row = await self.conn.fetchrow(query)
+        return dict(row)
+
     async def get_statistics(self) -> IDCardStats:
         """Get ID card statistics"""
-        query = "SELECT * FROM v_id_card_stats"
-        result = await self.conn.fetchrow(query)
-        
-        if not result:
-            return IDCardStats(
-                draft_count=0, submitted_count=0, locked_count=0,
-                appeal_pending_count=0, unlocked_count=0, total_cards=0,
-                editable_count=0, locked_count_total=0
-            )
-        
-        return IDCardStats(**dict(result))
+        c = await self.get_counters()
+        return IDCardStats(
+            draft_count=c['draft_count'],
+            submitted_count=c['submitted_count'],
+            locked_count=c['locked_count'],
+            appeal_pending_count=c['appeal_pending_count'],
+            unlocked_count=c['unlocked_count'],
+            total_cards=c['total_cards'],
+            editable_count=c['editable_count'],
+            locked_count_total=c['total_cards'] - c['editable_count']
+        )
     
     # ========================================================================
     # APPEAL OPERATIONS
@@ -242,23 +462,25 @@ class IDCardService:
             RETURNING *
         """
         
-        result = await self.conn.fetchrow(
-            insert_query,
-            appeal.student_id,
-            appeal.card_id,
-            appeal.appeal_reason,
-            appeal.mistake_description,
-            json.dumps(appeal.requested_changes) if appeal.requested_changes else None
-        )
-        
-        # Update card status to appeal_pending
-        await self.conn.execute("""
-            UPDATE student_id_cards
-            SET status = 'appeal_pending',
-                appeal_reason = $1,
-                appeal_submitted_at = NOW()
-            WHERE card_id = $2
-        """, appeal.appeal_reason, appeal.card_id)
+        # Appeal row, card status and counters change together
+        async with self.conn.acquire() as conn, conn.transaction():
+            result = await conn.fetchrow(
+                insert_query,
+                appeal.student_id,
+                appeal.card_id,
+                appeal.appeal_reason,
+                appeal.mistake_description,
+                json.dumps(appeal.requested_changes) if appeal.requested_changes else None
+            )
+            
+            # Update card status to appeal_pending
+            await conn.execute("""
+                UPDATE student_id_cards
+                SET status = 'appeal_pending',
+                    appeal_reason = $1,
+                    appeal_submitted_at = NOW()
+                WHERE card_id = $2
+            """, appeal.appeal_reason, appeal.card_id)
         
         return AppealResponse(**dict(result))
     
@@ -350,38 +572,45 @@ class IDCardService:
                 reviewed_at = NOW(),
                 admin_notes = $3,
                 updated_at = NOW()
-            WHERE appeal_id = $4
+            WHERE appeal_id = $4 AND status = 'pending'
             RETURNING *
         """
         
-        updated_appeal = await self.conn.fetchrow(
-            update_appeal_query,
-            new_status,
-            admin_id,
-            admin_notes,
-            appeal_id
-        )
-        
-        # Update card based on decision
-        if action == 'approve':
-            # Unlock card for editing
-            await self.conn.execute("""
-                UPDATE student_id_cards
-                SET status = 'unlocked_for_edit',
-                    is_editable = TRUE,
-                    unlocked_by_admin_id = $1,
-                    unlocked_at = NOW(),
-                    updated_at = NOW()
-                WHERE card_id = $2
-            """, admin_id, appeal['card_id'])
-        else:
-            # Keep card locked
-            await self.conn.execute("""
-                UPDATE student_id_cards
-                SET status = 'locked',
-                    updated_at = NOW()
-                WHERE card_id = $1
-            """, appeal['card_id'])
+        async with self.conn.acquire() as conn, conn.transaction():
+            updated_appeal = await conn.fetchrow(
+                update_appeal_query,
+                new_status,
+                admin_id,
+                admin_notes,
+                appeal_id
+            )
+            if not updated_appeal:
+                # Reviewed concurrently by another admin
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Appeal was already reviewed"
+                )
+            
+            # Update card based on decision
+            if action == 'approve':
+                # Unlock card for editing
+                await conn.execute("""
+                    UPDATE student_id_cards
+                    SET status = 'unlocked_for_edit',
+                        is_editable = TRUE,
+                        unlocked_by_admin_id = $1,
+                        unlocked_at = NOW(),
+                        updated_at = NOW()
+                    WHERE card_id = $2
+                """, admin_id, appeal['card_id'])
+            else:
+                # Keep card locked
+                await conn.execute("""
+                    UPDATE student_id_cards
+                    SET status = 'locked',
+                        updated_at = NOW()
+                    WHERE card_id = $1
+                """, appeal['card_id'])
         
         return {
             "appeal_id": appeal_id,
@@ -393,28 +622,14 @@ class IDCardService:
     
     async def get_appeal_stats(self) -> AppealStats:
         """Get appeal statistics"""
-        query = """
-            SELECT 
-                COUNT(*) as total_appeals,
-                COUNT(*) FILTER (WHERE status = 'pending') as pending_count,
-                COUNT(*) FILTER (WHERE status = 'approved') as approved_count,
-                COUNT(*) FILTER (WHERE status = 'rejected') as rejected_count,
-                AVG(EXTRACT(EPOCH FROM (reviewed_at - submitted_at))/3600) 
-                    FILTER (WHERE reviewed_at IS NOT NULL) as avg_review_time_hours,
-                MAX(EXTRACT(EPOCH FROM (NOW() - submitted_at))/3600) 
-                    FILTER (WHERE status = 'pending') as oldest_pending_hours
-            FROM id_card_appeals
-        """
-        
-        result = await self.conn.fetchrow(query)
-        
+        c = await self.get_counters()
         return AppealStats(
-            total_appeals=result['total_appeals'] or 0,
-            pending_count=result['pending_count'] or 0,
-            approved_count=result['approved_count'] or 0,
-            rejected_count=result['rejected_count'] or 0,
-            avg_review_time_hours=float(result['avg_review_time_hours']) if result['avg_review_time_hours'] else None,
-            oldest_pending_hours=float(result['oldest_pending_hours']) if result['oldest_pending_hours'] else None
+            total_appeals=c['appeals_total'],
+            pending_count=c['appeals_pending'],
+            approved_count=c['appeals_approved'],
+            rejected_count=c['appeals_rejected'],
+            avg_review_time_hours=(c['review_seconds_total'] / c['reviewed_count'] / 3600) if c['reviewed_count'] else None,
+            oldest_pending_hours=float(c['oldest_pending_hours']) if c['oldest_pending_hours'] is not None else None
         )
     
     # ========================================================================
@@ -422,63 +637,61 @@ class IDCardService:
     # ========================================================================
     
     async def bulk_generate_cards(self, data: BulkIDCardGenerate) -> BulkIDCardResponse:
-        """Generate ID cards for multiple students"""
-        successful = 0
-        failed = 0
+        """
+        Generate ID cards for multiple students in one set-based insert.
+        Students that already have a card (or do not exist) are skipped;
+        card numbers are drawn from id_card_number_seq.
+        """
+        student_ids = list(dict.fromkeys(data.student_ids))
+        issue_date = data.issue_date or date.today()
+        expiry_date = data.expiry_date or (date.today() + timedelta(days=365*3))
+
+        insert_query = """
+            INSERT INTO student_id_cards (student_id, card_number, issue_date, expiry_date)
+            SELECT
+                e.student_id,
+                'IDC-' || TO_CHAR(CURRENT_DATE, 'YYYY') || '-' || LPAD(e.n::TEXT, GREATEST(6, LENGTH(e.n::TEXT)), '0'),
+                $2, $3
+            FROM (
+                SELECT s.student_id, nextval('id_card_number_seq') AS n
+                FROM students s
+                WHERE s.student_id = ANY($1::uuid[])
+                  AND NOT EXISTS (SELECT 1 FROM student_id_cards c WHERE c.student_id = s.student_id)
+            ) e
+            ON CONFLICT (student_id) DO NOTHING
+            RETURNING card_id, student_id
+        """
+
+        try:
+            created = await self.conn.fetch(insert_query, student_ids, issue_date, expiry_date)
+        except asyncpg.UndefinedTableError:
+            # Tenant predates the card number sequence
+            await self.conn.execute(CARD_NUMBER_SEQUENCE_DDL)
+            created = await self.conn.fetch(insert_query, student_ids, issue_date, expiry_date)
+
+        created_ids = {r['student_id'] for r in created}
+        skipped = [sid for sid in student_ids if sid not in created_ids]
+
         errors = []
-        card_ids = []
-        
-        for student_id in data.student_ids:
-            try:
-                # Check if card already exists
-                existing = await self.get_card_by_student(student_id)
-                if existing:
-                    errors.append({
-                        "student_id": str(student_id),
-                        "error": "ID card already exists"
-                    })
-                    failed += 1
-                    continue
-                
-                # Generate card number
-                card_number_query = "SELECT generate_card_number() as card_number"
-                card_number_result = await self.conn.fetchrow(card_number_query)
-                card_number = card_number_result['card_number']
-                
-                # Create card
-                insert_query = """
-                    INSERT INTO student_id_cards (
-                        student_id, card_number, issue_date, expiry_date
-                    )
-                    VALUES ($1, $2, $3, $4)
-                    RETURNING card_id
-                """
-                
-                issue_date = data.issue_date or date.today()
-                expiry_date = data.expiry_date or (date.today() + timedelta(days=365*3))
-                
-                result = await self.conn.fetchrow(
-                    insert_query,
-                    student_id,
-                    card_number,
-                    issue_date,
-                    expiry_date
-                )
-                
-                card_ids.append(result['card_id'])
-                successful += 1
-                
-            except Exception as e:
-                errors.append({
-                    "student_id": str(student_id),
-                    "error": str(e)
-                })
-                failed += 1
-        
+        if skipped:
+            existing = await self.conn.fetch(
+                "SELECT student_id FROM student_id_cards WHERE student_id = ANY($1::uuid[])", skipped
+            )
+            has_card = {r['student_id'] for r in existing}
+            errors = [
+                {
+                    "student_id": str(sid),
+                    "error": "ID card already exists" if sid in has_card else "Student not found"
+                }
+                for sid in skipped
+            ]
+
         return BulkIDCardResponse(
-            total=len(data.student_ids),
-            successful=successful,
-            failed=failed,
+            total=len(student_ids),
+            successful=len(created),
+            failed=len(skipped),
             errors=errors,
-            card_ids=card_ids
+            card_ids=[r['card_id'] for r in created],
+            created_student_ids=[r['student_id'] for r in created],
+            skipped_student_ids=skipped
         )
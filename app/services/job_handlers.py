@@ -0,0 +1,98 @@
+"""
+Job Handlers
+Implementations of the background job kinds. Each takes a JobContext and
+returns a JSON-serialisable result stored on the job row. Kinds that are
+not idempotent (extensions, email) are enqueued with max_attempts=1.
+"""
+
+from datetime import date, datetime
+from uuid import UUID
+import asyncio
+
+from app.models.id_card import BulkIDCardGenerate
+from app.services.jobs import JobContext, JobFailed, job_handler
+
+CARD_CHUNK = 1000
+EMAIL_CHUNK = 200
+
+
+@job_handler("fees.generate_invoices")
+async def generate_invoices(ctx: JobContext) -> dict:
+    """Monthly invoices, one set-based insert per class."""
+    from app.api.v1.fees import insert_monthly_invoices
+
+    month_year = ctx.payload["month_year"]
+    due_date = date.fromisoformat(ctx.payload["due_date"])
+    pool = await ctx.tenant_pool()
+    async with pool.acquire() as conn:
+        classes = [r["class_name"] for r in await conn.fetch("""
+            SELECT DISTINCT class_name FROM class_fee_structure
+            WHERE frequency = 'monthly' AND ($1::text IS NULL OR class_name = $1::text)
+            ORDER BY class_name
+        """, ctx.payload.get("class_name"))]
+
+    generated = 0
+    for i, class_name in enumerate(classes):
+        async with pool.acquire() as conn:
+            generated += await insert_monthly_invoices(conn, month_year, due_date, class_name)
+        await ctx.progress((i + 1) / len(classes), f"{class_name}: {generated} invoices so far")
+    return {"message": f"Generated {generated} invoices for {month_year}", "generated": generated, "classes": len(classes)}
+
+
+@job_handler("id_cards.bulk_generate")
+async def bulk_generate_cards(ctx: JobContext) -> dict:
+    from app.services.id_card_service import IDCardService
+
+    student_ids = list(dict.fromkeys(ctx.payload["student_ids"]))
+    service = IDCardService(await ctx.tenant_pool())
+    result = {"total": len(student_ids), "successful": 0, "failed": 0, "skipped": 0, "errors": []}
+    for start in range(0, len(student_ids), CARD_CHUNK):
+        chunk = BulkIDCardGenerate(
+            student_ids=[UUID(s) for s in student_ids[start:start + CARD_CHUNK]],
+            issue_date=ctx.payload.get("issue_date"),
+            expiry_date=ctx.payload.get("expiry_date"),
+        )
+        done = await service.bulk_generate_cards(chunk)
+        result["successful"] += done.successful
+        result["failed"] += done.failed
+        result["skipped"] += len(done.skipped_student_ids)
+        result["errors"].extend(done.errors[:50 - len(result["errors"])])
+        await ctx.progress(min(1.0, (start + CARD_CHUNK) / len(student_ids)),
+                           f"{result['successful']} cards generated")
+    return result
+
+
+@job_handler("admin.bulk_extend")
+async def bulk_extend(ctx: JobContext) -> dict:
+    from app.services.subscription import SubscriptionStateMachine
+
+    tenant_ids = [UUID(t) for t in ctx.payload["tenant_ids"]]
+    await ctx.progress(0.0, f"Extending {len(tenant_ids)} schools", force=True)
+    return await SubscriptionStateMachine(ctx.pool).bulk_extend_subscriptions(
+        tenant_ids,
+        ctx.job["created_by"],
+        ctx.payload["extension_days"],
+        f"BULK_EXTEND_{datetime.now().isoformat()}",
+        0.0,  # Amount not tracked for bulk operations
+        "Bulk extension"
+    )
+
+
+@job_handler("email.bulk")
+async def send_bulk_email(ctx: JobContext) -> dict:
+    """One email per recipient through the pooled dispatcher, waiting for each outcome."""
+    from app.services.mail_dispatcher import MailDispatcher
+
+    recipients = ctx.payload["recipients"]
+    if not recipients:
+        raise JobFailed("No recipients")
+    sent = failed = 0
+    for start in range(0, len(recipients), EMAIL_CHUNK):
+        outcomes = await asyncio.gather(*(
+            MailDispatcher.enqueue(to, ctx.payload["subject"], ctx.payload["html"], ctx.tenant_id)
+            for to in recipients[start:start + EMAIL_CHUNK]
+        ))
+        sent += sum(1 for ok in outcomes if ok)
+        failed += sum(1 for ok in outcomes if not ok)
+        await ctx.progress(min(1.0, (start + EMAIL_CHUNK) / len(recipients)), f"{sent} sent, {failed} failed")
+    return {"sent": sent, "failed": failed}
@@ -0,0 +1,420 @@
+"""
+Job Queue Service
+Postgres-backed queue for work too slow to run inside an HTTP request
+(invoice runs, bulk ID cards, bulk extensions, bulk email). Jobs live in the
+master `jobs` table and are claimed with FOR UPDATE SKIP LOCKED, so any
+number of workers (the API process, `python -m app.worker`, or both) can
+share the queue. Schools with fewer running jobs are served first, failed
+jobs are retried with backoff, and handlers report progress that clients
+poll through /jobs/{job_id}.
+"""
+
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import time
+
+import asyncpg
+
+from app.core.config import settings
+from app.core.database import TenantDatabaseFactory
+
+logger = logging.getLogger(__name__)
+
+JOBS_DDL = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        tenant_id UUID REFERENCES tenants(tenant_id) ON DELETE CASCADE,
+        kind VARCHAR(100) NOT NULL,
+        payload JSONB NOT NULL DEFAULT '{}',
+        status VARCHAR(20) NOT NULL DEFAULT 'queued', -- queued, running, succeeded, failed, cancelled
+        priority SMALLINT NOT NULL DEFAULT 0,
+        attempts INT NOT NULL DEFAULT 0,
+        max_attempts INT NOT NULL DEFAULT 3,
+        run_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        progress REAL NOT NULL DEFAULT 0,
+        progress_message TEXT,
+        result JSONB,
+        last_error TEXT,
+        cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+        locked_by VARCHAR(100),
+        heartbeat_at TIMESTAMPTZ,
+        created_by UUID,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        started_at TIMESTAMPTZ,
+        finished_at TIMESTAMPTZ
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs (run_at) WHERE status = 'queued';
+    CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs (tenant_id) WHERE status = 'running';
+    CREATE INDEX IF NOT EXISTS idx_jobs_tenant ON jobs (tenant_id, created_at DESC);
+"""
+
+JOB_COLUMNS = """
+    job_id, tenant_id, kind, payload, status, priority, attempts, max_attempts, run_at,
+    progress, progress_message, result, last_error, cancel_requested,
+    created_by, created_at, started_at, finished_at
+"""
+
+# Take the due job whose school has the fewest jobs running, so one school's
+# 500-job backlog cannot starve everyone else. The per-school cap is checked
+# without a lock and may be overshot by a claim or two under a race.
+CLAIM_QUERY = f"""
+    WITH busy AS (
+        SELECT tenant_id, COUNT(*) AS running
+        FROM jobs WHERE status = 'running'
+        GROUP BY tenant_id
+    ), next AS (
+        SELECT j.job_id
+        FROM jobs j
+        LEFT JOIN busy b ON b.tenant_id IS NOT DISTINCT FROM j.tenant_id
+        WHERE j.status = 'queued' AND j.run_at <= NOW()
+          AND j.kind = ANY($2::text[])
+          AND COALESCE(b.running, 0) < $3
+        ORDER BY COALESCE(b.running, 0), j.priority DESC, j.run_at
+        LIMIT 1
+        FOR UPDATE OF j SKIP LOCKED
+    )
+    UPDATE jobs SET
+        status = 'running', attempts = jobs.attempts + 1, locked_by = $1,
+        started_at = COALESCE(jobs.started_at, NOW()), heartbeat_at = NOW()
+    FROM next
+    WHERE jobs.job_id = next.job_id
+    RETURNING {", ".join("jobs." + c.strip() for c in JOB_COLUMNS.split(","))}
+"""
+
+
+class JobFailed(Exception):
+    """Raised by a handler to fail its job without further retries."""
+
+
+class JobCancelled(Exception):
+    """The job was cancelled while it was running."""
+
+
+HANDLERS: Dict[str, Callable[["JobContext"], Awaitable[Optional[dict]]]] = {}
+
+
+def job_handler(kind: str):
+    """Register `async def handler(ctx) -> dict` as the implementation of a job kind."""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def job_to_dict(row) -> dict:
+    job = dict(row)
+    for key in ("payload", "result"):
+        if isinstance(job.get(key), str):
+            job[key] = json.loads(job[key])
+    return job
+
+
+class JobContext:
+    """What a handler sees: its payload, the pools, and progress reporting."""
+
+    def __init__(self, pool: asyncpg.Pool, job: dict):
+        self.pool = pool
+        self.job = job
+        self.job_id = job["job_id"]
+        self.tenant_id = job["tenant_id"]
+        self.payload = job["payload"] or {}
+        self._last_report = 0.0
+
+    async def tenant_pool(self) -> asyncpg.Pool:
+        """Pool for the job's school database."""
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow("""
+                SELECT tenant_id, supabase_project_url, supabase_service_key
+                FROM tenants WHERE tenant_id = $1
+            """, self.tenant_id)
+        if row is None:
+            raise JobFailed("School no longer exists")
+        return await TenantDatabaseFactory.get_pool_for_row(row)
+
+    async def progress(self, fraction: float, message: Optional[str] = None, force: bool = False):
+        """
+        Record progress (0..1). Writes at most once a second unless forced.
+        Raises JobCancelled if a cancel was requested meanwhile.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_report < 1.0:
+            return
+        self._last_report = now
+        async with self.pool.acquire() as conn:
+            cancel = await conn.fetchval("""
+                UPDATE jobs SET progress = $2, progress_message = COALESCE($3, progress_message), heartbeat_at = NOW()
+                WHERE job_id = $1
+                RETURNING cancel_requested
+            """, self.job_id, max(0.0, min(1.0, fraction)), message)
+        if cancel:
+            raise JobCancelled()
+
+
+class JobQueue:
+    _tasks: List[asyncio.Task] = []
+    _wakeup: Optional[asyncio.Event] = None
+    _listener: Optional[asyncpg.Connection] = None
+    _pool: Optional[asyncpg.Pool] = None
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    @staticmethod
+    async def _ensure_schema(conn: asyncpg.Connection):
+        await conn.execute(JOBS_DDL)
+
+    # ------------------------------------------------------------------
+    # Producers / status API
+    # ------------------------------------------------------------------
+
+    @classmethod
+    async def enqueue(
+        cls,
+        pool: asyncpg.Pool,
+        kind: str,
+        payload: dict,
+        tenant_id=None,
+        created_by=None,
+        priority: int = 0,
+        max_attempts: Optional[int] = None,
+    ) -> dict:
+        """Queue a job and wake the workers. Returns {"job_id", "status"}."""
+        query = """
+            WITH j AS (
+                INSERT INTO jobs (tenant_id, kind, payload, priority, max_attempts, created_by)
+                VALUES ($1, $2, $3::jsonb, $4, $5, $6)
+                RETURNING job_id
+            )
+            SELECT job_id, pg_notify('jobs', '') FROM j
+        """
+        args = (tenant_id, kind, json.dumps(payload, default=str), priority,
+                max_attempts or settings.JOB_MAX_ATTEMPTS, created_by)
+        async with pool.acquire() as conn:
+            try:
+                job_id = await conn.fetchval(query, *args)
+            except asyncpg.UndefinedTableError:
+                await cls._ensure_schema(conn)
+                job_id = await conn.fetchval(query, *args)
+        return {"job_id": str(job_id), "status": "queued"}
+
+    @classmethod
+    async def get(cls, pool: asyncpg.Pool, job_id, tenant_id=None) -> Optional[dict]:
+        """A job, restricted to `tenant_id` when given (None for admin/system jobs)."""
+        async with pool.acquire() as conn:
+            try:
+                row = await conn.fetchrow(f"""
+                    SELECT {JOB_COLUMNS} FROM jobs
+                    WHERE job_id = $1 AND tenant_id IS NOT DISTINCT FROM $2
+                """, job_id, tenant_id)
+            except asyncpg.UndefinedTableError:
+                return None
+        return job_to_dict(row) if row else None
+
+    @classmethod
+    async def list_jobs(cls, pool: asyncpg.Pool, tenant_id=None, status: Optional[str] = None, limit: int = 50) -> List[dict]:
+        # Plain equality (not IS NOT DISTINCT FROM) so idx_jobs_tenant is usable
+        owner = "tenant_id = $1" if tenant_id is not None else "tenant_id IS NULL AND $1::uuid IS NULL"
+        async with pool.acquire() as conn:
+            try:
+                rows = await conn.fetch(f"""
+                    SELECT {JOB_COLUMNS} FROM jobs
+                    WHERE {owner} AND ($2::text IS NULL OR status = $2::text)
+                    ORDER BY created_at DESC
+                    LIMIT $3
+                """, tenant_id, status, limit)
+            except asyncpg.UndefinedTableError:
+                return []
+        return [job_to_dict(r) for r in rows]
+
+    @classmethod
+    async def cancel(cls, pool: asyncpg.Pool, job_id, tenant_id=None) -> Optional[str]:
+        """
+        Cancel a queued job outright, or ask a running one to stop at its next
+        progress report. Returns the resulting status, None if no such job.
+        """
+        async with pool.acquire() as conn:
+            return await conn.fetchval("""
+                UPDATE jobs SET
+                    status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                    finished_at = CASE WHEN status = 'queued' THEN NOW() ELSE finished_at END,
+                    cancel_requested = cancel_requested OR status = 'running'
+                WHERE job_id = $1 AND tenant_id IS NOT DISTINCT FROM $2
+                RETURNING status
+            """, job_id, tenant_id)
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    @classmethod
+    async def claim(cls, pool: asyncpg.Pool) -> Optional[dict]:
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow(CLAIM_QUERY, cls.worker_id, list(HANDLERS), settings.JOB_TENANT_CONCURRENCY)
+        return job_to_dict(row) if row else None
+
+    @classmethod
+    async def _finish(cls, pool: asyncpg.Pool, job: dict, status: str, result=None, error: Optional[str] = None,
+                      retry_in: Optional[float] = None):
+        # Matching attempts guards against a job requeued as stale and claimed
+        # again elsewhere: only the current attempt may record the outcome.
+        async with pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE jobs SET
+                    status = $3::text,
+                    result = COALESCE($4::jsonb, result),
+                    last_error = $5,
+                    progress = CASE WHEN $3::text = 'succeeded' THEN 1 ELSE progress END,
+                    run_at = CASE WHEN $6::float8 IS NULL THEN run_at ELSE NOW() + make_interval(secs => $6::float8) END,
+                    finished_at = CASE WHEN $3::text = 'queued' THEN NULL ELSE NOW() END,
+                    locked_by = NULL
+                WHERE job_id = $1 AND attempts = $2 AND status = 'running'
+            """, job["job_id"], job["attempts"], status,
+                json.dumps(result, default=str) if result is not None else None, error, retry_in)
+
+    @classmethod
+    async def _heartbeat(cls, pool: asyncpg.Pool, job_id):
+        """Keep a job that reports no progress from being taken for stale."""
+        while True:
+            await asyncio.sleep(max(1, settings.JOB_STALE_AFTER / 3))
+            try:
+                async with pool.acquire() as conn:
+                    await conn.execute("UPDATE jobs SET heartbeat_at = NOW() WHERE job_id = $1", job_id)
+            except Exception as e:
+                logger.warning(f"Heartbeat for job {job_id} failed: {e}")
+
+    @classmethod
+    async def run(cls, pool: asyncpg.Pool, job: dict):
+        """Run a claimed job and record its outcome."""
+        handler = HANDLERS[job["kind"]]
+        heartbeat = asyncio.create_task(cls._heartbeat(pool, job["job_id"]))
+        started = time.monotonic()
+        try:
+            result = await handler(JobContext(pool, job))
+        except JobCancelled:
+            await cls._finish(pool, job, "cancelled", error="Cancelled")
+            logger.info(f"Job {job['job_id']} ({job['kind']}) cancelled")
+        except JobFailed as e:
+            await cls._finish(pool, job, "failed", error=str(e))
+            logger.warning(f"Job {job['job_id']} ({job['kind']}) failed: {e}")
+        except Exception as e:
+            if job["attempts"] < job["max_attempts"]:
+                delay = min(30 * 2 ** (job["attempts"] - 1), 3600) * random.uniform(0.8, 1.2)
+                await cls._finish(pool, job, "queued", error=str(e), retry_in=delay)
+                logger.warning(f"Job {job['job_id']} ({job['kind']}) attempt {job['attempts']} failed ({e}); retry in {delay:.0f}s")
+            else:
+                await cls._finish(pool, job, "failed", error=str(e))
+                logger.error(f"Job {job['job_id']} ({job['kind']}) failed after {job['attempts']} attempts: {e}")
+        else:
+            await cls._finish(pool, job, "succeeded", result=result)
+            logger.info(f"Job {job['job_id']} ({job['kind']}) done in {time.monotonic() - started:.1f}s")
+        finally:
+            heartbeat.cancel()
+
+    @classmethod
+    async def requeue_stale(cls, pool: asyncpg.Pool) -> int:
+        """Put back jobs whose worker stopped heartbeating (crash, deploy, OOM)."""
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                UPDATE jobs SET
+                    status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                    finished_at = CASE WHEN attempts >= max_attempts THEN NOW() ELSE NULL END,
+                    last_error = 'Worker stopped responding', locked_by = NULL
+                WHERE status = 'running' AND heartbeat_at < NOW() - make_interval(secs => $1)
+                RETURNING job_id
+            """, settings.JOB_STALE_AFTER)
+        if rows:
+            logger.warning(f"Requeued {len(rows)} stale jobs")
+        return len(rows)
+
+    @classmethod
+    async def _worker(cls, pool: asyncpg.Pool, number: int):
+        while True:
+            try:
+                job = await cls.claim(pool)
+            except asyncpg.UndefinedTableError:
+                async with pool.acquire() as conn:
+                    await cls._ensure_schema(conn)
+                continue
+            except Exception as e:
+                logger.error(f"Job worker {number} could not claim: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(cls._wakeup.wait(), timeout=settings.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                cls._wakeup.clear()
+                continue
+            await cls.run(pool, job)
+
+    @classmethod
+    async def _maintenance(cls, pool: asyncpg.Pool):
+        from app.services.notifications import drain_notifications
+
+        while True:
+            try:
+                await cls.requeue_stale(pool)
+            except asyncpg.UndefinedTableError:
+                pass
+            except Exception as e:
+                logger.error(f"Stale job sweep failed: {e}")
+            if settings.EMAILS_FROM_EMAIL:
+                try:
+                    # Keep draining while full batches come back
+                    while await drain_notifications(pool) >= settings.NOTIFICATION_BATCH_SIZE:
+                        pass
+                except Exception as e:
+                    logger.error(f"Notification drain failed: {e}")
+            await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+
+    @classmethod
+    async def start(cls, pool: asyncpg.Pool, concurrency: int):
+        """Start `concurrency` workers plus the stale-job sweep and notification drain."""
+        if cls._tasks or concurrency <= 0:
+            return
+        import app.services.job_handlers  # noqa: F401  (registers the handlers)
+
+        cls._pool = pool
+        cls._wakeup = asyncio.Event()
+        try:
+            cls._listener = await pool.acquire()
+            await cls._listener.add_listener("jobs", lambda *_: cls._wakeup.set())
+        except Exception as e:
+            # Polling alone still works, just with JOB_POLL_INTERVAL latency
+            logger.warning(f"LISTEN jobs unavailable ({e}); polling only")
+            if cls._listener is not None:
+                await pool.release(cls._listener)
+            cls._listener = None
+        cls._tasks = [asyncio.create_task(cls._worker(pool, i)) for i in range(concurrency)]
+        cls._tasks.append(asyncio.create_task(cls._maintenance(pool)))
+        logger.info(f"Job queue started ({concurrency} workers, id {cls.worker_id})")
+
+    @classmethod
+    async def stop(cls):
+        """Stop the workers and hand their unfinished jobs back to the queue (or fail them if out of attempts)."""
+        if not cls._tasks:
+            return
+        for task in cls._tasks:
+            task.cancel()
+        await asyncio.gather(*cls._tasks, return_exceptions=True)
+        cls._tasks = []
+        if cls._listener is not None:
+            # Releasing resets the connection, which also drops the LISTEN
+            await cls._pool.release(cls._listener)
+            cls._listener = None
+        try:
+            async with cls._pool.acquire() as conn:
+                # Same rule as requeue_stale: jobs out of attempts (all non-idempotent
+                # kinds) fail rather than run again after every deploy
+                await conn.execute("""
+                    UPDATE jobs SET
+                        status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                        finished_at = CASE WHEN attempts >= max_attempts THEN NOW() ELSE NULL END,
+                        last_error = 'Interrupted by worker shutdown', locked_by = NULL, run_at = NOW()
+                    WHERE status = 'running' AND locked_by = $1
+                """, cls.worker_id)
+        except Exception as e:
+            logger.warning(f"Could not requeue interrupted jobs (the stale sweep will): {e}")
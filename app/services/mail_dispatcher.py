@@ -0,0 +1,278 @@
+"""
+Mail Dispatcher Service
+Sends outgoing email through a small pool of persistent SMTP sessions.
+Each worker keeps one authenticated connection open and sends many
+messages over it, so a 3,000-recipient reminder costs a handful of TLS
+handshakes instead of 3,000. Messages are rate limited per tenant and
+retried with exponential backoff on transient failures.
+
+Interactive mail (password recovery codes) does not join that queue: it is
+sent directly on its own short-lived session with a short overall timeout,
+so a user waiting for a code is never behind a bulk send or its retries.
+"""
+
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import random
+
+import aiosmtplib
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OutgoingMail:
+    to: str
+    subject: str
+    html: str
+    tenant_id: Optional[str] = None
+    attempts: int = 0
+    # A send slot was already reserved with the rate limiter for this attempt
+    reserved: bool = False
+    result: Optional[asyncio.Future] = field(default=None, repr=False)
+
+
+def build_message(mail: OutgoingMail) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = f"{settings.EMAILS_FROM_NAME} <{settings.EMAILS_FROM_EMAIL}>"
+    message["To"] = mail.to
+    message["Subject"] = mail.subject
+    message.set_content("Please view the HTML version of this email.")
+    message.add_alternative(mail.html, subtype="html")
+    return message
+
+
+def is_transient(error: Exception) -> bool:
+    """Connection problems and 4xx replies are worth retrying; 5xx replies are not."""
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(400 <= e.code < 500 for e in error.recipients)
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return 400 <= error.code < 500
+    return isinstance(error, (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError))
+
+
+class TenantRateLimiter:
+    """
+    Token bucket per tenant: SMTP_TENANT_RATE messages per minute, bursting to
+    one minute's worth. Tokens may go negative: a message that cannot go now
+    reserves the next free slot, so a backlog is spread out at exactly the
+    allowed rate instead of every deferred message retrying at once.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[str, list] = {}
+
+    def delay(self, tenant_id) -> float:
+        """Reserve a send slot; returns seconds until it (0 = send now)."""
+        rate = settings.SMTP_TENANT_RATE / 60.0
+        if rate <= 0 or tenant_id is None:
+            return 0.0
+        now = asyncio.get_running_loop().time()
+        tokens, last = self._buckets.get(str(tenant_id), (settings.SMTP_TENANT_RATE, now))
+        tokens = min(settings.SMTP_TENANT_RATE, tokens + (now - last) * rate) - 1
+        self._buckets[str(tenant_id)] = [tokens, now]
+        return 0.0 if tokens >= 0 else -tokens / rate
+
+
+class MailDispatcher:
+    _queue: Optional[asyncio.Queue] = None
+    _workers: List[asyncio.Task] = []
+    # Messages waiting on a retry/rate-limit timer (not in the queue), by id()
+    _deferred_mail: Dict[int, OutgoingMail] = {}
+    _limiter = TenantRateLimiter()
+
+    @classmethod
+    def start(cls):
+        if cls._queue is not None:
+            return
+        cls._queue = asyncio.Queue()
+        cls._workers = [asyncio.create_task(cls._worker(i)) for i in range(settings.SMTP_POOL_SIZE)]
+        logger.info(f"Mail dispatcher started ({settings.SMTP_POOL_SIZE} SMTP sessions)")
+
+    @classmethod
+    async def stop(cls, drain_timeout: float = 10):
+        """Give queued mail a moment to go out, then close the sessions."""
+        if cls._queue is None:
+            return
+        try:
+            await asyncio.wait_for(cls._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+        unsent = cls._queue.qsize() + len(cls._deferred_mail)
+        if unsent:
+            # Includes messages parked on retry or rate-limit timers, which join() does not see
+            logger.warning(f"Mail dispatcher stopped with {unsent} messages unsent "
+                           f"({len(cls._deferred_mail)} waiting to retry)")
+        for mail in cls._deferred_mail.values():
+            cls._finish(mail, False)
+        cls._deferred_mail = {}
+        for task in cls._workers:
+            task.cancel()
+        await asyncio.gather(*cls._workers, return_exceptions=True)
+        cls._workers = []
+        cls._queue = None
+
+    @classmethod
+    def enqueue(cls, to: str, subject: str, html: str, tenant_id=None) -> asyncio.Future:
+        """Queue one message; the returned future resolves to True/False once it is sent or given up."""
+        cls.start()
+        mail = OutgoingMail(to=to, subject=subject, html=html,
+                            tenant_id=str(tenant_id) if tenant_id else None,
+                            result=asyncio.get_running_loop().create_future())
+        cls._queue.put_nowait(mail)
+        return mail.result
+
+    @classmethod
+    def enqueue_many(cls, recipients: List[str], subject: str, html: str, tenant_id=None) -> int:
+        """Queue the same message to many recipients (one email each); returns how many were queued."""
+        for to in recipients:
+            cls.enqueue(to, subject, html, tenant_id)
+        return len(recipients)
+
+    @classmethod
+    async def send(cls, to: str, subject: str, html: str, tenant_id=None) -> bool:
+        """Queue a message and wait for the outcome."""
+        return await cls.enqueue(to, subject, html, tenant_id)
+
+    @classmethod
+    async def send_direct(cls, to: str, subject: str, html: str, timeout: Optional[float] = None) -> bool:
+        """
+        Send one interactive message on its own session, bypassing the queue.
+        Retries a transient failure once while the overall timeout allows.
+        """
+        mail = OutgoingMail(to=to, subject=subject, html=html)
+        timeout = timeout or settings.SMTP_INTERACTIVE_TIMEOUT
+
+        async def attempt():
+            smtp = await cls._connect(timeout)
+            try:
+                await smtp.send_message(build_message(mail))
+            finally:
+                await cls._close(smtp)
+
+        deadline = asyncio.get_running_loop().time() + timeout
+        for attempts in (1, 2):
+            remaining = deadline - asyncio.get_running_loop().time()
+            try:
+                await asyncio.wait_for(attempt(), timeout=remaining)
+                return True
+            except Exception as e:
+                if attempts == 2 or not is_transient(e) or remaining <= 1:
+                    logger.error(f"Failed to send email to {to}: {e}")
+                    return False
+                logger.warning(f"Email to {to} failed ({e}); retrying once")
+        return False
+
+    @classmethod
+    def _requeue(cls, mail: OutgoingMail, delay: float):
+        queue = cls._queue
+        cls._deferred_mail[id(mail)] = mail
+
+        def put_back():
+            # task_done for this attempt happens in the worker; the retry counts as new work
+            if cls._deferred_mail.pop(id(mail), None) is not None and cls._queue is queue:
+                queue.put_nowait(mail)
+
+        asyncio.get_running_loop().call_later(delay, put_back)
+
+    @classmethod
+    def _retry_or_fail(cls, mail: OutgoingMail, error: Exception):
+        mail.attempts += 1
+        if is_transient(error) and mail.attempts < settings.SMTP_MAX_RETRIES:
+            delay = min(2 ** mail.attempts, 300) * random.uniform(0.8, 1.2)
+            logger.warning(f"Email to {mail.to} failed ({error}); retry {mail.attempts} in {delay:.0f}s")
+            cls._requeue(mail, delay)
+        else:
+            logger.error(f"Failed to send email to {mail.to}: {error}")
+            cls._finish(mail, False)
+
+    @staticmethod
+    def _finish(mail: OutgoingMail, ok: bool):
+        if mail.result is not None and not mail.result.done():
+            mail.result.set_result(ok)
+
+    @classmethod
+    async def _connect(cls, timeout: Optional[float] = None) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(
+            hostname=settings.SMTP_HOST,
+            port=settings.SMTP_PORT,
+            use_tls=settings.SMTP_PORT == 465,
+            start_tls=settings.SMTP_PORT == 587,
+            timeout=timeout or settings.SMTP_TIMEOUT,
+        )
+        await smtp.connect()
+        if settings.SMTP_USER:
+            await smtp.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+        return smtp
+
+    @staticmethod
+    async def _close(smtp: Optional[aiosmtplib.SMTP]):
+        if smtp is None:
+            return
+        try:
+            if smtp.is_connected:
+                await smtp.quit()
+        except Exception:
+            smtp.close()
+
+    @classmethod
+    async def _worker(cls, number: int):
+        queue = cls._queue
+        smtp: Optional[aiosmtplib.SMTP] = None
+        sent_on_session = 0
+        try:
+            while True:
+                try:
+                    # An idle session is closed rather than held open indefinitely
+                    mail = await asyncio.wait_for(queue.get(), timeout=settings.SMTP_IDLE_TIMEOUT if smtp else None)
+                except asyncio.TimeoutError:
+                    await cls._close(smtp)
+                    smtp, sent_on_session = None, 0
+                    continue
+
+                # Take whatever else is already waiting, up to a batch, for this session
+                batch = [mail]
+                while len(batch) < settings.SMTP_BATCH_SIZE and not queue.empty():
+                    batch.append(queue.get_nowait())
+
+                for position, mail in enumerate(batch):
+                    try:
+                        if not mail.reserved:
+                            wait = cls._limiter.delay(mail.tenant_id)
+                            if wait:
+                                # Comes back exactly when its reserved slot opens
+                                mail.reserved = True
+                                cls._requeue(mail, wait)
+                                continue
+                        mail.reserved = False
+                        if smtp is None or not smtp.is_connected or sent_on_session >= settings.SMTP_MESSAGES_PER_SESSION:
+                            await cls._close(smtp)
+                            smtp, sent_on_session = None, 0
+                            try:
+                                smtp = await cls._connect()
+                            except Exception as e:
+                                # Server unreachable: back off the whole rest of the batch
+                                # instead of waiting out a connect timeout per message
+                                for waiting in batch[position:]:
+                                    cls._retry_or_fail(waiting, e)
+                                for _ in batch[position + 1:]:
+                                    queue.task_done()
+                                break
+                        await smtp.send_message(build_message(mail))
+                        sent_on_session += 1
+                        cls._finish(mail, True)
+                    except Exception as e:
+                        if not isinstance(e, (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused)):
+                            # The session may be unusable; start a fresh one next time
+                            await cls._close(smtp)
+                            smtp = None
+                        cls._retry_or_fail(mail, e)
+                    finally:
+                        queue.task_done()
+        finally:
+            await cls._close(smtp)
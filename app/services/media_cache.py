@@ -0,0 +1,207 @@
+"""
+Media Cache Service
+Content-addressed disk cache for generated ID card media (QR code PNGs,
+resized photo thumbnails). Entries are keyed by a hash of their inputs, so
+the key doubles as a strong ETag, and the directory is kept under a byte
+budget with least-recently-used eviction shared by all worker processes.
+"""
+
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, Tuple
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: sweeps are not serialised across processes
+    fcntl = None
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+IMAGING_AVAILABLE = False
+try:
+    from PIL import Image, ImageOps
+    import qrcode
+    IMAGING_AVAILABLE = True
+except ImportError as e:
+    logger.warning(f"Imaging libraries not found ({e}). QR/thumbnail cache will be disabled.")
+
+# Bump to invalidate every cached QR/thumbnail when the generators change
+MEDIA_VERSION = "1"
+THUMBNAIL_SIZES = (64, 128, 256, 512, 1024)
+
+
+def content_key(*parts) -> str:
+    """sha256 over the inputs that fully determine an entry's bytes."""
+    digest = hashlib.sha256(MEDIA_VERSION.encode())
+    for part in parts:
+        digest.update(b"\x00" + str(part).encode())
+    return digest.hexdigest()
+
+
+def snap_thumbnail_size(size: int) -> int:
+    """Round a requested size up to one of the cached sizes (bounds cache variety)."""
+    for allowed in THUMBNAIL_SIZES:
+        if size <= allowed:
+            return allowed
+    return THUMBNAIL_SIZES[-1]
+
+
+def render_qr_png(value: str, size: int) -> bytes:
+    qr = qrcode.QRCode(border=1, box_size=10)
+    qr.add_data(value)
+    image = qr.make_image(fill_color="black", back_color="white").get_image().convert("L")
+    image = image.resize((size, size), Image.NEAREST)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def render_thumbnail(data: bytes, size: int) -> bytes:
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("RGB")
+    image.thumbnail((size, size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85, optimize=True)
+    return buffer.getvalue()
+
+
+class MediaCache:
+    """
+    Disk store under MEDIA_CACHE_DIR, sharded by the first two hex digits.
+    The directory is shared by every worker process, so it is the only source
+    of truth: hits touch the file, file mtimes give the LRU order, and the
+    byte budget is enforced by a directory sweep that one process at a time
+    runs under an exclusive lock file. Files touched within EVICT_GRACE seconds
+    are never evicted, so a path just handed to a response stays readable.
+    """
+
+    EVICT_GRACE = 300
+    SWEEP_INTERVAL = 30
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = asyncio.Lock()
+        self._building: dict = {}
+        self._last_sweep = 0.0
+
+    def path_for(self, key: str, suffix: str) -> Path:
+        return self.root / key[:2] / f"{key}{suffix}"
+
+    def _sweep(self) -> int:
+        """Evict least recently used files until the directory fits the budget. Returns files removed."""
+        if not self.root.exists():
+            return 0
+        with open(self.root / ".evict.lock", "w") as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return 0  # Another process is sweeping
+            files, total = [], 0
+            for path in self.root.glob("*/*"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                # Includes .tmp leftovers of crashed writers; live ones are within the grace period
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+            if total <= self.max_bytes:
+                return 0
+            cutoff = time.time() - self.EVICT_GRACE
+            removed = 0
+            for mtime, size, path in sorted(files, key=lambda f: f[0]):
+                if total <= self.max_bytes or mtime >= cutoff:
+                    break
+                try:
+                    path.unlink()
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+            return removed
+
+    async def _maybe_sweep(self):
+        if time.monotonic() - self._last_sweep < self.SWEEP_INTERVAL:
+            return
+        self._last_sweep = time.monotonic()
+        try:
+            await asyncio.to_thread(self._sweep)
+        except OSError as e:
+            logger.warning(f"Media cache sweep failed: {e}")
+
+    def _write(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    async def get_or_create(self, key: str, suffix: str,
+                            producer: Callable[[], Awaitable[Optional[bytes]]]) -> Optional[Path]:
+        """Path of the cached entry, producing and storing it on a miss."""
+        path = self.path_for(key, suffix)
+        name = path.name
+        async with self._lock:
+            try:
+                # Touch on hit: refreshes the LRU order and the eviction grace period
+                os.utime(path)
+                return path
+            except FileNotFoundError:
+                pass
+            except OSError:
+                return path
+            # Concurrent misses for the same key share one build, which only
+            # resolves once the file is on disk
+            building = self._building.get(name)
+            if building is None:
+                building = asyncio.ensure_future(self._build(path, producer))
+                self._building[name] = building
+                building.add_done_callback(lambda _: self._building.pop(name, None))
+
+        # Shielded: one client going away must not cancel the build for the others
+        return await asyncio.shield(building)
+
+    async def _build(self, path: Path, producer: Callable[[], Awaitable[Optional[bytes]]]) -> Optional[Path]:
+        data = await producer()
+        if not data:
+            return None
+        await asyncio.to_thread(self._write, path, data)
+        await self._maybe_sweep()
+        return path
+
+    async def qr_png(self, value: str, size: int = 256, version: str = "default") -> Tuple[Optional[Path], str]:
+        """(path, etag) for a QR code encoding `value`."""
+        key = content_key("qr", value, size, version)
+
+        async def produce():
+            return await asyncio.to_thread(render_qr_png, value, size)
+
+        return await self.get_or_create(key, ".png", produce), key
+
+    async def thumbnail(self, url: str, size: int,
+                        fetch: Callable[[str], Awaitable[Optional[bytes]]]) -> Tuple[Optional[Path], str]:
+        """(path, etag) for a photo resized to fit size x size; `fetch` downloads the original."""
+        size = snap_thumbnail_size(size)
+        key = content_key("thumb", url, size)
+
+        async def produce():
+            data = await fetch(url)
+            if not data:
+                return None
+            try:
+                return await asyncio.to_thread(render_thumbnail, data, size)
+            except Exception as e:
+                logger.warning(f"Could not build thumbnail for {url}: {e}")
+                return None
+
+        return await self.get_or_create(key, ".jpg", produce), key
+
+
+media_cache = MediaCache(settings.MEDIA_CACHE_DIR, settings.MEDIA_CACHE_MAX_MB * 1024 * 1024)
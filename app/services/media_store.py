@@ -0,0 +1,410 @@
+"""
+Media Store Service
+Content-addressed, deduplicated storage for uploaded media. Each object is
+stored once under MEDIA_STORE_DIR at its sha256 (sharded ab/cd/<sha>.<ext>)
+and referenced per tenant in the master DB; a file is removed when the last
+reference across all tenants is released. Object URLs never change content,
+so they are served as immutable.
+
+Each tenant's byte usage (distinct objects it references) is kept in
+tenant_storage_usage, updated in the same transaction as its references,
+so quota checks and the dashboard are a primary-key lookup. A background
+reconciler periodically recounts it and sweeps unreferenced files.
+
+Files are only unlinked while their media_objects row is locked (release)
+or while object inserts are blocked (the orphan sweep), and add_refs checks
+every file still exists once it holds the row locks. An upload racing a
+delete of the same content therefore either keeps the file alive or gets
+MediaObjectMissing and stores it again.
+"""
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+import asyncpg
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+OBJECT_NAME = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]{1,5})$")
+
+MEDIA_STORE_DDL = """
+    CREATE TABLE IF NOT EXISTS media_objects (
+        sha256 CHAR(64) PRIMARY KEY,
+        ext VARCHAR(10) NOT NULL,
+        bytes BIGINT NOT NULL,
+        created_at TIMESTAMPTZ DEFAULT NOW()
+    );
+    CREATE TABLE IF NOT EXISTS media_refs (
+        tenant_id UUID NOT NULL REFERENCES tenants(tenant_id) ON DELETE CASCADE,
+        sha256 CHAR(64) NOT NULL REFERENCES media_objects(sha256) ON DELETE CASCADE,
+        refs INTEGER NOT NULL CHECK (refs > 0),
+        created_at TIMESTAMPTZ DEFAULT NOW(),
+        PRIMARY KEY (tenant_id, sha256)
+    );
+    CREATE INDEX IF NOT EXISTS idx_media_refs_sha ON media_refs(sha256);
+    CREATE TABLE IF NOT EXISTS tenant_storage_usage (
+        tenant_id UUID PRIMARY KEY REFERENCES tenants(tenant_id) ON DELETE CASCADE,
+        bytes_used BIGINT NOT NULL DEFAULT 0,
+        objects INTEGER NOT NULL DEFAULT 0,
+        limit_mb INTEGER,
+        reconciled_at TIMESTAMPTZ,
+        updated_at TIMESTAMPTZ DEFAULT NOW()
+    );
+"""
+
+# Store subdirectories that are not objects
+NON_OBJECT_DIRS = {"derived", "uploads", "incoming"}
+RECONCILE_LOCK_KEY = 0x6D656469  # pg advisory lock id ("medi")
+
+
+class StorageQuotaExceeded(Exception):
+    """The tenant's stored bytes would exceed its storage limit."""
+
+
+class MediaObjectMissing(Exception):
+    """A stored object was deleted before it could be referenced; store it again."""
+
+
+def object_path(sha256: str, ext: str) -> Path:
+    return Path(settings.MEDIA_STORE_DIR) / sha256[:2] / sha256[2:4] / f"{sha256}{ext}"
+
+
+def object_name(path: Path) -> str:
+    """'<sha><ext>' for a stored object path; also its URL segment."""
+    return path.name
+
+
+def parse_object_name(name: str):
+    """(sha256, ext) for a valid object name, else None."""
+    match = OBJECT_NAME.match(name or "")
+    return (match.group(1), match.group(2)) if match else None
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def put_file(source: Path, sha256: Optional[str] = None) -> Path:
+    """
+    Move `source` into the store under its hash (blocking; run in a thread).
+    If the object already exists the new copy is simply discarded.
+    """
+    sha256 = sha256 or file_sha256(source)
+    dest = object_path(sha256, source.suffix.lower())
+    if dest.exists():
+        source.unlink(missing_ok=True)
+    else:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, dest)
+    return dest
+
+
+# Derived variants are a pure function of the source bytes, so a repeat upload
+# of the same file reuses them without decoding anything.
+
+def derivation_path(source_sha256: str) -> Path:
+    return Path(settings.MEDIA_STORE_DIR) / "derived" / source_sha256[:2] / f"{source_sha256}.json"
+
+
+def read_derivation(source_sha256: str) -> Optional[Dict[str, Path]]:
+    path = derivation_path(source_sha256)
+    try:
+        names = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    files = {}
+    for variant, name in names.items():
+        parsed = parse_object_name(name)
+        if not parsed or not object_path(*parsed).is_file():
+            return None
+        files[variant] = object_path(*parsed)
+    return files
+
+
+def write_derivation(source_sha256: str, files: Dict[str, Path]):
+    path = derivation_path(source_sha256)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps({variant: object_name(p) for variant, p in files.items()}))
+    os.replace(tmp, path)
+
+
+class MediaStore:
+    @staticmethod
+    async def _ensure_schema(conn: asyncpg.Connection):
+        await conn.execute(MEDIA_STORE_DDL)
+
+    @classmethod
+    async def usage(cls, pool: asyncpg.Pool, tenant_id) -> dict:
+        """{"bytes_used", "objects", "limit_bytes"} for a tenant (one primary-key lookup)."""
+        query = "SELECT bytes_used, objects, limit_mb FROM tenant_storage_usage WHERE tenant_id = $1"
+        async with pool.acquire() as conn:
+            try:
+                row = await conn.fetchrow(query, tenant_id)
+            except asyncpg.UndefinedTableError:
+                await cls._ensure_schema(conn)
+                row = None
+        limit_mb = (row["limit_mb"] if row else None) or settings.STORAGE_LIMIT_MB
+        return {
+            "bytes_used": row["bytes_used"] if row else 0,
+            "objects": row["objects"] if row else 0,
+            "limit_bytes": limit_mb * 1024 * 1024,
+        }
+
+    @classmethod
+    async def add_refs(cls, pool: asyncpg.Pool, tenant_id, paths: Iterable[Path]) -> List[dict]:
+        """
+        Record one reference from `tenant_id` to each stored object and charge
+        the tenant for objects it did not reference before. Raises
+        StorageQuotaExceeded (nothing recorded) if that would pass its limit,
+        or MediaObjectMissing if a file was deleted by a concurrent release or
+        sweep before it could be referenced. Returns the newly referenced objects.
+        """
+        paths = sorted(paths, key=lambda p: p.name)  # Consistent lock order
+        objects = []
+        for path in paths:
+            sha256, ext = parse_object_name(path.name)
+            try:
+                objects.append((sha256, ext, path.stat().st_size))
+            except FileNotFoundError:
+                raise MediaObjectMissing(path.name)
+
+        async def apply(conn):
+            async with conn.transaction():
+                # DO UPDATE (a no-op) rather than DO NOTHING: it row-locks existing objects,
+                # waiting out any release that is deleting them
+                await conn.executemany("""
+                    INSERT INTO media_objects (sha256, ext, bytes) VALUES ($1, $2, $3)
+                    ON CONFLICT (sha256) DO UPDATE SET ext = media_objects.ext
+                """, objects)
+                missing = [p.name for p in paths if not await asyncio.to_thread(p.is_file)]
+                if missing:
+                    raise MediaObjectMissing(", ".join(missing))
+                rows = await conn.fetch("""
+                    INSERT INTO media_refs (tenant_id, sha256, refs)
+                    SELECT $1, sha, COUNT(*) FROM unnest($2::text[]) AS sha GROUP BY sha
+                    ON CONFLICT (tenant_id, sha256) DO UPDATE SET refs = media_refs.refs + EXCLUDED.refs
+                    RETURNING sha256, (xmax = 0) AS inserted
+                """, tenant_id, [o[0] for o in objects])
+                sizes = {o[0]: o[2] for o in objects}
+                new = [{"sha256": r["sha256"], "bytes": sizes[r["sha256"]]} for r in rows if r["inserted"]]
+                if new:
+                    # The row lock serialises concurrent uploads of one tenant
+                    usage = await conn.fetchrow("""
+                        INSERT INTO tenant_storage_usage (tenant_id, bytes_used, objects)
+                        VALUES ($1, $2, $3)
+                        ON CONFLICT (tenant_id) DO UPDATE SET
+                            bytes_used = tenant_storage_usage.bytes_used + EXCLUDED.bytes_used,
+                            objects = tenant_storage_usage.objects + EXCLUDED.objects,
+                            updated_at = NOW()
+                        RETURNING bytes_used, COALESCE(limit_mb, $4)::bigint * 1048576 AS limit_bytes
+                    """, tenant_id, sum(o["bytes"] for o in new), len(new), settings.STORAGE_LIMIT_MB)
+                    if usage["bytes_used"] > usage["limit_bytes"]:
+                        raise StorageQuotaExceeded("Storage limit reached for this school")
+            return new
+
+        async with pool.acquire() as conn:
+            try:
+                return await apply(conn)
+            except asyncpg.UndefinedTableError:
+                await cls._ensure_schema(conn)
+                return await apply(conn)
+
+    @classmethod
+    async def release(cls, pool: asyncpg.Pool, tenant_id, names: Iterable[str]) -> List[dict]:
+        """
+        Drop one reference per object name. Objects no tenant references any
+        more are deleted from disk. Returns the objects this tenant no longer references.
+        """
+        shas = [parsed[0] for parsed in map(parse_object_name, names) if parsed]
+        if not shas:
+            return []
+        async with pool.acquire() as conn, conn.transaction():
+            # Lock the objects before their references (the order add_refs uses): a
+            # concurrent add_refs either committed its references already or waits
+            objects = await conn.fetch("""
+                SELECT sha256, ext, bytes FROM media_objects
+                WHERE sha256 = ANY($1::text[])
+                ORDER BY sha256
+                FOR UPDATE
+            """, shas)
+            # References dropping to zero are deleted; the rest are decremented
+            released = await conn.fetch("""
+                WITH dec AS (SELECT sha, COUNT(*) AS n FROM unnest($2::text[]) AS sha GROUP BY sha)
+                DELETE FROM media_refs r
+                USING dec
+                WHERE r.tenant_id = $1 AND r.sha256 = dec.sha AND r.refs <= dec.n
+                RETURNING r.sha256
+            """, tenant_id, shas)
+            await conn.execute("""
+                WITH dec AS (SELECT sha, COUNT(*) AS n FROM unnest($2::text[]) AS sha GROUP BY sha)
+                UPDATE media_refs r SET refs = r.refs - dec.n
+                FROM dec
+                WHERE r.tenant_id = $1 AND r.sha256 = dec.sha
+            """, tenant_id, shas)
+            gone = [r["sha256"] for r in released]
+            sizes = {o["sha256"]: o["bytes"] for o in objects}
+            still_used = {r["sha256"] for r in await conn.fetch(
+                "SELECT DISTINCT sha256 FROM media_refs WHERE sha256 = ANY($1::text[])", gone
+            )} if gone else set()
+            orphans = [o for o in objects if o["sha256"] in gone and o["sha256"] not in still_used]
+            # Unlink before the rows go, while they are still locked
+            for o in orphans:
+                await asyncio.to_thread(object_path(o["sha256"], o["ext"]).unlink, True)
+            if orphans:
+                await conn.execute(
+                    "DELETE FROM media_objects WHERE sha256 = ANY($1::text[])", [o["sha256"] for o in orphans]
+                )
+            if gone:
+                await conn.execute("""
+                    UPDATE tenant_storage_usage
+                    SET bytes_used = GREATEST(bytes_used - $2, 0),
+                        objects = GREATEST(objects - $3, 0),
+                        updated_at = NOW()
+                    WHERE tenant_id = $1
+                """, tenant_id, sum(sizes.get(sha, 0) for sha in gone), len(gone))
+
+        return [{"sha256": sha, "bytes": sizes.get(sha, 0)} for sha in gone]
+
+    # ------------------------------------------------------------------
+    # Reconciliation
+    # ------------------------------------------------------------------
+
+    _reconciler: Optional[asyncio.Task] = None
+
+    @classmethod
+    async def reconcile(cls, pool: asyncpg.Pool) -> Optional[dict]:
+        """
+        Recount every tenant's usage from media_refs and sweep the store for
+        files no object row points to. Returns None if another instance holds
+        the reconcile lock.
+        """
+        async with pool.acquire() as conn:
+            if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", RECONCILE_LOCK_KEY):
+                return None
+            try:
+                await cls._ensure_schema(conn)
+                async with conn.transaction():
+                    # Block reference writers for the (set-based, short) recount so none is lost
+                    await conn.execute("LOCK TABLE media_refs IN SHARE MODE")
+                    await conn.execute("""
+                        INSERT INTO tenant_storage_usage (tenant_id, bytes_used, objects, reconciled_at)
+                        SELECT r.tenant_id, SUM(o.bytes), COUNT(*), NOW()
+                        FROM media_refs r JOIN media_objects o ON o.sha256 = r.sha256
+                        GROUP BY r.tenant_id
+                        ON CONFLICT (tenant_id) DO UPDATE SET
+                            bytes_used = EXCLUDED.bytes_used,
+                            objects = EXCLUDED.objects,
+                            reconciled_at = NOW(),
+                            updated_at = NOW()
+                    """)
+                    await conn.execute("""
+                        UPDATE tenant_storage_usage u
+                        SET bytes_used = 0, objects = 0, reconciled_at = NOW(), updated_at = NOW()
+                        WHERE NOT EXISTS (SELECT 1 FROM media_refs r WHERE r.tenant_id = u.tenant_id)
+                    """)
+
+                files = await asyncio.to_thread(cls._scan_store)
+                known = set()
+                shas = list(files)
+                for i in range(0, len(shas), 5000):
+                    rows = await conn.fetch(
+                        "SELECT sha256 FROM media_objects WHERE sha256 = ANY($1::text[])", shas[i:i + 5000]
+                    )
+                    known.update(r["sha256"] for r in rows)
+                missing = await conn.fetchval("SELECT COUNT(*) FROM media_objects") - len(known)
+
+                # Files never recorded (failed/over-quota uploads) or whose object was deleted
+                cutoff = time.time() - settings.STORAGE_ORPHAN_GRACE
+                stale = {sha: path for sha, (path, mtime) in files.items() if sha not in known and mtime < cutoff}
+                freed = 0
+                candidates = list(stale)
+                for i in range(0, len(candidates), 5000):
+                    batch = candidates[i:i + 5000]
+                    async with conn.transaction():
+                        # Block object inserts while re-checking and unlinking, so an upload
+                        # referencing one of these files meanwhile is either seen here or
+                        # finds it gone in add_refs
+                        await conn.execute("LOCK TABLE media_objects IN SHARE ROW EXCLUSIVE MODE")
+                        recorded = {r["sha256"] for r in await conn.fetch(
+                            "SELECT sha256 FROM media_objects WHERE sha256 = ANY($1::text[])", batch
+                        )}
+                        freed += await asyncio.to_thread(
+                            cls._unlink_all, [stale[sha] for sha in batch if sha not in recorded]
+                        )
+                        for sha in recorded:
+                            stale.pop(sha)
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", RECONCILE_LOCK_KEY)
+
+        if missing:
+            logger.warning(f"Media store: {missing} object rows have no file on disk")
+        logger.info(f"Storage reconciled: {len(files)} files, {len(stale)} orphans removed ({freed} bytes)")
+        return {"files": len(files), "orphans_removed": len(stale), "bytes_freed": freed, "missing_files": missing}
+
+    @staticmethod
+    def _scan_store() -> Dict[str, tuple]:
+        """sha256 -> (path, mtime) for every object file, plus stale incoming files keyed by path."""
+        root = Path(settings.MEDIA_STORE_DIR)
+        found = {}
+        if not root.is_dir():
+            return found
+        for shard in root.iterdir():
+            if shard.name in NON_OBJECT_DIRS or not shard.is_dir():
+                continue
+            for path in shard.glob("*/*"):
+                parsed = parse_object_name(path.name)
+                if parsed:
+                    found[parsed[0]] = (path, path.stat().st_mtime)
+        incoming = root / "incoming"
+        if incoming.is_dir():
+            for path in incoming.iterdir():
+                found[str(path)] = (path, path.stat().st_mtime)
+        return found
+
+    @staticmethod
+    def _unlink_all(paths: List[Path]) -> int:
+        freed = 0
+        for path in paths:
+            try:
+                freed += path.stat().st_size
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        return freed
+
+    @classmethod
+    def start_reconciler(cls, pool: asyncpg.Pool):
+        """Run reconcile() now and then every STORAGE_RECONCILE_INTERVAL seconds, in the background."""
+        if cls._reconciler is not None or settings.STORAGE_RECONCILE_INTERVAL <= 0:
+            return
+
+        async def loop():
+            while True:
+                try:
+                    await cls.reconcile(pool)
+                except Exception as e:
+                    logger.error(f"Storage reconcile failed: {e}")
+                await asyncio.sleep(settings.STORAGE_RECONCILE_INTERVAL)
+
+        cls._reconciler = asyncio.create_task(loop())
+
+    @classmethod
+    async def stop_reconciler(cls):
+        if cls._reconciler is not None:
+            cls._reconciler.cancel()
+            await asyncio.gather(cls._reconciler, return_exceptions=True)
+            cls._reconciler = None
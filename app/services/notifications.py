@@ -0,0 +1,150 @@
+"""
+Notification Queue Service
+Delivers rows written to `notification_queue` (grace period, lock, payment,
+welcome emails). Rows are leased with FOR UPDATE SKIP LOCKED so any number
+of workers can drain the queue without sending a message twice, rendered
+from the email templates and sent through the pooled mail dispatcher.
+Transient failures are retried with backoff via scheduled_at.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import asyncio
+import json
+import logging
+import math
+
+import asyncpg
+
+from app.core.config import settings
+from app.services import email_templates
+from app.services.mail_dispatcher import MailDispatcher
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+LEASE_SECONDS = 600
+
+NOTIFICATION_QUEUE_DDL = """
+    ALTER TABLE notification_queue ADD COLUMN IF NOT EXISTS attempts INT NOT NULL DEFAULT 0;
+"""
+
+# Lease a batch: pushing scheduled_at past the lease hides the rows from other
+# workers without holding a transaction open while the mail goes out.
+LEASE_QUERY = """
+    WITH batch AS (
+        SELECT notification_id FROM notification_queue
+        WHERE status = 'pending' AND scheduled_at <= NOW()
+        ORDER BY scheduled_at
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE notification_queue n
+    SET scheduled_at = NOW() + make_interval(secs => $2), attempts = n.attempts + 1
+    FROM batch
+    WHERE n.notification_id = batch.notification_id
+    RETURNING n.notification_id, n.tenant_id, n.type, n.payload, n.attempts
+"""
+
+
+def _payload(value) -> dict:
+    """Producers insert either JSON text or a dict; both come back usable."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+
+def _date(value) -> str:
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d")
+    return str(value or "")[:10]
+
+
+def render(template: str, payload: dict, tenant) -> Optional[dict]:
+    """{"subject", "html"} for a queued notification, or None for an unknown template."""
+    name = payload.get("tenant_name") or tenant["name"]
+    if template == "welcome":
+        return email_templates.welcome_email(name, tenant["contact_email"], payload.get("trial_days", 7))
+    if template == "grace_period_started":
+        # Grace lasts 24 hours past expiry before the account is locked
+        locks_at = tenant["subscription_expiry"] + timedelta(days=1)
+        days = max(0, math.ceil((locks_at - datetime.now(timezone.utc)).total_seconds() / 86400))
+        return email_templates.subscription_expiring_email(name, days, _date(locks_at))
+    if template == "account_locked":
+        return email_templates.subscription_suspended_email(
+            name, payload.get("reason") or "Subscription expired and the grace period has ended")
+    if template == "payment_received":
+        return email_templates.payment_received_email(
+            name, float(payload.get("amount") or 0), int(payload.get("extension_days") or 0),
+            _date(payload.get("new_expiry") or tenant["subscription_expiry"]))
+    return None
+
+
+async def _deliver(row, tenants: dict) -> Optional[str]:
+    """Send one leased notification. Returns an error message, or None once sent."""
+    if row["type"] != "email":
+        return f"Unsupported notification type: {row['type']}"
+    tenant = tenants.get(row["tenant_id"])
+    if tenant is None or not tenant["contact_email"]:
+        return "Tenant has no contact email"
+    payload = _payload(row["payload"])
+    email = render(payload.get("template"), payload, tenant)
+    if email is None:
+        return f"Unknown template: {payload.get('template')}"
+    to = payload.get("to") or tenant["contact_email"]
+    if not await MailDispatcher.send(to, email["subject"], email["html"], row["tenant_id"]):
+        return "Email could not be delivered"
+    return None
+
+
+async def drain_notifications(pool: asyncpg.Pool, limit: Optional[int] = None) -> int:
+    """Lease and send one batch of due notifications. Returns how many were sent."""
+    limit = limit or settings.NOTIFICATION_BATCH_SIZE
+    async with pool.acquire() as conn:
+        try:
+            rows = await conn.fetch(LEASE_QUERY, limit, LEASE_SECONDS)
+        except asyncpg.UndefinedColumnError:
+            await conn.execute(NOTIFICATION_QUEUE_DDL)
+            rows = await conn.fetch(LEASE_QUERY, limit, LEASE_SECONDS)
+        if not rows:
+            return 0
+        tenant_rows = await conn.fetch("""
+            SELECT tenant_id, name, contact_email, subscription_expiry
+            FROM tenants WHERE tenant_id = ANY($1::uuid[])
+        """, list({r["tenant_id"] for r in rows if r["tenant_id"]}))
+    tenants = {t["tenant_id"]: t for t in tenant_rows}
+
+    errors = await asyncio.gather(*(_deliver(r, tenants) for r in rows), return_exceptions=True)
+
+    sent, retry, failed = [], [], []
+    for row, error in zip(rows, errors):
+        if error is None:
+            sent.append(row["notification_id"])
+        elif isinstance(error, Exception) and row["attempts"] < MAX_ATTEMPTS:
+            retry.append((row["notification_id"], min(60 * 2 ** row["attempts"], 3600), str(error)))
+        else:
+            failed.append((row["notification_id"], str(error)))
+
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if sent:
+                await conn.execute("""
+                    UPDATE notification_queue SET status = 'sent', processed_at = NOW(), error_message = NULL
+                    WHERE notification_id = ANY($1::bigint[])
+                """, sent)
+            if retry:
+                await conn.executemany("""
+                    UPDATE notification_queue SET scheduled_at = NOW() + make_interval(secs => $2), error_message = $3
+                    WHERE notification_id = $1
+                """, retry)
+            if failed:
+                await conn.executemany("""
+                    UPDATE notification_queue SET status = 'failed', processed_at = NOW(), error_message = $2
+                    WHERE notification_id = $1
+                """, failed)
+    if failed:
+        logger.warning(f"{len(failed)} notifications failed permanently")
+    return len(sent)
@@ -0,0 +1,109 @@
+"""
+Lifecycle Scheduler Service
+Runs the automatic subscription transitions (ACTIVE → GRACE → LOCKED) on a
+timer inside the app. Every process runs the loop, but only the one holding
+a Postgres session advisory lock does the work, so a multi-process or
+multi-host deployment runs each tick exactly once. If the leader dies its
+connection closes, the lock is released and another process takes over on
+its next tick.
+
+The same connection listens on `tenant_cache`, where the transitions announce
+affected tenants, so every process drops their cached middleware config
+and its cached tenant status counts.
+"""
+
+from typing import Optional
+import asyncio
+import logging
+
+import asyncpg
+
+from app.core.config import settings
+from app.middleware.tenant import invalidate_tenant_cache
+from app.services.subscription import SubscriptionStateMachine
+from app.services.tenant_stats import TenantStatusCounters
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_LOCK_KEY = 0x6C696665  # pg advisory lock id ("life")
+
+
+class LifecycleScheduler:
+    _task: Optional[asyncio.Task] = None
+    _conn: Optional[asyncpg.Connection] = None
+    is_leader = False
+
+    @staticmethod
+    def _on_invalidate(conn, pid, channel, payload):
+        invalidate_tenant_cache([payload] if payload else None)
+        TenantStatusCounters.invalidate()
+
+    @classmethod
+    async def _connect(cls) -> asyncpg.Connection:
+        # A dedicated session: the lock lives exactly as long as this connection
+        conn = await asyncpg.connect(settings.DATABASE_URL)
+        await conn.add_listener("tenant_cache", cls._on_invalidate)
+        return conn
+
+    @classmethod
+    async def _drop_connection(cls):
+        if cls._conn is not None:
+            if cls.is_leader:
+                logger.warning("Lifecycle scheduler leadership lost")
+            try:
+                await cls._conn.close(timeout=5)
+            except Exception:
+                cls._conn.terminate()
+        cls._conn, cls.is_leader = None, False
+
+    @classmethod
+    async def run_once(cls, pool: asyncpg.Pool) -> dict:
+        """One tick: apply every due transition. Safe to repeat; each is a guarded set-based UPDATE."""
+        state_machine = SubscriptionStateMachine(pool)
+        return {
+            "grace": await state_machine.auto_transition_to_grace(),
+            "locked": await state_machine.auto_transition_to_locked(),
+        }
+
+    @classmethod
+    async def _tick(cls, pool: asyncpg.Pool):
+        if cls._conn is None or cls._conn.is_closed():
+            await cls._drop_connection()
+            cls._conn = await cls._connect()
+        if not cls.is_leader:
+            cls.is_leader = await cls._conn.fetchval("SELECT pg_try_advisory_lock($1)", SCHEDULER_LOCK_KEY)
+            if cls.is_leader:
+                logger.info("This process is now the lifecycle scheduler leader")
+        else:
+            # Still holding the session (and so the lock)?
+            await cls._conn.fetchval("SELECT 1")
+        if cls.is_leader:
+            await cls.run_once(pool)
+
+    @classmethod
+    def start(cls, pool: asyncpg.Pool):
+        """Run the scheduler loop every LIFECYCLE_INTERVAL seconds in the background."""
+        if cls._task is not None or settings.LIFECYCLE_INTERVAL <= 0:
+            return
+
+        async def loop():
+            while True:
+                try:
+                    await cls._tick(pool)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Lifecycle scheduler tick failed: {e}")
+                    await cls._drop_connection()
+                await asyncio.sleep(settings.LIFECYCLE_INTERVAL)
+
+        cls._task = asyncio.create_task(loop())
+
+    @classmethod
+    async def stop(cls):
+        if cls._task is not None:
+            cls._task.cancel()
+            await asyncio.gather(cls._task, return_exceptions=True)
+            cls._task = None
+        # Closing the session releases the lock for the next leader
+        await cls._drop_connection()
@@ -2,10 +2,13 @@ from enum import Enum
 from datetime import datetime, timedelta, timezone
 from typing import Optional, List
 from uuid import UUID
+import json
 import logging
 import asyncpg
 
+from app.middleware.tenant import invalidate_tenant_cache
 from app.models.tenant import SubscriptionStatus
+from app.services.tenant_stats import TenantStatusCounters
 
 logger = logging.getLogger(__name__)
 
@@ -71,89 +74,57 @@ class SubscriptionStateMachine:
                 logger.info(f"Tenant {tenant_id} transitioned from TRIAL to ACTIVE")
                 return {"status": "success", "new_state": "active"}
 
+    async def _auto_transition(self, from_status: str, to_status: str, due: str, payload: dict) -> List[UUID]:
+        """
+        Move every tenant in `from_status` matching `due` to `to_status` and queue
+        its notification, in one statement. Each moved tenant is announced on the
+        `tenant_cache` channel at commit so every API process drops its cached config.
+        """
+        query = f"""
+            WITH moved AS (
+                UPDATE tenants
+                SET status = $1::text::subscription_status, updated_at = NOW()
+                WHERE status = $2::text::subscription_status AND {due}
+                RETURNING tenant_id
+            ), queued AS (
+                INSERT INTO notification_queue (tenant_id, type, payload)
+                SELECT tenant_id, 'email', $3::jsonb FROM moved
+            )
+            SELECT tenant_id, pg_notify('tenant_cache', tenant_id::text) FROM moved
+        """
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch(query, to_status, from_status, json.dumps(payload))
+        tenant_ids = [r["tenant_id"] for r in rows]
+        if tenant_ids:
+            invalidate_tenant_cache(tenant_ids)
+            TenantStatusCounters.invalidate()
+        return tenant_ids
+
     async def auto_transition_to_grace(self) -> int:
         """
         ACTIVE → GRACE: Automatic when current_time > subscription_expiry.
         Returns count of tenants transitioned.
         """
-        async with self.db_pool.acquire() as conn:
-            async with conn.transaction():
-                # Find all active tenants past expiry
-                tenants = await conn.fetch(
-                    """
-                    SELECT tenant_id FROM tenants
-                    WHERE status = 'active' 
-                    AND subscription_expiry < NOW()
-                    """
-                )
-                
-                count = 0
-                for tenant in tenants:
-                    await conn.execute(
-                        """
-                        UPDATE tenants 
-                        SET status = 'grace', updated_at = NOW()
-                        WHERE tenant_id = $1
-                        """,
-                        tenant["tenant_id"]
-                    )
-                    
-                    # Queue notification
-                    await conn.execute(
-                        """
-                        INSERT INTO notification_queue (tenant_id, type, payload)
-                        VALUES ($1, 'email', $2)
-                        """,
-                        tenant["tenant_id"],
-                        {"template": "grace_period_started", "urgency": "high"}
-                    )
-                    
-                    count += 1
-                    logger.info(f"Tenant {tenant['tenant_id']} transitioned to GRACE")
-                
-                return count
+        tenant_ids = await self._auto_transition(
+            "active", "grace", "subscription_expiry < NOW()",
+            {"template": "grace_period_started", "urgency": "high"}
+        )
+        if tenant_ids:
+            logger.info(f"{len(tenant_ids)} tenants transitioned to GRACE: {', '.join(map(str, tenant_ids))}")
+        return len(tenant_ids)
 
     async def auto_transition_to_locked(self) -> int:
         """
         GRACE → LOCKED: Automatic after 24-hour grace period.
         Returns count of tenants locked.
         """
-        async with self.db_pool.acquire() as conn:
-            async with conn.transaction():
-                # Find all grace tenants past grace period (24 hours)
-                tenants = await conn.fetch(
-                    """
-                    SELECT tenant_id FROM tenants
-                    WHERE status = 'grace'
-                    AND subscription_expiry + INTERVAL '24 hours' < NOW()
-                    """
-                )
-                
-                count = 0
-                for tenant in tenants:
-                    await conn.execute(
-                        """
-                        UPDATE tenants 
-                        SET status = 'locked', updated_at = NOW()
-                        WHERE tenant_id = $1
-                        """,
-                        tenant["tenant_id"]
-                    )
-                    
-                    # Queue notification
-                    await conn.execute(
-                        """
-                        INSERT INTO notification_queue (tenant_id, type, payload)
-                        VALUES ($1, 'email', $2)
-                        """,
-                        tenant["tenant_id"],
-                        {"template": "account_locked", "urgency": "critical"}
-                    )
-                    
-                    count += 1
-                    logger.warning(f"Tenant {tenant['tenant_id']} LOCKED due to expired grace period")
-                
-                return count
+        tenant_ids = await self._auto_transition(
+            "grace", "locked", "subscription_expiry + INTERVAL '24 hours' < NOW()",
+            {"template": "account_locked", "urgency": "critical"}
+        )
+        if tenant_ids:
+            logger.warning(f"{len(tenant_ids)} tenants LOCKED due to expired grace period: {', '.join(map(str, tenant_ids))}")
+        return len(tenant_ids)
 
     async def unlock_and_extend(
         self,
@@ -363,6 +334,76 @@ class SubscriptionStateMachine:
                     "new_expiry": new_expiry.isoformat()
                 }
 
+    async def bulk_extend_subscriptions(
+        self,
+        tenant_ids: List[UUID],
+        admin_id: UUID,
+        extension_days: int,
+        payment_reference: str,
+        amount: float,
+        notes: Optional[str] = None
+    ) -> dict:
+        """
+        Extend many subscriptions in one transaction: a single array-driven UPDATE,
+        one bulk audit insert, and a per-tenant report of what could not be extended
+        (unknown, suspended or churned tenants), mirroring extend_subscription().
+        Returns {"success": [tenant_id, ...], "failed": [{"tenant_id", "error"}, ...]}.
+        """
+        query = """
+            WITH requested AS (
+                SELECT DISTINCT unnest($1::uuid[]) AS tenant_id
+            ), locked AS (
+                SELECT t.tenant_id, t.status, t.subscription_expiry
+                FROM tenants t JOIN requested r USING (tenant_id)
+                ORDER BY t.tenant_id
+                FOR UPDATE OF t
+            ), extended AS (
+                UPDATE tenants t
+                SET subscription_expiry = l.subscription_expiry + make_interval(days => $2),
+                    last_payment_date = NOW(),
+                    updated_at = NOW()
+                FROM locked l
+                WHERE t.tenant_id = l.tenant_id AND l.status NOT IN ('suspended', 'churned')
+                RETURNING t.tenant_id, l.subscription_expiry AS old_expiry, t.subscription_expiry AS new_expiry
+            ), audited AS (
+                INSERT INTO audit_logs (tenant_id, actor_id, action, details)
+                SELECT tenant_id, $3, 'subscription_extended', jsonb_build_object(
+                    'payment_reference', $4::text,
+                    'amount', $5::float8,
+                    'extension_days', $2::int,
+                    'old_expiry', old_expiry,
+                    'new_expiry', new_expiry,
+                    'notes', $6::text,
+                    'bulk', TRUE
+                )
+                FROM extended
+            )
+            SELECT r.tenant_id, l.status::text AS status, e.new_expiry,
+                   CASE WHEN e.tenant_id IS NOT NULL THEN pg_notify('tenant_cache', e.tenant_id::text) END
+            FROM requested r
+            LEFT JOIN locked l USING (tenant_id)
+            LEFT JOIN extended e USING (tenant_id)
+        """
+        async with self.db_pool.acquire() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch(
+                    query, list(tenant_ids), extension_days, admin_id,
+                    payment_reference, amount, notes
+                )
+
+        results = {"success": [], "failed": []}
+        for row in rows:
+            if row["new_expiry"] is not None:
+                results["success"].append(str(row["tenant_id"]))
+            elif row["status"] is None:
+                results["failed"].append({"tenant_id": str(row["tenant_id"]), "error": f"Tenant {row['tenant_id']} not found"})
+            else:
+                results["failed"].append({"tenant_id": str(row["tenant_id"]), "error": f"Cannot extend {row['status']} tenant"})
+
+        invalidate_tenant_cache(results["success"])
+        logger.info(f"Bulk extension by {extension_days} days: {len(results['success'])} extended, {len(results['failed'])} failed")
+        return results
+
     async def _log_transition(
         self,
         conn: asyncpg.Connection,
@@ -0,0 +1,80 @@
+"""
+Template Catalog Service
+Per-tenant in-process cache of ID card templates (master DB). Rows are
+loaded once, with field_positions parsed into layout_json, and dropped on
+any template write. A short TTL bounds staleness across worker processes.
+"""
+
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import time
+
+import asyncpg
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def parse_template(row) -> Dict[str, Any]:
+    """Map an id_card_templates row to the API shape (layout_json, *_image_url aliases)."""
+    data = dict(row)
+    fp = data.get('field_positions')
+    try:
+        layout = json.loads(fp) if isinstance(fp, str) else (fp or {})
+    except ValueError:
+        layout = {}
+    data['field_positions'] = layout
+    data['layout_json'] = layout
+    data['front_image_url'] = data.get('front_bg_url')
+    data['back_image_url'] = data.get('back_bg_url')
+    return data
+
+
+class TemplateCatalog:
+    # tenant_id -> (expires_at, templates newest first)
+    _cache: Dict[str, tuple] = {}
+    # Bumped on invalidation so a load racing a write never stores stale rows
+    _generation: Dict[str, int] = {}
+
+    @classmethod
+    def invalidate(cls, tenant_id):
+        key = str(tenant_id)
+        cls._cache.pop(key, None)
+        cls._generation[key] = cls._generation.get(key, 0) + 1
+
+    @classmethod
+    async def _load(cls, pool: asyncpg.Pool, tenant_id) -> List[Dict[str, Any]]:
+        key = str(tenant_id)
+        cached = cls._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        generation = cls._generation.get(key, 0)
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT * FROM id_card_templates
+                WHERE tenant_id = $1
+                ORDER BY created_at DESC
+            """, tenant_id)
+        templates = [parse_template(r) for r in rows]
+        if cls._generation.get(key, 0) == generation:
+            cls._cache[key] = (time.monotonic() + settings.TEMPLATE_CACHE_TTL, templates)
+        return templates
+
+    @classmethod
+    async def list_active(cls, pool: asyncpg.Pool, tenant_id) -> List[Dict[str, Any]]:
+        """Active templates, newest first (copies; safe to modify)."""
+        return [dict(t) for t in await cls._load(pool, tenant_id) if t.get('is_active')]
+
+    @classmethod
+    async def get(cls, pool: asyncpg.Pool, tenant_id, template_id=None) -> Optional[Dict[str, Any]]:
+        """A specific template, or the tenant's default (else newest) when template_id is None."""
+        templates = await cls._load(pool, tenant_id)
+        if template_id is not None:
+            match = next((t for t in templates if str(t['template_id']) == str(template_id)), None)
+        else:
+            # Stable sort keeps newest-first among equals, matching ORDER BY is_default DESC, created_at DESC
+            match = next(iter(sorted(templates, key=lambda t: not t.get('is_default'))), None)
+        return dict(match) if match else None
@@ -0,0 +1,63 @@
+"""
+Tenant Stats Service
+Per-status tenant counts for the admin dashboard, cached in memory so the
+tenant list does not aggregate the whole tenants table on every page.
+Counts are dropped whenever a tenant changes state (locally at once, in
+other processes via the `tenant_cache` channel) and otherwise refreshed
+after TENANT_STATS_TTL seconds.
+"""
+
+from typing import Dict, Iterable, Optional
+import logging
+import time
+
+import asyncpg
+
+from app.core.config import settings
+from app.middleware.tenant import invalidate_tenant_cache
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ("trial", "active", "grace", "locked", "suspended", "churned")
+
+
+class TenantStatusCounters:
+    _counts: Optional[Dict[str, int]] = None
+    _loaded_at = 0.0
+    # Bumped on invalidation so a recount racing a transition is not cached
+    _generation = 0
+
+    @classmethod
+    def invalidate(cls):
+        cls._counts = None
+        cls._generation += 1
+
+    @classmethod
+    async def get(cls, pool: asyncpg.Pool) -> Dict[str, int]:
+        """{status: tenant count} for every status."""
+        if cls._counts is not None and time.monotonic() - cls._loaded_at < settings.TENANT_STATS_TTL:
+            return cls._counts
+        generation = cls._generation
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("SELECT status::text AS status, COUNT(*) AS n FROM tenants GROUP BY status")
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update({r["status"]: r["n"] for r in rows})
+        if generation == cls._generation:
+            cls._counts, cls._loaded_at = counts, time.monotonic()
+        return counts
+
+
+async def announce_tenant_change(pool: asyncpg.Pool, tenant_ids: Iterable):
+    """
+    A tenant's status or subscription changed: drop the cached counts and
+    middleware configs here, and tell the other processes to do the same.
+    """
+    ids = [str(t) for t in tenant_ids]
+    invalidate_tenant_cache(ids)
+    TenantStatusCounters.invalidate()
+    try:
+        async with pool.acquire() as conn:
+            await conn.execute("SELECT pg_notify('tenant_cache', t) FROM unnest($1::text[]) AS t", ids)
+    except Exception as e:
+        # Other processes fall back to their TTLs
+        logger.warning(f"Could not announce tenant change: {e}")
@@ -0,0 +1,360 @@
+"""
+Upload Pipeline Service
+Streams image uploads to local disk under per-file and per-tenant byte caps,
+builds the standard size variants off the event loop, stores them in the
+content-addressed media store, and hands them to a background worker that
+pushes them to Cloudinary with retry.
+"""
+
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+
+import asyncpg
+
+from app.core.config import settings
+from app.services.media_store import (
+    MediaObjectMissing, MediaStore, StorageQuotaExceeded, put_file, read_derivation, write_derivation
+)
+
+logger = logging.getLogger(__name__)
+
+IMAGING_AVAILABLE = False
+try:
+    from PIL import Image, ImageOps
+    IMAGING_AVAILABLE = True
+except ImportError as e:
+    logger.warning(f"Pillow not found ({e}). Uploads will be stored without resized variants.")
+
+CLOUDINARY_AVAILABLE = False
+try:
+    import cloudinary
+    import cloudinary.uploader
+    CLOUDINARY_AVAILABLE = True
+except ImportError:
+    pass
+
+# name -> longest side in pixels
+VARIANTS = {"thumb": 160, "card": 640, "full": 2048}
+MAX_IMAGE_PIXELS = 50_000_000
+
+
+class UploadTooLarge(Exception):
+    """The upload exceeded UPLOAD_MAX_MB or the tenant's in-flight budget."""
+
+
+class InvalidImage(Exception):
+    """The uploaded bytes could not be decoded as an image."""
+
+
+def safe_folder(folder: str) -> str:
+    """Folder names become path segments; keep them to a harmless alphabet."""
+    return re.sub(r"[^a-zA-Z0-9_-]", "_", folder or "misc")[:50] or "misc"
+
+
+def remote_configured() -> bool:
+    return CLOUDINARY_AVAILABLE and bool(os.getenv("CLOUDINARY_URL"))
+
+
+# ============================================================================
+# RECEIVE
+# ============================================================================
+
+class TenantByteBudget:
+    """Bytes currently being received per tenant, across concurrent uploads."""
+
+    _inflight: Dict[str, int] = {}
+
+    @classmethod
+    def take(cls, tenant_id, size: int):
+        key = str(tenant_id)
+        limit = settings.UPLOAD_TENANT_INFLIGHT_MB * 1024 * 1024
+        if cls._inflight.get(key, 0) + size > limit:
+            raise UploadTooLarge("Too many uploads in progress for this school, please retry")
+        cls._inflight[key] = cls._inflight.get(key, 0) + size
+
+    @classmethod
+    def give_back(cls, tenant_id, size: int):
+        key = str(tenant_id)
+        remaining = cls._inflight.get(key, 0) - size
+        if remaining > 0:
+            cls._inflight[key] = remaining
+        else:
+            cls._inflight.pop(key, None)
+
+
+def _write_chunk(f, digest, chunk: bytes):
+    f.write(chunk)
+    digest.update(chunk)
+
+
+async def receive(chunks: AsyncIterator[bytes], dest: Path, tenant_id) -> Tuple[int, str]:
+    """
+    Write `chunks` to `dest` as they arrive, enforcing the caps chunk by chunk.
+    File I/O and hashing run in worker threads. A partial file is removed on failure.
+    Returns (size, sha256).
+    """
+    max_bytes = settings.UPLOAD_MAX_MB * 1024 * 1024
+    received = 0
+    digest = hashlib.sha256()
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    f = await asyncio.to_thread(open, dest, "wb")
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            if received + len(chunk) > max_bytes:
+                raise UploadTooLarge(f"File exceeds {settings.UPLOAD_MAX_MB} MB")
+            TenantByteBudget.take(tenant_id, len(chunk))
+            received += len(chunk)
+            await asyncio.to_thread(_write_chunk, f, digest, chunk)
+        await asyncio.to_thread(f.close)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        dest.unlink(missing_ok=True)
+        raise
+    finally:
+        TenantByteBudget.give_back(tenant_id, received)
+    return received, digest.hexdigest()
+
+
+# ============================================================================
+# VARIANTS (worker thread)
+# ============================================================================
+
+def build_variants(source: Path, out_dir: Path, stem: str) -> Dict[str, Path]:
+    """
+    Decode `source` once and write each variant no larger than the original.
+    JPEG unless the image has transparency (PNG). Raises InvalidImage.
+    """
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    try:
+        image = Image.open(source)
+        # Let the JPEG decoder skip straight to a reduced scale where possible
+        image.draft("RGB", (VARIANTS["full"], VARIANTS["full"]))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except Exception as e:
+        raise InvalidImage(str(e))
+
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    ext, fmt, options = (".png", "PNG", {"optimize": True}) if has_alpha else \
+        (".jpg", "JPEG", {"quality": 85, "optimize": True, "progressive": True})
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = {}
+    # Largest first so each smaller variant resamples an already reduced image
+    for name, side in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+        if max(image.size) > side:
+            image = image.copy()
+            image.thumbnail((side, side), Image.LANCZOS)
+        path = out_dir / f"{stem}_{name}{ext}"
+        image.save(path, format=fmt, **options)
+        paths[name] = path
+    return paths
+
+
+# ============================================================================
+# REMOTE UPLOAD WORKER
+# ============================================================================
+
+class RemoteUploader:
+    """
+    Background task draining a queue of finished uploads to Cloudinary.
+    Each upload has a JSON manifest under MEDIA_STORE_DIR/uploads so pending
+    work survives restarts and clients can poll for the remote URLs.
+    """
+
+    _queue: Optional[asyncio.Queue] = None
+    _workers: list = []
+
+    @classmethod
+    def manifest_path(cls, upload_id: str) -> Path:
+        return Path(settings.MEDIA_STORE_DIR) / "uploads" / f"{upload_id}.json"
+
+    @classmethod
+    def read_manifest(cls, upload_id: str) -> Optional[dict]:
+        path = cls.manifest_path(upload_id)
+        if not path.is_file():
+            return None
+        return json.loads(path.read_text())
+
+    @classmethod
+    def write_manifest(cls, manifest: dict):
+        path = cls.manifest_path(manifest["upload_id"])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(manifest))
+        os.replace(tmp, path)
+
+    @classmethod
+    def start(cls):
+        """Start the workers and requeue manifests left pending by a previous run."""
+        if cls._queue is not None or not remote_configured():
+            return
+        cls._queue = asyncio.Queue()
+        cls._workers = [
+            asyncio.create_task(cls._worker()) for _ in range(settings.UPLOAD_REMOTE_CONCURRENCY)
+        ]
+        manifests = Path(settings.MEDIA_STORE_DIR) / "uploads"
+        if manifests.is_dir():
+            for path in manifests.glob("*.json"):
+                try:
+                    if json.loads(path.read_text()).get("status") == "pending":
+                        cls._queue.put_nowait(path.stem)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping unreadable upload manifest {path}: {e}")
+
+    @classmethod
+    async def stop(cls):
+        for task in cls._workers:
+            task.cancel()
+        await asyncio.gather(*cls._workers, return_exceptions=True)
+        cls._workers = []
+        cls._queue = None
+
+    @classmethod
+    def enqueue(cls, upload_id: str):
+        if cls._queue is None:
+            cls.start()
+        if cls._queue is not None:
+            cls._queue.put_nowait(upload_id)
+
+    @classmethod
+    async def _worker(cls):
+        while True:
+            upload_id = await cls._queue.get()
+            try:
+                await cls._process(upload_id)
+            except Exception as e:
+                logger.error(f"Remote upload {upload_id} crashed: {e}")
+            finally:
+                cls._queue.task_done()
+
+    @classmethod
+    async def _process(cls, upload_id: str):
+        manifest = await asyncio.to_thread(cls.read_manifest, upload_id)
+        if not manifest or manifest.get("status") != "pending":
+            return
+
+        remote = manifest.setdefault("remote", {})
+        for name, local in manifest["files"].items():
+            if name in remote:
+                continue
+            try:
+                # Public id is the content hash, so identical files share one remote copy
+                result = await asyncio.to_thread(
+                    cloudinary.uploader.upload,
+                    local,
+                    folder="almsaas/media",
+                    public_id=Path(local).stem,
+                    overwrite=False,
+                    resource_type="image"
+                )
+                remote[name] = result.get("secure_url")
+            except Exception as e:
+                manifest["attempts"] = manifest.get("attempts", 0) + 1
+                manifest["last_error"] = str(e)
+                if manifest["attempts"] >= settings.UPLOAD_REMOTE_RETRIES:
+                    manifest["status"] = "failed"
+                    logger.error(f"Remote upload {upload_id} gave up after {manifest['attempts']} attempts: {e}")
+                    await asyncio.to_thread(cls.write_manifest, manifest)
+                else:
+                    await asyncio.to_thread(cls.write_manifest, manifest)
+                    delay = min(2 ** manifest["attempts"], 300)
+                    logger.warning(f"Remote upload {upload_id} failed ({e}); retrying in {delay}s")
+                    asyncio.get_running_loop().call_later(delay, cls.enqueue, upload_id)
+                return
+
+        manifest["status"] = "done"
+        manifest["completed_at"] = time.time()
+        await asyncio.to_thread(cls.write_manifest, manifest)
+
+
+# ============================================================================
+# PIPELINE
+# ============================================================================
+
+def _store_variants(source: Path, source_sha256: str, work_dir: Path) -> Dict[str, Path]:
+    """Variants of `source` in the media store, built only if this content was never seen (blocking)."""
+    files = read_derivation(source_sha256)
+    if files is not None:
+        return files
+    if IMAGING_AVAILABLE:
+        built = build_variants(source, work_dir, source.stem)
+        files = {name: put_file(path) for name, path in built.items()}
+    else:
+        # Copy, not move: the source must survive in case the objects have to be stored again
+        full = source.with_name(f"{source.stem}_full{source.suffix}")
+        shutil.copyfile(source, full)
+        files = {"full": put_file(full)}
+    write_derivation(source_sha256, files)
+    return files
+
+
+async def ingest(pool: asyncpg.Pool, chunks: AsyncIterator[bytes], filename: str, folder: str, tenant_id) -> dict:
+    """
+    Receive an upload, store its variants and schedule the remote copy.
+    Returns the manifest: {"upload_id", "folder", "files": {variant: store path}, "objects", "status", ...}.
+    """
+    folder = safe_folder(folder)
+    upload_id = uuid.uuid4().hex
+    work_dir = Path(settings.MEDIA_STORE_DIR) / "incoming"
+    suffix = Path(filename or "").suffix.lower()[:10] or ".bin"
+    source = work_dir / f"{upload_id}{suffix}"
+
+    # O(1) quota check up front; add_refs enforces it exactly once the stored size is known
+    usage = await MediaStore.usage(pool, tenant_id)
+    if usage["bytes_used"] >= usage["limit_bytes"]:
+        raise StorageQuotaExceeded("Storage limit reached for this school")
+
+    size, source_sha256 = await receive(chunks, source, tenant_id)
+    try:
+        for attempt in range(3):
+            files = await asyncio.to_thread(_store_variants, source, source_sha256, work_dir)
+            try:
+                new_objects = await MediaStore.add_refs(pool, tenant_id, files.values())
+                break
+            except MediaObjectMissing as e:
+                # The same content was being deleted; the derivation no longer
+                # resolves, so the next pass stores the variants again
+                if attempt == 2:
+                    raise
+                logger.info(f"Upload {upload_id}: stored object vanished ({e}), storing again")
+    finally:
+        await asyncio.to_thread(source.unlink, True)
+
+    manifest = {
+        "upload_id": upload_id,
+        "tenant_id": str(tenant_id),
+        "folder": folder,
+        "bytes": size,
+        "sha256": source_sha256,
+        "files": {name: str(path) for name, path in files.items()},
+        "objects": [path.name for path in files.values()],
+        "new_bytes": sum(o["bytes"] for o in new_objects),
+        "status": "pending" if remote_configured() else "local",
+        "created_at": time.time(),
+    }
+    await asyncio.to_thread(RemoteUploader.write_manifest, manifest)
+    if manifest["status"] == "pending":
+        RemoteUploader.enqueue(upload_id)
+    return manifest
+
+
+async def discard(pool: asyncpg.Pool, manifest: dict) -> dict:
+    """Release an upload's references to its stored objects."""
+    released = await MediaStore.release(pool, manifest["tenant_id"], manifest.get("objects", []))
+    manifest["status"] = "deleted"
+    manifest["objects"] = []
+    await asyncio.to_thread(RemoteUploader.write_manifest, manifest)
+    return {"released_bytes": sum(o["bytes"] for o in released)}
@@ -0,0 +1,62 @@
+"""
+Background job worker.
+
+Runs queued jobs (invoice runs, bulk ID cards, bulk extensions, bulk email)
+and delivers notification_queue emails, separately from the API:
+
+    python -m app.worker [--concurrency N]
+
+Any number of workers can run side by side; set JOB_EMBEDDED_WORKERS=0 on
+the API when they do. SIGTERM/SIGINT stop claiming and hand unfinished jobs
+back to the queue.
+"""
+
+import argparse
+import asyncio
+import logging
+import signal
+
+from app.core.config import settings
+from app.core.database import get_master_db_pool, close_master_db_pool, TenantDatabaseFactory
+from app.services.jobs import JobQueue
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("app.worker")
+
+
+async def main(concurrency: int):
+    pool = await get_master_db_pool()
+    from app.db.repair import fix_master_schema
+    await fix_master_schema(pool)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    await JobQueue.start(pool, concurrency)
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Stopping worker...")
+        await JobQueue.stop()
+        from app.services.mail_dispatcher import MailDispatcher
+        await MailDispatcher.stop()
+        await close_master_db_pool()
+        await TenantDatabaseFactory.close_all_tenant_pools()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Background job worker")
+    parser.add_argument("--concurrency", type=int, default=settings.JOB_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.concurrency))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,216 @@
+"""
+Biometric benchmark and accuracy harness.
+
+Runs fully offline on CPU: encodings are synthetic 128-d vectors clustered
+per identity (shaped like dlib output: same person ~0.35 apart, most
+different people 0.6-0.9 with a tail of look-alikes below 0.6), and the
+extractor is replaced by a lookup so the face_recognition library is not
+needed. Impostor probes are fresh identities from the same generator, so
+they have look-alikes in the gallery just as enrolled people do.
+
+For each gallery size it reports, for exact and IVF modes:
+  * enroll throughput   (extract -> [duplicate check] -> index upsert)
+  * identify latency    p50 / p99
+  * recall@1 of IVF against exact search
+  * index memory        (arrays) and peak allocation while enrolling
+and, once per size, false-accept / false-reject rates across tolerances.
+
+    python scripts/benchmark_face_index.py
+    python scripts/benchmark_face_index.py --sizes 100 1000 8000 --probe 8 --queries 300
+    python scripts/benchmark_face_index.py --sizes 1000 --duplicate-check
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from typing import Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("VAULT_MASTER_KEY", "0" * 64)
+
+from app.core.config import settings  # noqa: E402
+from app.services.face_index import ENCODING_DIMENSIONS, FaceIndex  # noqa: E402
+from app.services.face_service import FaceService  # noqa: E402
+
+TOLERANCES = (0.35, 0.4, 0.45, 0.5, 0.55, 0.6, 0.7)
+
+
+# ============================================================================
+# SYNTHETIC DATA
+# ============================================================================
+
+class SyntheticFaces:
+    """Identity centres plus per-capture noise, all deterministic from a seed."""
+
+    def __init__(self, identities: int, seed: int = 0, spread: float = 0.022, similarity: float = 0.6,
+                 lookalike: float = 0.75, group_size: int = 8):
+        self.rng = np.random.default_rng(seed)
+        # A shared direction pulls identities together (mean cosine ~similarity), as real
+        # embeddings are not spread uniformly over the sphere
+        base = self.rng.normal(size=ENCODING_DIMENSIONS)
+        base *= np.sqrt(similarity / (1 - similarity) * ENCODING_DIMENSIONS) / np.linalg.norm(base)
+        # Look-alike groups: each identity takes a random share (up to `lookalike`) of its
+        # group's features, which gives the close different-person pairs that drive FAR
+        groups = self.rng.normal(size=(max(1, identities // group_size), ENCODING_DIMENSIONS))
+        membership = self.rng.integers(len(groups), size=identities)
+        share = self.rng.uniform(0, lookalike, size=(identities, 1))
+        own = self.rng.normal(size=(identities, ENCODING_DIMENSIONS))
+        centres = base + np.sqrt(share) * groups[membership] + np.sqrt(1 - share) * own
+        self.centres = (centres / np.linalg.norm(centres, axis=1, keepdims=True)).astype(np.float32)
+        self.spread = spread
+
+    def capture(self, identities: np.ndarray) -> np.ndarray:
+        """One new 'photo' of each identity: centre plus capture noise of varying quality."""
+        quality = self.rng.uniform(0.7, 1.3, size=(len(identities), 1))
+        noise = self.rng.normal(scale=self.spread, size=(len(identities), ENCODING_DIMENSIONS)) * quality
+        return (self.centres[identities] + noise).astype(np.float32)
+
+
+class MockExtractor:
+    """Stands in for the process-pool extractor: image bytes are keys into a table of encodings."""
+
+    def __init__(self):
+        self.table = {}
+
+    def image_for(self, encoding: np.ndarray) -> bytes:
+        key = len(self.table).to_bytes(8, "little")
+        self.table[key] = encoding.tolist()
+        return key
+
+    async def encode_upload(self, image_bytes: bytes, tenant_id=None):
+        return self.table.get(image_bytes)
+
+
+# ============================================================================
+# MEASUREMENTS
+# ============================================================================
+
+def index_nbytes(index: FaceIndex) -> int:
+    arrays = [index._vectors, index._sq_norms, index._types, index._lists]
+    if index._centroids is not None:
+        arrays.append(index._centroids)
+    return sum(a.nbytes for a in arrays)
+
+
+async def enroll_all(index: FaceIndex, extractor: MockExtractor, images, threshold: Optional[float]) -> float:
+    """
+    Replays the in-memory part of /biometrics/enroll; returns enrollments per second.
+    The duplicate check (skipped when `threshold` is None) scans the whole gallery per
+    insert, so it makes large galleries quadratic to build.
+    """
+    start = time.perf_counter()
+    for i, image in enumerate(images):
+        encoding = await FaceService.encode_upload(image, "bench")
+        if threshold is not None:
+            index.duplicates(encoding, threshold, exclude=str(i))
+        index.upsert(str(i), "student", f"Student {i}", encoding)
+    return len(images) / (time.perf_counter() - start)
+
+
+def identify_all(index: FaceIndex, queries: np.ndarray, tolerance: float, exact: bool):
+    found, timings = [], []
+    for q in queries:
+        start = time.perf_counter()
+        match = index.search(q, tolerance=tolerance, exact=exact)
+        timings.append(time.perf_counter() - start)
+        found.append(int(match["user_id"]) if match else -1)
+    return np.array(found), np.array(timings) * 1000
+
+
+def error_rates(index: FaceIndex, genuine: np.ndarray, genuine_ids: np.ndarray, impostors: np.ndarray):
+    """FAR/FRR for each tolerance from one exact nearest-neighbour pass per probe."""
+    def nearest(probes):
+        best_ids, best_dist = [], []
+        for q in probes:
+            d = index.distances(q)
+            j = int(np.argmin(d))
+            best_ids.append(int(index._ids[j]))
+            best_dist.append(d[j])
+        return np.array(best_ids), np.array(best_dist)
+
+    g_ids, g_dist = nearest(genuine)
+    _, i_dist = nearest(impostors)
+    rows = []
+    for tol in TOLERANCES:
+        accepted_correct = (g_dist <= tol) & (g_ids == genuine_ids)
+        frr = 1.0 - accepted_correct.mean()
+        far = (i_dist <= tol).mean()
+        rows.append((tol, far, frr))
+    return rows
+
+
+# ============================================================================
+# RUN
+# ============================================================================
+
+async def bench_size(size: int, args, extractor: MockExtractor):
+    faces = SyntheticFaces(size + args.queries, seed=size)
+    enrolled = np.arange(size)
+    images = [extractor.image_for(e) for e in faces.capture(enrolled)]
+
+    n_queries = min(args.queries, size)
+    rng = np.random.default_rng(size + 1)
+    genuine_ids = rng.choice(size, size=n_queries, replace=False)
+    genuine = faces.capture(genuine_ids)
+    impostors = faces.capture(np.arange(size, size + args.queries))
+
+    print(f"\n=== {size} enrolled, {n_queries} genuine + {len(impostors)} impostor probes ===")
+    print(f"{'mode':<14}{'enroll/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'hit':>8}{'recall':>8}{'index MB':>10}{'peak MB':>9}")
+
+    modes = [("exact", {})] + [
+        (f"ivf probe={p}", dict(ivf_lists=args.lists, ivf_probe=p, ivf_min_size=0)) for p in args.probe
+    ]
+    exact_found = None
+    for label, options in modes:
+        index = FaceIndex(capacity=64, **options)
+        tracemalloc.start()
+        threshold = settings.FACE_DUPLICATE_THRESHOLD if args.duplicate_check else None
+        rate = await enroll_all(index, extractor, images, threshold)
+        if index.ivf_active:
+            index.train()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        found, ms = identify_all(index, genuine, args.tolerance, exact=not options)
+        if exact_found is None:
+            exact_found = found
+        print(f"{label:<14}{rate:>10.0f}{np.percentile(ms, 50):>10.3f}{np.percentile(ms, 99):>10.3f}"
+              f"{np.mean(found == genuine_ids):>8.3f}{np.mean(found == exact_found):>8.3f}"
+              f"{index_nbytes(index) / 2**20:>10.2f}{peak / 2**20:>9.2f}")
+
+        if label == "exact":
+            rates = error_rates(index, genuine, genuine_ids, impostors)
+
+    print(f"{'tolerance':<14}{'FAR':>10}{'FRR':>10}")
+    for tol, far, frr in rates:
+        print(f"{tol:<14}{far:>10.4f}{frr:>10.4f}")
+
+
+async def run(args):
+    extractor = MockExtractor()
+    # Offline: bypass the process pool / face_recognition entirely
+    FaceService.encode_upload = extractor.encode_upload
+    for size in args.sizes:
+        await bench_size(size, args, extractor)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--lists", type=int, default=0, help="IVF lists (0 = sqrt(size))")
+    parser.add_argument("--probe", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--duplicate-check", action="store_true",
+                        help="run the per-enroll duplicate scan (quadratic; keep sizes small)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
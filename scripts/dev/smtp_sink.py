@@ -0,0 +1,123 @@
+"""
+Local SMTP sink for development and load tests.
+
+Accepts any mail on localhost, answers like a real server (EHLO with
+PIPELINING, MAIL/RCPT/DATA, RSET, NOOP, QUIT) and counts messages and
+sessions instead of delivering them. Optionally writes each message to a
+directory, or answers a fraction of messages with a temporary failure to
+exercise the dispatcher's retries.
+
+    python scripts/dev/smtp_sink.py --port 1025 [--save-dir mail_out] [--fail-rate 0.05]
+
+Then run the API with SMTP_HOST=127.0.0.1 SMTP_PORT=1025 SMTP_USER= .
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from pathlib import Path
+
+stats = {"sessions": 0, "messages": 0, "rejected": 0}
+
+
+class SinkSession:
+    def __init__(self, reader, writer, args):
+        self.reader, self.writer, self.args = reader, writer, args
+        self.reset()
+
+    def reset(self):
+        self.sender, self.recipients = None, []
+
+    async def reply(self, line: str):
+        self.writer.write(f"{line}\r\n".encode())
+        await self.writer.drain()
+
+    async def read_data(self) -> bytes:
+        lines = []
+        while True:
+            line = await self.reader.readline()
+            if not line or line in (b".\r\n", b".\n"):
+                break
+            lines.append(line[1:] if line.startswith(b"..") else line)
+        return b"".join(lines)
+
+    async def run(self):
+        stats["sessions"] += 1
+        await self.reply("220 smtp-sink ready")
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            command = line.decode(errors="replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                await self.reply("250-smtp-sink")
+                await self.reply("250-PIPELINING")
+                await self.reply("250-8BITMIME")
+                await self.reply("250 SIZE 52428800")
+            elif verb == "HELO":
+                await self.reply("250 smtp-sink")
+            elif verb == "MAIL":
+                self.reset()
+                self.sender = command[10:]
+                await self.reply("250 OK")
+            elif verb == "RCPT":
+                self.recipients.append(command[8:])
+                await self.reply("250 OK")
+            elif verb == "DATA":
+                await self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = await self.read_data()
+                if random.random() < self.args.fail_rate:
+                    stats["rejected"] += 1
+                    await self.reply("451 Temporary failure, try again")
+                else:
+                    stats["messages"] += 1
+                    if self.args.save_dir:
+                        path = Path(self.args.save_dir) / f"{time.time_ns()}.eml"
+                        await asyncio.to_thread(path.write_bytes, data)
+                    await self.reply("250 OK queued")
+                self.reset()
+            elif verb == "RSET":
+                self.reset()
+                await self.reply("250 OK")
+            elif verb == "NOOP":
+                await self.reply("250 OK")
+            elif verb == "QUIT":
+                await self.reply("221 Bye")
+                break
+            else:
+                await self.reply("502 Command not implemented")
+        self.writer.close()
+
+
+async def report():
+    last = 0
+    while True:
+        await asyncio.sleep(5)
+        if stats["messages"] != last:
+            print(f"sessions={stats['sessions']} messages={stats['messages']} rejected={stats['rejected']}")
+            last = stats["messages"]
+
+
+async def main(args):
+    if args.save_dir:
+        Path(args.save_dir).mkdir(parents=True, exist_ok=True)
+    server = await asyncio.start_server(
+        lambda r, w: SinkSession(r, w, args).run(), args.host, args.port
+    )
+    print(f"SMTP sink listening on {args.host}:{args.port}")
+    async with server:
+        await asyncio.gather(server.serve_forever(), report())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--save-dir", default=None)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        print(f"\nsessions={stats['sessions']} messages={stats['messages']} rejected={stats['rejected']}")
@@ -0,0 +1,76 @@
+"""
+Fleet-wide duplicate-face report.
+
+Loads every tenant's enrolled faces and writes all pairs of different
+people whose encodings are closer than the threshold to a CSV file.
+Nothing is modified; review the report and re-enroll or remove as needed.
+
+    python scripts/face_dedupe_report.py --threshold 0.4 --output face_duplicates.csv
+"""
+
+import argparse
+import asyncio
+import csv
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.core.config import settings  # noqa: E402
+from app.core.database import TenantDatabaseFactory, close_master_db_pool, get_master_db_pool  # noqa: E402
+from app.services.face_index import load_face_index  # noqa: E402
+
+
+async def report(threshold: float, output: str, limit: int):
+    master = await get_master_db_pool()
+    async with master.acquire() as conn:
+        tenants = await conn.fetch("""
+            SELECT tenant_id, name, subdomain, supabase_project_url, supabase_service_key
+            FROM tenants
+            WHERE status NOT IN ('churned', 'suspended')
+            ORDER BY name
+        """)
+    print(f"Scanning {len(tenants)} tenants (threshold {threshold})")
+
+    total = 0
+    with open(output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([
+            "tenant_id", "tenant", "distance",
+            "first_id", "first_type", "first_name",
+            "second_id", "second_type", "second_name",
+        ])
+        for t in tenants:
+            try:
+                pool = await TenantDatabaseFactory.get_pool_for_row(t)
+                index = await load_face_index(pool)
+            except Exception as e:
+                print(f"  ⚠️  {t['name']}: skipped ({e})")
+                continue
+
+            pairs = index.duplicate_pairs(threshold, limit)
+            for p in pairs:
+                writer.writerow([
+                    t["tenant_id"], t["name"], round(p["distance"], 4),
+                    p["first"]["user_id"], p["first"]["user_type"], p["first"]["name"],
+                    p["second"]["user_id"], p["second"]["user_type"], p["second"]["name"],
+                ])
+            total += len(pairs)
+            print(f"  {t['name']}: {len(index)} faces, {len(pairs)} duplicate pairs")
+
+    await TenantDatabaseFactory.close_all_tenant_pools()
+    await close_master_db_pool()
+    print(f"\n✅ {total} duplicate pairs written to {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threshold", type=float, default=settings.FACE_DUPLICATE_THRESHOLD)
+    parser.add_argument("--output", default="face_duplicates.csv")
+    parser.add_argument("--limit", type=int, default=100_000, help="Closest pairs reported per school")
+    args = parser.parse_args()
+    asyncio.run(report(args.threshold, args.output, args.limit))
+
+
+if __name__ == "__main__":
+    main()
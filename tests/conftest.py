@@ -0,0 +1,38 @@
+import os
+import sys
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+# Run from the repo root without installing the package
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("VAULT_MASTER_KEY", "0" * 64)
+
+
+def make_conn():
+    """An asyncpg connection stand-in whose transaction() is an async context manager."""
+    conn = AsyncMock()
+    transaction = AsyncMock()
+    transaction.__aexit__.return_value = None
+    conn.transaction = MagicMock(return_value=transaction)
+    return conn
+
+
+def make_pool(conn):
+    """A pool whose acquire() is an async context manager yielding `conn`."""
+    acquire = AsyncMock()
+    acquire.__aenter__.return_value = conn
+    acquire.__aexit__.return_value = None
+    pool = MagicMock()
+    pool.acquire.return_value = acquire
+    return pool
+
+
+@pytest.fixture
+def conn():
+    return make_conn()
+
+
+@pytest.fixture
+def pool(conn):
+    return make_pool(conn)
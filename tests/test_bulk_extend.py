@@ -0,0 +1,42 @@
+import asyncio
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import pytest
+
+import app.services.subscription as subscription
+from app.services.subscription import SubscriptionStateMachine
+
+
+@pytest.fixture
+def invalidated(monkeypatch):
+    calls = []
+    monkeypatch.setattr(subscription, "invalidate_tenant_cache", calls.append)
+    return calls
+
+
+def test_bulk_extend_reports_each_tenant(pool, conn, invalidated):
+    extended, missing, suspended, churned = uuid4(), uuid4(), uuid4(), uuid4()
+    conn.fetch.return_value = [
+        {"tenant_id": extended, "status": "active", "new_expiry": datetime(2027, 1, 1, tzinfo=timezone.utc)},
+        {"tenant_id": missing, "status": None, "new_expiry": None},
+        {"tenant_id": suspended, "status": "suspended", "new_expiry": None},
+        {"tenant_id": churned, "status": "churned", "new_expiry": None},
+    ]
+    admin = uuid4()
+
+    results = asyncio.run(SubscriptionStateMachine(pool).bulk_extend_subscriptions(
+        [extended, missing, suspended, churned], admin, 30, "REF-1", 5000.0
+    ))
+
+    assert results["success"] == [str(extended)]
+    assert results["failed"] == [
+        {"tenant_id": str(missing), "error": f"Tenant {missing} not found"},
+        {"tenant_id": str(suspended), "error": "Cannot extend suspended tenant"},
+        {"tenant_id": str(churned), "error": "Cannot extend churned tenant"},
+    ]
+    # Only tenants that changed are dropped from the tenant cache
+    assert invalidated == [[str(extended)]]
+    # One statement, inside a transaction, driven by the id array
+    conn.transaction.assert_called_once()
+    assert conn.fetch.await_args.args[1:] == ([extended, missing, suspended, churned], 30, admin, "REF-1", 5000.0, None)
@@ -0,0 +1,70 @@
+from decimal import Decimal
+from uuid import uuid4
+
+from app.api.v1.exams import MarkEntry, parse_marks_sheet, validate_mark_entries
+
+MATHS = {"paper_id": uuid4(), "subject_name": "Mathematics", "subject_code": "MATH", "total_marks": 100}
+URDU = {"paper_id": uuid4(), "subject_name": "Urdu", "subject_code": None, "total_marks": 50}
+
+
+def parse(text: str):
+    return parse_marks_sheet(text.encode("utf-8"), [MATHS, URDU])
+
+
+def test_parses_by_subject_name_or_code():
+    records, errors = parse("admission_number,math,URDU\nA-1,88.5,40\nA-2,,35\n")
+    assert errors == []
+    assert records == [
+        ("A-1", MATHS["paper_id"], Decimal("88.5")),
+        ("A-1", URDU["paper_id"], Decimal("40")),
+        ("A-2", URDU["paper_id"], Decimal("35")),
+    ]
+
+
+def test_utf8_bom_header_is_accepted():
+    records, errors = parse_marks_sheet("﻿admission_number,Urdu\nA-1,10\n".encode("utf-8"), [URDU])
+    assert errors == [] and len(records) == 1
+
+
+def test_rejects_sheet_without_admission_number_column():
+    records, errors = parse("roll,Mathematics\n1,50\n")
+    assert records == []
+    assert errors == [{"row": 1, "error": "First column must be admission_number"}]
+
+
+def test_unknown_subject_column_is_reported_and_skipped():
+    records, errors = parse("admission_number,Physics,Urdu\nA-1,70,20\n")
+    assert [e["column"] for e in errors] == ["Physics"]
+    assert records == [("A-1", URDU["paper_id"], Decimal("20"))]
+
+
+def test_non_finite_and_invalid_marks_are_rejected():
+    _, errors = parse("admission_number,Mathematics,Urdu\nA-1,nan,inf\nA-2,-inf,abc\n")
+    assert len(errors) == 4
+    assert all(e["error"].startswith("Invalid marks") for e in errors)
+
+
+def test_marks_outside_paper_range_are_rejected():
+    records, errors = parse("admission_number,Mathematics,Urdu\nA-1,101,-1\nA-2,100,50\n")
+    assert [(e["row"], e["column"]) for e in errors] == [(2, "Mathematics"), (2, "Urdu")]
+    assert len(records) == 2
+
+
+def test_duplicate_admission_number_keeps_first_row():
+    records, errors = parse("admission_number,Urdu\nA-1,10\nA-1,20\n")
+    assert records == [("A-1", URDU["paper_id"], Decimal("10"))]
+    assert errors == [{"row": 3, "admission_number": "A-1", "error": "Duplicate admission number"}]
+
+
+def test_validate_mark_entries_collects_every_error():
+    student = uuid4()
+    entries = [
+        MarkEntry(student_id=student, marks_obtained=40),
+        MarkEntry(student_id=uuid4(), marks_obtained=75),
+        MarkEntry(student_id=student, marks_obtained=20),
+    ]
+    errors = validate_mark_entries(entries, max_marks=50)
+    assert [(e["row"], e["error"]) for e in errors] == [
+        (1, "Marks 75.0 exceed max 50"),
+        (2, "Duplicate entry for student"),
+    ]
@@ -0,0 +1,89 @@
+import asyncio
+from unittest.mock import call
+from uuid import uuid4
+
+import asyncpg
+
+from app.api.v1.results import build_exam_report_cards
+from app.services.exam_totals import EXAM_TOTALS_DDL, refresh_exam_totals
+
+
+def paper(subject, class_name="Grade 5", section=None, total=100, passing=40):
+    return {"paper_id": uuid4(), "subject_name": subject, "class_name": class_name,
+            "section": section, "total_marks": total, "passing_marks": passing}
+
+
+def student(name, class_name="Grade 5", section="A"):
+    return {"student_id": uuid4(), "full_name": name, "admission_number": name,
+            "class_name": class_name, "section": section}
+
+
+def result(s, p, marks):
+    return {"student_id": s["student_id"], "paper_id": p["paper_id"], "marks_obtained": marks, "remarks": None}
+
+
+def test_report_card_ranks_by_total_within_class_section():
+    maths, english = paper("Maths"), paper("English")
+    a, b, c = student("a"), student("b"), student("c")
+    other_section = student("d", section="B")
+    results = [
+        result(a, maths, 90), result(a, english, 60),   # 150
+        result(b, maths, 70), result(b, english, 80),   # 150, ties with a
+        result(c, maths, 40), result(c, english, 40),   # 80
+        result(other_section, maths, 10),
+    ]
+    cards = build_exam_report_cards("Mid Term", [maths, english], [a, b, c, other_section], results)
+    by_name = {card["full_name"]: card for card in cards}
+
+    assert by_name["a"]["total_obtained"] == 150 and by_name["a"]["grand_total"] == 200
+    assert (by_name["a"]["rank"], by_name["b"]["rank"], by_name["c"]["rank"]) == (1, 1, 3)
+    # Ranked only against their own section
+    assert by_name["d"]["rank"] == 1
+    assert by_name["c"]["overall_percentage"] == 40.0
+    assert by_name["c"]["overall_grade"] == "F"
+
+
+def test_section_papers_only_apply_to_that_section():
+    common, section_a_only = paper("Maths"), paper("Lab", section="A")
+    a, b = student("a"), student("b", section="B")
+    cards = build_exam_report_cards("Final", [common, section_a_only], [a, b],
+                                    [result(a, common, 50), result(b, common, 50)])
+    assert [s["subject_name"] for s in cards[0]["subjects"]] == ["Maths", "Lab"]
+    assert [s["subject_name"] for s in cards[1]["subjects"]] == ["Maths"]
+
+
+def test_students_without_marks_do_not_push_others_down():
+    maths = paper("Maths")
+    scored, absent = student("scored"), student("absent")
+    cards = build_exam_report_cards("Final", [maths], [scored, absent], [result(scored, maths, 5)])
+    assert cards[0]["rank"] == 1
+    # Absent students rank after everyone who sat the exam
+    assert cards[1]["rank"] == 2
+
+
+def test_refresh_replaces_rows_and_reranks_old_and_new_groups(conn):
+    exam_id, student_id = uuid4(), uuid4()
+    conn.fetch.return_value = [{"class_name": "Grade 4", "section": "A"}]
+
+    asyncio.run(refresh_exam_totals(conn, exam_id, [student_id, student_id]))
+
+    # Old rows removed first so a student who changed class leaves their old group
+    assert conn.fetch.await_args.args[1:] == (exam_id, [student_id])
+    upsert, rerank = conn.execute.await_args_list
+    assert upsert.args[1:] == (exam_id, [student_id])
+    assert rerank.args[1:] == (exam_id, [student_id], ["Grade 4"], ["A"])
+
+
+def test_refresh_creates_missing_table_and_retries(conn):
+    conn.fetch.side_effect = [asyncpg.UndefinedTableError("exam_student_totals"), []]
+
+    asyncio.run(refresh_exam_totals(conn, uuid4(), [uuid4()]))
+
+    assert conn.execute.await_args_list[0] == call(EXAM_TOTALS_DDL)
+    assert conn.fetch.await_count == 2
+
+
+def test_refresh_without_students_does_nothing(conn):
+    asyncio.run(refresh_exam_totals(conn, uuid4(), []))
+    conn.fetch.assert_not_awaited()
+    conn.execute.assert_not_awaited()
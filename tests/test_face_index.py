@@ -0,0 +1,89 @@
+import numpy as np
+
+from app.services.face_index import ENCODING_DIMENSIONS, FaceIndex
+
+
+def gallery(count: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, ENCODING_DIMENSIONS)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build(vectors: np.ndarray, **options) -> FaceIndex:
+    index = FaceIndex(capacity=8, **options)
+    for i, v in enumerate(vectors):
+        index.upsert(f"p{i}", "staff" if i % 5 == 0 else "student", f"Person {i}", v)
+    return index
+
+
+def near(vector: np.ndarray, scale: float = 0.01, seed: int = 1) -> np.ndarray:
+    return vector + np.random.default_rng(seed).normal(scale=scale, size=ENCODING_DIMENSIONS).astype(np.float32)
+
+
+def test_exact_search_finds_nearest_within_tolerance():
+    vectors = gallery(300)
+    index = build(vectors)
+    match = index.search(near(vectors[42]), tolerance=0.5)
+    assert match["user_id"] == "p42" and match["distance"] < 0.2
+    # Unit vectors in 128-d are ~1.4 apart: nothing within a tight tolerance
+    assert index.search(gallery(1, seed=9)[0], tolerance=0.5) is None
+
+
+def test_person_type_filter():
+    vectors = gallery(50)
+    index = build(vectors)
+    assert index.search(near(vectors[10]), person_types=["student"]) is None
+    assert index.search(near(vectors[10]), person_types=["staff"])["user_id"] == "p10"
+
+
+def test_ivf_probing_every_list_matches_exact():
+    vectors = gallery(400)
+    exact = build(vectors)
+    ivf = build(vectors, ivf_lists=8, ivf_probe=8, ivf_min_size=0)
+    assert ivf.ivf_active
+    for i in range(0, 400, 37):
+        query = near(vectors[i], seed=i)
+        assert ivf.search(query)["user_id"] == exact.search(query, exact=True)["user_id"] == f"p{i}"
+
+
+def test_ivf_candidates_are_a_subset():
+    index = build(gallery(400), ivf_lists=16, ivf_probe=2, ivf_min_size=0)
+    rows = index.candidates(gallery(1, seed=3)[0])
+    assert 0 < len(rows) < len(index)
+
+
+def test_upsert_replaces_and_remove_forgets():
+    vectors = gallery(20)
+    index = build(vectors)
+    index.upsert("p3", "student", "Renamed", vectors[7])
+    assert len(index) == 20
+    assert {m["user_id"] for m in index.duplicates(vectors[7], 0.01)} == {"p3", "p7"}
+    assert index.remove("p7") and "p7" not in index
+    assert index.search(vectors[7])["name"] == "Renamed"
+
+
+def test_search_many_assigns_each_person_once():
+    vectors = gallery(30)
+    index = build(vectors)
+    closer, farther = near(vectors[4], 0.005), near(vectors[4], 0.03, seed=2)
+    matches = index.search_many(np.stack([farther, closer, near(vectors[9])]))
+    assert matches[0] is None
+    assert matches[1]["user_id"] == "p4"
+    assert matches[2]["user_id"] == "p9"
+
+
+def test_duplicate_pairs_returns_closest_planted_pairs_in_order():
+    vectors = gallery(600)
+    # Plant look-alikes at increasing distances
+    for k, row in enumerate((100, 250, 400, 550)):
+        vectors[row] = near(vectors[row - 50], scale=0.005 * (k + 1), seed=k)
+    index = build(vectors)
+
+    pairs = index.duplicate_pairs(threshold=0.5, block=128)
+    assert [(p["first"]["user_id"], p["second"]["user_id"]) for p in pairs] == [
+        ("p50", "p100"), ("p200", "p250"), ("p350", "p400"), ("p500", "p550")
+    ]
+    assert pairs == sorted(pairs, key=lambda p: p["distance"])
+
+    assert index.duplicate_pairs(threshold=0.5, limit=2, block=128) == pairs[:2]
+    assert index.duplicate_pairs(threshold=0.01) == []
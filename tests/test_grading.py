@@ -0,0 +1,48 @@
+import numpy as np
+
+from app.services.grading import DEFAULT_BANDS, DEFAULT_SCALE, CompiledGradeScale, validate_bands
+
+
+def test_band_lower_bounds_are_inclusive():
+    assert DEFAULT_SCALE.grade(49.99) == "F"
+    assert DEFAULT_SCALE.grade(50) == "D"
+    assert DEFAULT_SCALE.grade(89.5) == "A"
+    assert DEFAULT_SCALE.grade(90) == "A+"
+    assert DEFAULT_SCALE.grade(100) == "A+"
+
+
+def test_scores_below_the_lowest_band_fall_into_it():
+    scale = CompiledGradeScale("Strict", [
+        {"label": "Pass", "min_score": 40, "max_score": 100, "gpa": 1},
+        {"label": "Fail", "min_score": 20, "max_score": 40, "gpa": 0},
+    ])
+    assert scale.grade(5) == "Fail"
+    assert scale.gpa(5) == 0.0
+    assert scale.grade(40) == "Pass"
+
+
+def test_vectorized_lookup_matches_scalar():
+    percentages = np.array([-1, 0, 49.9, 50, 65, 70, 79.99, 80, 95, 100, 120])
+    labels = [DEFAULT_SCALE.labels[i] for i in DEFAULT_SCALE.grade_indexes(percentages)]
+    assert labels == [DEFAULT_SCALE.grade(p) for p in percentages]
+
+
+def test_gpa_follows_band():
+    assert DEFAULT_SCALE.gpa(75) == 3.0
+    assert DEFAULT_SCALE.gpa(92) == 4.0
+
+
+def test_validate_bands():
+    assert validate_bands(DEFAULT_BANDS) is None
+    assert validate_bands([]) == "A grade scale needs at least one band"
+    assert "overlap" in validate_bands([
+        {"label": "B", "min_score": 0, "max_score": 60},
+        {"label": "A", "min_score": 50, "max_score": 100},
+    ])
+    assert "min_score must be below max_score" in validate_bands([
+        {"label": "A", "min_score": 70, "max_score": 70},
+    ])
+    assert "Duplicate band label" in validate_bands([
+        {"label": "A", "min_score": 0, "max_score": 50},
+        {"label": "A", "min_score": 50, "max_score": 100},
+    ])
@@ -0,0 +1,93 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+import pytest
+
+from app.services.jobs import HANDLERS, JobFailed, JobQueue
+
+
+def job(kind: str, attempts: int = 1, max_attempts: int = 3) -> dict:
+    return {"job_id": uuid4(), "tenant_id": uuid4(), "kind": kind, "payload": {},
+            "attempts": attempts, "max_attempts": max_attempts}
+
+
+@pytest.fixture
+def finish(monkeypatch):
+    recorded = AsyncMock()
+    monkeypatch.setattr(JobQueue, "_finish", recorded)
+    return recorded
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    """Register a job kind whose outcome the test sets via `handler.outcome`."""
+    class Handler:
+        outcome = None
+
+        async def __call__(self, ctx):
+            if isinstance(self.outcome, Exception):
+                raise self.outcome
+            return self.outcome
+
+    registered = Handler()
+    monkeypatch.setitem(HANDLERS, "test.kind", registered)
+    return registered
+
+
+def test_success_records_result(pool, finish, handler):
+    handler.outcome = {"sent": 3}
+    current = job("test.kind")
+    asyncio.run(JobQueue.run(pool, current))
+    finish.assert_awaited_once_with(pool, current, "succeeded", result={"sent": 3})
+
+
+def test_transient_failure_is_retried_with_backoff(pool, finish, handler):
+    handler.outcome = RuntimeError("smtp down")
+    current = job("test.kind", attempts=2)
+    asyncio.run(JobQueue.run(pool, current))
+    args, kwargs = finish.await_args
+    assert args[2] == "queued" and kwargs["error"] == "smtp down"
+    # Second attempt: 60s base, +-20% jitter
+    assert 48 <= kwargs["retry_in"] <= 72
+
+
+def test_failure_on_last_attempt_fails_the_job(pool, finish, handler):
+    handler.outcome = RuntimeError("still down")
+    asyncio.run(JobQueue.run(pool, job("test.kind", attempts=3, max_attempts=3)))
+    assert finish.await_args.args[2] == "failed"
+
+
+def test_job_failed_is_not_retried(pool, finish, handler):
+    handler.outcome = JobFailed("bad payload")
+    asyncio.run(JobQueue.run(pool, job("test.kind", attempts=1)))
+    args, kwargs = finish.await_args
+    assert args[2] == "failed" and kwargs == {"error": "bad payload"}
+
+
+def test_claim_passes_worker_and_kinds_and_decodes_payload(pool, conn, handler):
+    conn.fetchrow.return_value = {"job_id": uuid4(), "payload": json.dumps({"class_id": "x"}), "result": None}
+    claimed = asyncio.run(JobQueue.claim(pool))
+    assert claimed["payload"] == {"class_id": "x"}
+    _, worker_id, kinds, _ = conn.fetchrow.await_args.args
+    assert worker_id == JobQueue.worker_id and "test.kind" in kinds
+
+
+def test_claim_returns_none_when_nothing_is_due(pool, conn):
+    conn.fetchrow.return_value = None
+    assert asyncio.run(JobQueue.claim(pool)) is None
+
+
+def test_stop_fails_interrupted_jobs_out_of_attempts(pool, conn, monkeypatch):
+    monkeypatch.setattr(JobQueue, "_pool", pool, raising=False)
+    monkeypatch.setattr(JobQueue, "_listener", None, raising=False)
+
+    async def main():
+        monkeypatch.setattr(JobQueue, "_tasks", [asyncio.create_task(asyncio.sleep(3600))])
+        await JobQueue.stop()
+
+    asyncio.run(main())
+    sql, worker_id = conn.execute.await_args.args
+    assert "WHEN attempts >= max_attempts THEN 'failed'" in sql
+    assert worker_id == JobQueue.worker_id
@@ -0,0 +1,118 @@
+import asyncio
+import importlib.util
+import os
+import socket
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.services.mail_dispatcher import MailDispatcher, TenantRateLimiter
+
+SINK_PATH = os.path.join(os.path.dirname(__file__), "..", "scripts", "dev", "smtp_sink.py")
+_spec = importlib.util.spec_from_file_location("smtp_sink", SINK_PATH)
+smtp_sink = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(smtp_sink)
+
+
+@pytest.fixture
+def smtp_settings(monkeypatch):
+    for name, value in {
+        # SMTP_PORT is recorded so the sink's port is undone after the test
+        "SMTP_HOST": "127.0.0.1", "SMTP_PORT": settings.SMTP_PORT, "SMTP_USER": "",
+        "EMAILS_FROM_EMAIL": "office@school.test", "SMTP_POOL_SIZE": 2, "SMTP_BATCH_SIZE": 10, "SMTP_TENANT_RATE": 0, "SMTP_TIMEOUT": 5,
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+    monkeypatch.setattr(MailDispatcher, "_limiter", TenantRateLimiter())
+    for key in smtp_sink.stats:
+        smtp_sink.stats[key] = 0
+    return settings
+
+
+async def start_sink(fail_rate: float = 0.0):
+    args = SimpleNamespace(fail_rate=fail_rate, save_dir=None)
+    server = await asyncio.start_server(lambda r, w: smtp_sink.SinkSession(r, w, args).run(), "127.0.0.1", 0)
+    settings.SMTP_PORT = server.sockets[0].getsockname()[1]
+    return server
+
+
+def unused_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_batch_goes_out_over_pooled_sessions(smtp_settings):
+    async def main():
+        server = await start_sink()
+        try:
+            results = await asyncio.gather(*(
+                MailDispatcher.enqueue(f"parent{i}@home.test", "Fee reminder", "<p>Due</p>", "tenant-1")
+                for i in range(25)
+            ))
+        finally:
+            await MailDispatcher.stop(drain_timeout=1)
+            server.close()
+        return results
+
+    assert asyncio.run(main()) == [True] * 25
+    assert smtp_sink.stats["messages"] == 25
+    # One session per worker, not one per message
+    assert smtp_sink.stats["sessions"] <= settings.SMTP_POOL_SIZE
+
+
+def test_rejected_mail_fails_once_retries_run_out(smtp_settings, monkeypatch):
+    monkeypatch.setattr(settings, "SMTP_MAX_RETRIES", 1)
+
+    async def main():
+        server = await start_sink(fail_rate=1.0)
+        try:
+            return await MailDispatcher.send("parent@home.test", "Result", "<p>Hi</p>")
+        finally:
+            await MailDispatcher.stop(drain_timeout=1)
+            server.close()
+
+    assert asyncio.run(main()) is False
+    assert smtp_sink.stats["rejected"] == 1
+
+
+def test_unreachable_server_backs_off_the_whole_batch(smtp_settings, monkeypatch):
+    monkeypatch.setattr(settings, "SMTP_POOL_SIZE", 1)
+    monkeypatch.setattr(settings, "SMTP_PORT", unused_port())
+    connects = []
+    connect = MailDispatcher._connect.__func__
+
+    async def counting_connect(cls, timeout=None):
+        connects.append(1)
+        return await connect(cls, timeout)
+
+    monkeypatch.setattr(MailDispatcher, "_connect", classmethod(counting_connect))
+
+    async def main():
+        results = [MailDispatcher.enqueue(f"p{i}@home.test", "Notice", "<p>x</p>") for i in range(5)]
+        await asyncio.sleep(0.2)
+        waiting = len(MailDispatcher._deferred_mail)
+        # Messages parked on retry timers are resolved (unsent) at shutdown
+        await MailDispatcher.stop(drain_timeout=0.1)
+        return waiting, [r.result() for r in results]
+
+    waiting, results = asyncio.run(main())
+    assert len(connects) == 1
+    assert waiting == 5
+    assert results == [False] * 5
+    assert MailDispatcher._deferred_mail == {}
+
+
+def test_tenant_rate_limit_reserves_consecutive_slots(monkeypatch):
+    monkeypatch.setattr(settings, "SMTP_TENANT_RATE", 60)
+
+    async def main():
+        limiter = TenantRateLimiter()
+        return [limiter.delay("tenant-1") for _ in range(62)], limiter.delay("tenant-2"), limiter.delay(None)
+
+    delays, other_tenant, no_tenant = asyncio.run(main())
+    # A minute's burst goes at once, then one slot per second
+    assert delays[:60] == [0.0] * 60
+    assert delays[60] == pytest.approx(1.0, abs=0.05)
+    assert delays[61] == pytest.approx(2.0, abs=0.05)
+    assert other_tenant == 0.0 and no_tenant == 0.0
@@ -0,0 +1,80 @@
+import asyncio
+import os
+
+import pytest
+
+from app.services.media_cache import MediaCache, content_key
+
+
+def test_concurrent_misses_share_one_build(tmp_path):
+    cache = MediaCache(str(tmp_path), max_bytes=1 << 20)
+    calls = []
+
+    async def produce():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return b"png-bytes"
+
+    async def main():
+        key = content_key("qr", "student-1", 256)
+        paths = await asyncio.gather(*(cache.get_or_create(key, ".png", produce) for _ in range(5)))
+        # Every waiter gets the path only after the file is on disk
+        assert len(set(paths)) == 1 and paths[0].read_bytes() == b"png-bytes"
+        # A hit does not produce again
+        assert await cache.get_or_create(key, ".png", produce) == paths[0]
+
+    asyncio.run(main())
+    assert len(calls) == 1
+
+
+def test_cancelled_waiter_does_not_cancel_the_build(tmp_path):
+    cache = MediaCache(str(tmp_path), max_bytes=1 << 20)
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def produce():
+            await gate.wait()
+            return b"data"
+
+        first = asyncio.create_task(cache.get_or_create("ab" * 32, ".png", produce))
+        second = asyncio.create_task(cache.get_or_create("ab" * 32, ".png", produce))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        gate.set()
+        path = await second
+        assert path.read_bytes() == b"data"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(main())
+
+
+def test_empty_result_is_not_cached(tmp_path):
+    cache = MediaCache(str(tmp_path), max_bytes=1 << 20)
+    results = iter([None, b"later"])
+
+    async def produce():
+        return next(results)
+
+    async def main():
+        assert await cache.get_or_create("cd" * 32, ".jpg", produce) is None
+        path = await cache.get_or_create("cd" * 32, ".jpg", produce)
+        assert path.read_bytes() == b"later"
+
+    asyncio.run(main())
+
+
+def test_sweep_evicts_least_recently_used_past_grace(tmp_path):
+    cache = MediaCache(str(tmp_path), max_bytes=250)
+    cache.EVICT_GRACE = 0
+    paths = []
+    for i, key in enumerate(("aa" * 32, "bb" * 32, "cc" * 32)):
+        path = cache.path_for(key, ".png")
+        cache._write(path, b"x" * 100)
+        # Oldest first
+        os.utime(path, (1000 + i, 1000 + i))
+        paths.append(path)
+
+    assert cache._sweep() == 1
+    assert [p.exists() for p in paths] == [False, True, True]
@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.v1.admin import _decode_cursor, _encode_cursor, list_tenants
+from app.services.tenant_stats import TenantStatusCounters
+
+COUNTS = {"active": 7, "trial": 2, "locked": 1, "grace": 0}
+
+
+def tenant(created_at: datetime) -> dict:
+    return {"tenant_id": uuid4(), "name": "School", "subdomain": "s", "contact_email": "a@b.c",
+            "status": "active", "subscription_expiry": created_at, "created_at": created_at,
+            "days_remaining": 10}
+
+
+def list_page(pool, page=1, per_page=2, search=None, cursor=None):
+    return asyncio.run(list_tenants(page=page, per_page=per_page, status=None, search=search,
+                                    sort_by="created_at", cursor=cursor, pool=pool))
+
+
+@pytest.fixture(autouse=True)
+def counts(monkeypatch):
+    monkeypatch.setattr(TenantStatusCounters, "get", AsyncMock(return_value=COUNTS))
+
+
+def test_cursor_round_trip():
+    when, tenant_id = datetime(2026, 5, 1, 8, 30, tzinfo=timezone.utc), uuid4()
+    assert _decode_cursor(_encode_cursor(when, tenant_id), "created_at") == (when, tenant_id)
+    assert _decode_cursor(_encode_cursor("Beacon School", tenant_id), "name") == ("Beacon School", tenant_id)
+
+
+def test_malformed_cursor_is_a_400():
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor("not-a-cursor", "created_at")
+    assert error.value.status_code == 400
+
+
+def test_first_page_reports_pages_and_a_cursor(pool, conn):
+    rows = [tenant(datetime(2026, 1, d, tzinfo=timezone.utc)) for d in (3, 2, 1)]
+    conn.fetch.return_value = rows
+
+    pagination = list_page(pool)["pagination"]
+
+    assert pagination["page"] == 1 and pagination["total"] == 10 and pagination["pages"] == 5
+    assert _decode_cursor(pagination["next_cursor"], "created_at") == (rows[1]["created_at"], rows[1]["tenant_id"])
+
+
+def test_cursor_page_uses_keyset_and_omits_page_numbers(pool, conn):
+    last = tenant(datetime(2026, 1, 2, tzinfo=timezone.utc))
+    conn.fetch.return_value = [tenant(datetime(2026, 1, 1, tzinfo=timezone.utc))]
+
+    pagination = list_page(pool, search="beacon", cursor=_encode_cursor(last["created_at"], last["tenant_id"]))["pagination"]
+
+    sql, *params = conn.fetch.await_args.args
+    assert "(created_at, tenant_id) < ($2, $3)" in sql
+    assert params == ["%beacon%", last["created_at"], last["tenant_id"], 3, 0]
+    # A search is not recounted on follow-up pages, and cursor pages have no page number
+    assert pagination == {"per_page": 2, "next_cursor": None}
+    conn.fetchval.assert_not_awaited()
+
+
+def test_cursor_with_page_is_rejected(pool):
+    cursor = _encode_cursor(datetime(2026, 1, 1, tzinfo=timezone.utc), uuid4())
+    with pytest.raises(HTTPException) as error:
+        list_page(pool, page=2, cursor=cursor)
+    assert error.value.status_code == 400